@@ -0,0 +1,197 @@
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def keyset_filter(ordering, values):
+    """
+    Rows after ``values`` in ``ordering``, e.g. for ``('-timestamp', '-id')``
+    ``timestamp <= v0 AND (timestamp < v0 OR (timestamp = v0 AND id < v1))``.
+
+    The leading range on the first field lets the database walk the index
+    straight to the boundary, so a deep page costs the same as the first.
+    """
+    condition = Q()
+    for index, field in enumerate(ordering):
+        name, lookup = field.lstrip('-'), 'lt' if field.startswith('-') else 'gt'
+        clause = Q(**{f'{name}__{lookup}': values[index]})
+        for previous, value in zip(ordering[:index], values[:index]):
+            clause &= Q(**{previous.lstrip('-'): value})
+        condition |= clause
+    first = ordering[0]
+    return Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]}) & condition
+
+
+def estimate_count(queryset):
+    """The planner's row estimate for ``queryset`` on PostgreSQL, None elsewhere"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward cursor pagination on a unique key, ``(-created_at, -id)`` by default.
+
+    The cursor carries the key of the last row listed and the next page is
+    read with ``keyset_filter`` instead of an OFFSET, so deep pages of
+    telemetry cost the same as the first. ``?ordering=`` on one of the view's
+    ``ordering_fields`` keys the pages on that field and ``id`` instead.
+
+    Counting is opt-in: ``?count=exact`` adds the total, ``?count=estimate``
+    the planner's estimate on PostgreSQL (the exact count elsewhere).
+
+    Besides querysets it pages any source with ``model``, ``ordering``,
+    ``after(values)``, ``head(n)``, ``cursor_values(item)`` and ``count()``,
+    such as apps.tracking.archive.LocationHistory.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.source = queryset
+        self.count = self.get_count(queryset, request.query_params.get(self.count_query_param))
+
+        if isinstance(queryset, QuerySet):
+            self.ordering = self.get_ordering(request, view)
+            cursor = self.decode_cursor(request, queryset.model)
+            queryset = queryset.order_by(*self.ordering)
+            if cursor is not None:
+                queryset = queryset.filter(keyset_filter(self.ordering, cursor))
+            rows = list(queryset[:self.page_size + 1])
+        else:
+            self.ordering = queryset.ordering
+            cursor = self.decode_cursor(request, queryset.model)
+            if cursor is not None:
+                queryset = queryset.after(cursor)
+            rows = queryset.head(self.page_size + 1)
+
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_ordering(self, request, view):
+        param = request.query_params.get(api_settings.ORDERING_PARAM, '').split(',')[0].strip()
+        if param and param.lstrip('-') in getattr(view, 'ordering_fields', ()):
+            return param, '-id' if param.startswith('-') else 'id'
+        return self.ordering
+
+    def get_count(self, source, mode):
+        if mode not in ('exact', 'estimate'):
+            return None
+        if mode == 'estimate':
+            if isinstance(source, QuerySet):
+                estimate = estimate_count(source)
+            else:
+                estimate = source.estimate_count(estimate_count)
+            if estimate is not None:
+                return estimate
+        return source.count()
+
+    def cursor_values(self, item):
+        if hasattr(self.source, 'cursor_values'):
+            return self.source.cursor_values(item)
+        return [getattr(item, field.lstrip('-')) for field in self.ordering]
+
+    def encode_cursor(self, values):
+        payload = json.dumps({'o': list(self.ordering), 'v': values}, default=str, separators=(',', ':'))
+        return urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            if payload['o'] != list(self.ordering) or len(payload['v']) != len(self.ordering):
+                raise ValueError('Cursor is for another ordering')
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, payload['v'])
+            ]
+        except (binascii.Error, DjangoValidationError, KeyError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        cursor = self.encode_cursor(self.cursor_values(self.page[-1]))
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        body = {'next': self.get_next_link(), 'results': data}
+        if self.count is not None:
+            body = {'count': self.count, **body}
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Include the total: "exact" or "estimate".',
+                'schema': {'type': 'string', 'enum': ['exact', 'estimate']},
+            },
+        ]
+
+
+class LocationPagination(KeysetPagination):
+    """Keyset pages of location history, newest fix first"""
+    ordering = ('-timestamp', '-id')
@@ -0,0 +1,27 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from apps.tracking.formats import POLYLINE_MEDIA_TYPE, TRACK_MEDIA_TYPE
+
+
+class PolylineRenderer(JSONRenderer):
+    """Track as a Google encoded polyline with second deltas (``?format=polyline``)"""
+    media_type = POLYLINE_MEDIA_TYPE
+    format = 'polyline'
+
+
+class PackedTrackRenderer(BaseRenderer):
+    """
+    Track as a packed little-endian block (``?format=track``).
+
+    Views hand over the encoded bytes; anything else, such as an error
+    body, is rendered as JSON.
+    """
+    media_type = TRACK_MEDIA_TYPE
+    format = 'track'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        return JSONRenderer().render(data, renderer_context=renderer_context)
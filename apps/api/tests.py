@@ -3,7 +3,13 @@ from django.test import TestCase
 from django.contrib.auth.models import User
 from django.utils import timezone
 from decimal import Decimal
+from rest_framework.test import APIClient
 from apps.api.models import APIKey, APILog, DeviceToken, Webhook
+from apps.gps_devices.models import DeviceType, Protocol, Device, RawGPSData
+from apps.products.models import Category, Product
+from apps.tracking.archive import LocationArchiver, decode
+from apps.tracking.formats import POLYLINE_MEDIA_TYPE, TRACK_MEDIA_TYPE, decode_polyline
+from apps.tracking.models import Alert, LocationData
 
 
 class APIKeyModelTest(TestCase):
@@ -200,3 +206,167 @@ class WebhookModelTest(TestCase):
                 secret='secret123'
             )
             self.assertEqual(webhook.webhook_type, w_type)
+
+
+class ProtocolHandlerViewSetTest(TestCase):
+    """Test cases for the protocol handler endpoints"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        category = Category.objects.create(name='GPS Trackers', slug='gps-trackers')
+        product = Product.objects.create(
+            name='GPS Tracker Pro', slug='gps-tracker-pro', category=category,
+            price=Decimal('1000000.00'), stock_quantity=50
+        )
+        device_type = DeviceType.objects.create(name='Vehicle Tracker', slug='vehicle-tracker', battery_life_hours=48)
+        protocol = Protocol.objects.create(name='Vendor API', protocol_type='http')
+        self.device = Device.objects.create(
+            user=self.user, product=product, device_type=device_type, protocol=protocol,
+            device_id='http-1', serial_number='SN1', name='HTTP device',
+            config_settings={'url': 'http://192.0.2.1/unreachable'},
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_handle_device_data_returns_latest_without_polling(self):
+        """Test the endpoint serves the last polled payload instead of contacting the device"""
+        RawGPSData.objects.create(device=self.device, raw_data='old', received_at=timezone.now() - timezone.timedelta(minutes=1))
+        RawGPSData.objects.create(device=self.device, raw_data='new')
+        response = self.client.post('/api/protocol-handlers/handle_device_data/', {'device_id': self.device.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data'], 'new')
+
+    def test_handle_device_data_other_users_device(self):
+        """Test devices of other users are not found"""
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(other)
+        response = self.client.post('/api/protocol-handlers/handle_device_data/', {'device_id': self.device.pk})
+        self.assertEqual(response.status_code, 404)
+
+
+class LocationDataViewSetTest(TestCase):
+    """Test cases for the location history API"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        category = Category.objects.create(name='GPS Trackers', slug='gps-trackers')
+        product = Product.objects.create(
+            name='GPS Tracker Pro', slug='gps-tracker-pro', category=category,
+            price=Decimal('1000000.00'), stock_quantity=50
+        )
+        device_type = DeviceType.objects.create(name='Vehicle Tracker', slug='vehicle-tracker', battery_life_hours=48)
+        protocol = Protocol.objects.create(name='TK103', protocol_type='tcp')
+        self.device = Device.objects.create(
+            user=self.user, product=product, device_type=device_type, protocol=protocol,
+            imei='123456789012345', serial_number='SN1', name='Car',
+        )
+        now = timezone.now()
+        for days in (1, 45):
+            LocationData.objects.create(
+                device=self.device, latitude=Decimal('35.7'), longitude=Decimal('51.4'),
+                timestamp=now - timezone.timedelta(days=days),
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_is_bounded_in_time(self):
+        """Test listings default to recent history and accept since/until"""
+        response = self.client.get('/api/location-data/', {'count': 'exact'})
+        self.assertEqual(response.data['count'], 1)
+
+        since = (timezone.now() - timezone.timedelta(days=60)).isoformat()
+        response = self.client.get('/api/location-data/', {'since': since, 'count': 'exact'})
+        self.assertEqual(response.data['count'], 2)
+
+        until = (timezone.now() - timezone.timedelta(days=10)).isoformat()
+        response = self.client.get('/api/location-data/', {'since': since, 'until': until, 'count': 'exact'})
+        self.assertEqual(response.data['count'], 1)
+
+    def test_invalid_bounds_are_rejected(self):
+        """Test malformed timestamps return 400"""
+        response = self.client.get('/api/location-data/', {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_compact_formats(self):
+        """Test the listing can be negotiated as a polyline or a packed block"""
+        since = (timezone.now() - timezone.timedelta(days=60)).isoformat()
+        response = self.client.get('/api/location-data/', {'since': since, 'format': 'polyline', 'count': 'exact'})
+        self.assertEqual(response['Content-Type'], POLYLINE_MEDIA_TYPE)
+        data = response.json()
+        self.assertEqual((data['count'], data['points']), (2, 2))
+        self.assertEqual(decode_polyline(data['polyline']), [(35.7, 51.4), (35.7, 51.4)])
+
+        response = self.client.get(
+            '/api/location-data/', {'since': since, 'count': 'exact'}, HTTP_ACCEPT=TRACK_MEDIA_TYPE
+        )
+        self.assertEqual(response['Content-Type'], TRACK_MEDIA_TYPE)
+        self.assertEqual(response['X-Total-Count'], '2')
+        self.assertEqual(decode(response.content)['latitude'], [Decimal('35.700000')] * 2)
+
+    def test_list_reads_archived_days(self):
+        """Test archived fixes are listed with live ones, newest first"""
+        LocationArchiver(after_days=30).run()
+        self.assertEqual(LocationData.objects.count(), 1)
+        since = (timezone.now() - timezone.timedelta(days=60)).isoformat()
+        response = self.client.get('/api/location-data/', {'since': since, 'count': 'estimate'})
+        self.assertEqual(response.data['count'], 2)
+        live, archived = response.data['results']
+        self.assertIsNotNone(live['id'])
+        self.assertIsNone(archived['id'])
+        self.assertEqual(archived['latitude'], '35.700000')
+        self.assertEqual(archived['device']['id'], self.device.id)
+        self.assertLess(archived['timestamp'], live['timestamp'])
+
+    def walk(self, url, params):
+        """Follow next links from the first page, returning every listed item"""
+        response = self.client.get(url, params)
+        items = list(response.data['results'])
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            self.assertEqual(response.status_code, 200)
+            items.extend(response.data['results'])
+        return items
+
+    def test_list_pages_by_cursor(self):
+        """Test keyset pages cover live and archived history once each, newest first"""
+        now = timezone.now()
+        instant = now - timezone.timedelta(days=40)
+        for days in (40, 39, 38):
+            LocationData.objects.create(
+                device=self.device, latitude=Decimal('35.7'), longitude=Decimal('51.4'),
+                timestamp=now - timezone.timedelta(days=days) if days != 40 else instant,
+            )
+        LocationArchiver(after_days=30).run()
+        for _ in range(2):
+            LocationData.objects.create(
+                device=self.device, latitude=Decimal('35.7'), longitude=Decimal('51.4'), timestamp=instant
+            )
+        since = (now - timezone.timedelta(days=60)).isoformat()
+
+        response = self.client.get('/api/location-data/', {'since': since, 'page_size': 2})
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 2)
+        items = self.walk('/api/location-data/', {'since': since, 'page_size': 2})
+        self.assertEqual(len(items), 7)
+        timestamps = [item['timestamp'] for item in items]
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+        self.assertEqual([item['id'] is None for item in items[3:6]], [False, False, True])
+
+        items = self.walk('/api/location-data/', {'since': since, 'page_size': 2, 'ordering': 'timestamp'})
+        self.assertEqual(len(items), 3)
+        self.assertEqual([item['timestamp'] for item in items], sorted(item['timestamp'] for item in items))
+
+    def test_invalid_cursor_is_rejected(self):
+        """Test a tampered cursor returns 404"""
+        response = self.client.get('/api/location-data/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_alerts_page_by_cursor(self):
+        """Test alerts page on (created_at, id) with an optional count"""
+        for index in range(5):
+            Alert.objects.create(device=self.device, alert_type='low_battery', message=f'Battery {index}')
+        response = self.client.get('/api/alerts/', {'page_size': 2, 'count': 'exact'})
+        self.assertEqual(response.data['count'], 5)
+        items = self.walk('/api/alerts/', {'page_size': 2})
+        self.assertEqual([item['message'] for item in items], [f'Battery {index}' for index in range(4, -1, -1)])
+
@@ -1,7 +1,9 @@
 from rest_framework import viewsets, status, permissions, generics
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
@@ -23,7 +25,13 @@ from apps.cart.models import Cart, CartItem
 from apps.orders.models import Order, OrderItem, ShippingMethod
 from apps.payments.models import Payment, CardToCardTransfer, PaymentGatewayConfig
 from apps.gps_devices.models import DeviceType, Protocol, Device
+from apps.gps_devices.parsers.registry import ParseError
+from apps.api.pagination import KeysetPagination, LocationPagination
+from apps.api.renderers import PackedTrackRenderer, PolylineRenderer
+from apps.tracking.archive import LocationHistory
+from apps.tracking.formats import pack_points, polyline_payload
 from apps.tracking.models import LocationData, Geofence, Alert
+from apps.tracking.partitions import history_range
 from apps.subscriptions.models import SubscriptionPlan, Subscription, PaymentRecord
 
 
@@ -266,6 +274,8 @@ class LocationDataViewSet(viewsets.ModelViewSet):
     """ViewSet for LocationData model"""
     serializer_class = LocationDataSerializer
     permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, PolylineRenderer, PackedTrackRenderer]
+    pagination_class = LocationPagination
     queryset = LocationData.objects.all()
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['device', 'timestamp']
@@ -273,7 +283,61 @@ class LocationDataViewSet(viewsets.ModelViewSet):
     ordering_fields = ['timestamp', 'received_at']
 
     def get_queryset(self):
-        return LocationData.objects.filter(device__user=self.request.user)
+        queryset = LocationData.objects.filter(device__user=self.request.user)
+        if self.action == 'list':
+            # Keep listings within a time range so partitioned storage can prune old months
+            try:
+                since, until = history_range(
+                    self.request.query_params.get('since'), self.request.query_params.get('until')
+                )
+            except ParseError as e:
+                raise ValidationError({'detail': str(e)})
+            queryset = queryset.filter(timestamp__gte=since)
+            if until is not None:
+                queryset = queryset.filter(timestamp__lte=until)
+            self.history_range = since, until
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """Newest-first history, including days moved to the archive when no other filter or ordering is asked for"""
+        history = self.filter_queryset(self.get_queryset())
+        params = request.query_params
+        if not params.get('search') and not params.get('timestamp') and params.get('ordering') in (None, '-timestamp'):
+            devices = Device.objects.filter(user=request.user)
+            if params.get('device'):
+                devices = devices.filter(pk=params['device'])
+            devices = devices.in_bulk()
+            history = LocationHistory(history, list(devices), *self.history_range)
+        else:
+            devices = {}
+
+        page = self.paginate_queryset(history)
+        points = page if page is not None else list(history)
+        if request.accepted_renderer.format in ('polyline', 'track'):
+            return self.compact_list(points, paged=page is not None)
+        for point in points:
+            if point.pk is None:
+                point.device = devices[point.device_id]
+        serializer = self.get_serializer(points, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    def compact_list(self, points, paged):
+        """A page as an encoded polyline or packed block; paging links go in the body or the Link header"""
+        links = {}
+        if paged:
+            links = {'next': self.paginator.get_next_link()}
+            if self.paginator.count is not None:
+                links['count'] = self.paginator.count
+        if self.request.accepted_renderer.format == 'polyline':
+            return Response({**links, **polyline_payload(points)})
+        headers = {'X-Point-Count': str(len(points))}
+        if 'count' in links:
+            headers['X-Total-Count'] = str(links['count'])
+        if links.get('next'):
+            headers['Link'] = f'<{links["next"]}>; rel="next"'
+        return Response(pack_points(points), headers=headers)
 
 
 class GeofenceViewSet(viewsets.ModelViewSet):
@@ -297,6 +361,7 @@ class AlertViewSet(viewsets.ModelViewSet):
     """ViewSet for Alert model"""
     serializer_class = AlertSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     queryset = Alert.objects.all()
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['alert_type', 'severity', 'is_read', 'is_resolved']
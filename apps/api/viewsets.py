@@ -1,16 +1,16 @@
+from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, status, permissions
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from apps.gps_devices.handlers.factory import ProtocolFactory
-from apps.gps_devices.communication.service import CommunicationService
-from apps.gps_devices.models import Device
+from apps.gps_devices.models import Device, RawGPSData
 
 class ProtocolHandlerViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     @action(detail=False, methods=['get'])
     def available_protocols(self, request):
-        return Response({"protocols": ['tcp', 'mqtt', 'http']})
+        return Response({"protocols": ['tcp', 'mqtt', 'http', 'gt06', 'teltonika']})
 
     @action(detail=False, methods=['post'])
     def test_handler(self, request):
@@ -26,8 +26,13 @@ class ProtocolHandlerViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['post'])
     def handle_device_data(self, request):
+        # Devices are polled by the poll_http_devices daemon; never do device I/O in a web worker
         device_id = request.data.get('device_id')
-        device = Device.objects.get(id=device_id, user=request.user)
-        service = CommunicationService()
-        data = service.handle_data(device)
-        return Response({"data": data})
\ No newline at end of file
+        device = get_object_or_404(Device, id=device_id, user=request.user)
+        latest = RawGPSData.objects.filter(device=device).order_by('-received_at').values(
+            'raw_data', 'received_at'
+        ).first()
+        return Response({
+            "data": latest['raw_data'] if latest else None,
+            "received_at": latest['received_at'] if latest else None,
+        })
\ No newline at end of file
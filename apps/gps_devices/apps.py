@@ -5,3 +5,6 @@ class GpsDevicesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.gps_devices'
     verbose_name = 'دستگاه‌های GPS'
+
+    def ready(self):
+        from . import signals  # noqa: F401
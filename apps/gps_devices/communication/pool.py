@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PooledHandler:
+    __slots__ = ('key', 'handler', 'devices', 'connected', 'last_used')
+
+    def __init__(self, key, handler):
+        self.key = key
+        self.handler = handler
+        self.devices = set()
+        self.connected = False
+        self.last_used = time.monotonic()
+
+
+class HandlerPool:
+    """
+    Bounded LRU pool of protocol handlers keyed by endpoint.
+
+    Devices that talk to the same endpoint (same protocol, host/port, topic or
+    URL) share one handler and therefore one socket; the handler is bound to
+    whichever device is using it. Once ``max_size`` endpoints are pooled the
+    least recently used one is disconnected and dropped, and endpoints unused
+    for ``idle_timeout`` seconds are closed on the next access.
+    """
+
+    def __init__(self, max_size=None, idle_timeout=None):
+        self.max_size = max_size or getattr(settings, 'GPS_HANDLER_POOL_SIZE', 1000)
+        self.idle_timeout = idle_timeout if idle_timeout is not None else getattr(
+            settings, 'GPS_HANDLER_IDLE_TIMEOUT', 300.0
+        )
+        self._lock = threading.RLock()
+        self.entries = OrderedDict()
+        self.device_keys = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, device_id):
+        return device_id in self.device_keys
+
+    def acquire(self, device, key, factory):
+        """Return the handler for ``key`` bound to ``device``, creating it with ``factory()`` if needed"""
+        with self._lock:
+            self.evict_idle()
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                entry = PooledHandler(key, factory())
+                self.entries[key] = entry
+                while len(self.entries) > self.max_size:
+                    self._evict(next(iter(self.entries.values())), 'pool full')
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            previous = self.device_keys.get(device.id)
+            if previous is not None and previous != key:
+                self.release(device.id)
+            entry.devices.add(device.id)
+            entry.last_used = time.monotonic()
+            entry.handler.bind(device)
+            self.device_keys[device.id] = key
+            return entry.handler
+
+    def connect(self, device_id):
+        with self._lock:
+            entry = self.entries.get(self.device_keys.get(device_id))
+            if entry is None or entry.connected:
+                return
+            entry.handler.connect()
+            entry.connected = True
+
+    def release(self, device_id):
+        """Detach a device, disconnecting its handler once no other device uses it"""
+        with self._lock:
+            key = self.device_keys.pop(device_id, None)
+            entry = self.entries.get(key)
+            if entry is None:
+                return
+            entry.devices.discard(device_id)
+            if not entry.devices:
+                self._remove(entry)
+
+    def evict_idle(self):
+        if not self.idle_timeout:
+            return
+        deadline = time.monotonic() - self.idle_timeout
+        with self._lock:
+            # Entries are in LRU order, so stop at the first one still in use
+            while self.entries:
+                entry = next(iter(self.entries.values()))
+                if entry.last_used > deadline:
+                    break
+                self._evict(entry, 'idle')
+
+    def close_all(self):
+        with self._lock:
+            for entry in list(self.entries.values()):
+                self._remove(entry)
+            self.device_keys.clear()
+
+    def _evict(self, entry, reason):
+        self.evictions += 1
+        logger.info(f'Evicting {reason} handler for {entry.key}')
+        for device_id in entry.devices:
+            self.device_keys.pop(device_id, None)
+        self._remove(entry)
+
+    def _remove(self, entry):
+        self.entries.pop(entry.key, None)
+        if entry.connected:
+            try:
+                entry.handler.disconnect()
+            except Exception as e:
+                logger.error(f'Error disconnecting handler for {entry.key}: {e}')
+            entry.connected = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self.entries),
+                'devices': len(self.device_keys),
+                'open_connections': sum(1 for entry in self.entries.values() if entry.connected),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -1,15 +1,15 @@
+import json
 import logging
 from ..handlers.factory import ProtocolFactory
 from ..models import Device
+from .pool import HandlerPool
 
 class CommunicationService:
-    def __init__(self):
-        self.handlers = {}  # Mapping from device_id to handler instance
-
-    def get_handler(self, device: Device):
-        if device.id in self.handlers:
-            return self.handlers[device.id]
+    def __init__(self, max_handlers=None, idle_timeout=None):
+        # Handlers are pooled per endpoint and evicted when idle or when the pool is full
+        self.handlers = HandlerPool(max_size=max_handlers, idle_timeout=idle_timeout)
 
+    def handler_config(self, device: Device):
         protocol_type = device.protocol.protocol_type.lower()
         kwargs = device.config_settings.copy()
 
@@ -26,23 +26,34 @@ class CommunicationService:
             if 'url' not in kwargs:
                 kwargs['url'] = 'http://default-url.com'  # Placeholder, adjust as needed
 
-        handler = ProtocolFactory.create_handler(device, protocol_type, **kwargs)
-        self.handlers[device.id] = handler
-        return handler
+        return protocol_type, kwargs
+
+    def get_handler(self, device: Device):
+        protocol_type, kwargs = self.handler_config(device)
+        # Devices with identical endpoint settings share one handler and connection
+        key = (protocol_type, json.dumps(kwargs, sort_keys=True, default=str))
+        return self.handlers.acquire(
+            device,
+            key,
+            lambda: ProtocolFactory.create_handler(device, protocol_type, **kwargs),
+        )
 
     def start_communication(self, device: Device):
-        handler = self.get_handler(device)
-        handler.connect()
+        self.get_handler(device)
+        self.handlers.connect(device.id)
 
     def stop_communication(self, device: Device):
-        if device.id in self.handlers:
-            handler = self.handlers[device.id]
-            handler.disconnect()
-            del self.handlers[device.id]
+        self.handlers.release(device.id)
 
     def handle_data(self, device: Device):
         handler = self.get_handler(device)
         data = handler.receive_data()
         logging.info(f"Data received from device {device.id}: {data}")
         # TODO: Process the data, e.g., parse and save to database
-        return data
\ No newline at end of file
+        return data
+
+    def stats(self):
+        return self.handlers.stats()
+
+    def close(self):
+        self.handlers.close_all()
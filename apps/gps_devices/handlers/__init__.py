@@ -5,6 +5,11 @@ class ProtocolHandler(ABC):
         self.device = device
         self.protocol = device.protocol
 
+    def bind(self, device):
+        """Attribute subsequent data to ``device``; pooled handlers are shared by devices on one endpoint"""
+        self.device = device
+        self.protocol = device.protocol
+
     @abstractmethod
     def connect(self):
         pass
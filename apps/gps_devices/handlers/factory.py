@@ -1,12 +1,17 @@
-from .tcp_handler import TCPHandler
+from .tcp_handler import TCPHandler, BinaryTCPHandler
 from .mqtt_handler import MQTTHandler
 from .http_handler import HTTPHandler
+from ..parsers.binary import DECODERS
 
 class ProtocolFactory:
     @staticmethod
     def create_handler(device, protocol_type, **kwargs):
         if protocol_type.lower() == 'tcp':
+            if kwargs.get('codec'):
+                return BinaryTCPHandler(device, kwargs.get('host'), kwargs.get('port'), kwargs['codec'])
             return TCPHandler(device, kwargs.get('host'), kwargs.get('port'))
+        elif protocol_type.lower() in DECODERS:
+            return BinaryTCPHandler(device, kwargs.get('host'), kwargs.get('port'), protocol_type.lower())
         elif protocol_type.lower() == 'mqtt':
             return MQTTHandler(device, kwargs.get('broker'), kwargs.get('port'), kwargs.get('topic'))
         elif protocol_type.lower() == 'http':
@@ -1,8 +1,8 @@
 import logging
-import threading
 import requests
 from . import ProtocolHandler
 from ..models import RawGPSData
+from ..ingest.buffer import get_raw_data_buffer
 
 class HTTPHandler(ProtocolHandler):
     def __init__(self, device, url):
@@ -15,19 +15,19 @@ class HTTPHandler(ProtocolHandler):
         print(f"Connected to {self.url}")
 
     def save_raw_data(self, raw_data, source_ip=None):
-        RawGPSData.objects.create(
+        get_raw_data_buffer().add(RawGPSData(
             device=self.device,
             protocol=self.protocol,
             raw_data=raw_data,
             ip_address=source_ip
-        )
+        ))
 
     def receive_data(self):
         if self.session:
             response = self.session.get(self.url)
             logging.info(f"Raw HTTP data received: {response.text}")
-            # Save raw data asynchronously
-            threading.Thread(target=self.save_raw_data, args=(response.text,)).start()
+            # Queue raw data for the batched writer
+            self.save_raw_data(response.text)
             return response.text
         return None
 
@@ -1,5 +1,4 @@
 import logging
-import threading
 try:
     import paho.mqtt.client as mqtt
     PAHO_AVAILABLE = True
@@ -8,6 +7,7 @@ except ImportError:
     mqtt = None
 from . import ProtocolHandler
 from ..models import RawGPSData
+from ..ingest.buffer import get_raw_data_buffer
 
 class MQTTHandler(ProtocolHandler):
     def __init__(self, device, broker, port, topic):
@@ -21,12 +21,12 @@ class MQTTHandler(ProtocolHandler):
         self.received_data = None
 
     def save_raw_data(self, raw_data, source_ip=None):
-        RawGPSData.objects.create(
+        get_raw_data_buffer().add(RawGPSData(
             device=self.device,
             protocol=self.protocol,
             raw_data=raw_data,
             ip_address=source_ip
-        )
+        ))
 
     def connect(self):
         self.client.connect(self.broker, self.port, 60)
@@ -38,8 +38,8 @@ class MQTTHandler(ProtocolHandler):
             decoded_data = msg.payload.decode('utf-8')
             logging.info(f"Raw MQTT data received: {decoded_data}")
             self.received_data = decoded_data
-            # Save raw data asynchronously
-            threading.Thread(target=self.save_raw_data, args=(decoded_data,)).start()
+            # Queue raw data for the batched writer
+            self.save_raw_data(decoded_data)
 
         self.client.on_message = on_message
         self.client.subscribe(self.topic)
@@ -1,8 +1,10 @@
+import json
 import logging
-import threading
 import socket
 from . import ProtocolHandler
 from ..models import RawGPSData
+from ..ingest.buffer import get_raw_data_buffer
+from ..parsers.binary import DECODERS
 
 class TCPHandler(ProtocolHandler):
     def __init__(self, device, host, port):
@@ -17,12 +19,12 @@ class TCPHandler(ProtocolHandler):
         print(f"Connected to {self.host}:{self.port}")
 
     def save_raw_data(self, raw_data, source_ip=None):
-        RawGPSData.objects.create(
+        return get_raw_data_buffer().add(RawGPSData(
             device=self.device,
             protocol=self.protocol,
             raw_data=raw_data,
             ip_address=source_ip
-        )
+        ))
 
     def receive_data(self):
         if self.sock:
@@ -34,12 +36,40 @@ class TCPHandler(ProtocolHandler):
                 source_ip = self.sock.getpeername()[0]
             except:
                 source_ip = None
-            # Save raw data asynchronously
-            threading.Thread(target=self.save_raw_data, args=(decoded_data, source_ip)).start()
+            # Queue raw data for the batched writer
+            self.save_raw_data(decoded_data, source_ip)
             return decoded_data
         return None
 
     def disconnect(self):
         if self.sock:
             self.sock.close()
-            print("Disconnected")
\ No newline at end of file
+            print("Disconnected")
+
+class BinaryTCPHandler(TCPHandler):
+    """TCP handler for binary trackers (GT06, Teltonika Codec 8)"""
+
+    def __init__(self, device, host, port, codec):
+        super().__init__(device, host, port)
+        if codec not in DECODERS:
+            raise ValueError(f"Unknown binary codec: {codec}")
+        self.codec = codec
+        self.decoder = DECODERS[codec]()
+
+    def receive_data(self):
+        if self.sock:
+            data = self.sock.recv(4096)
+            records, ack = self.decoder.feed(data)
+            logging.info(f"Decoded {len(records)} {self.codec} records")
+            try:
+                source_ip = self.sock.getpeername()[0]
+            except OSError:
+                source_ip = None
+            accepted = [self.save_raw_data(json.dumps(record, separators=(',', ':')), source_ip) for record in records]
+            if not all(accepted):
+                # Unacknowledged records stay on the device and are sent again
+                logging.warning(f"Withholding {self.codec} ACK: {accepted.count(False)} record(s) were not accepted")
+            elif ack:
+                self.sock.sendall(ack)
+            return records
+        return None
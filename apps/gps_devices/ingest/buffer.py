@@ -0,0 +1,183 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from ..models import RawGPSData
+from .dedup import PacketDeduplicator
+from .spool import DiskSpool
+
+logger = logging.getLogger(__name__)
+
+
+class RawDataBuffer:
+    """
+    Write-behind buffer that batches RawGPSData rows into bulk inserts.
+
+    Producers call ``add`` from any thread. A single flusher thread drains the
+    bounded queue and issues one ``bulk_create`` per ``batch_size`` rows or
+    every ``flush_interval`` seconds, whichever comes first. When the database
+    falls behind, the queue fills up and ``add`` blocks for up to
+    ``put_timeout`` seconds, pushing back on the receivers.
+
+    With a ``spool``, rows that still do not fit in the queue and batches the
+    database rejects are appended to disk instead of being dropped;
+    ``replay_gps_spool`` loads them later. With a ``dedup`` filter,
+    retransmitted packets are acknowledged but never queued.
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None, max_pending=None, put_timeout=None, spool=None,
+                 dedup=None):
+        self.batch_size = batch_size or getattr(settings, 'GPS_INGEST_BATCH_SIZE', 500)
+        self.flush_interval = flush_interval or getattr(settings, 'GPS_INGEST_FLUSH_INTERVAL', 1.0)
+        self.put_timeout = put_timeout if put_timeout is not None else getattr(settings, 'GPS_INGEST_PUT_TIMEOUT', 5.0)
+        self.queue = queue.Queue(maxsize=max_pending or getattr(settings, 'GPS_INGEST_MAX_PENDING', 10000))
+        self.spool = spool
+        self.dedup = dedup
+        self.thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.spooled = 0
+        self.flushes = 0
+
+    def add(self, raw_data):
+        """Queue an unsaved RawGPSData instance, returning False if it had to be dropped"""
+        if self.dedup is not None and self.dedup.is_duplicate(raw_data):
+            return True
+        try:
+            self.queue.put(raw_data, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            if self.spool_rows([raw_data]):
+                return True
+            if self.dedup is not None:
+                self.dedup.forget(raw_data)
+            logger.error('Raw GPS data buffer is full, dropping packet')
+            return False
+
+    def spool_rows(self, rows):
+        """Hand rows to the disk spool, counting them as dropped if that is not possible"""
+        spooled = False
+        if self.spool is not None:
+            try:
+                spooled = self.spool.append(rows)
+            except Exception as e:
+                logger.error(f'Error spooling {len(rows)} raw GPS packets: {e}')
+        with self._lock:
+            if spooled:
+                self.spooled += len(rows)
+            else:
+                self.dropped += len(rows)
+        return spooled
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self._stopping.clear()
+        self.thread = threading.Thread(target=self.run, name='gps-raw-buffer', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=30):
+        """Stop the flusher thread and write whatever is still queued"""
+        self._stopping.set()
+        if self.thread:
+            self.thread.join(timeout)
+            self.thread = None
+        self.flush()
+        if self.spool is not None:
+            self.spool.close()
+
+    def run(self):
+        try:
+            while not self._stopping.is_set():
+                batch = self.collect()
+                if batch:
+                    try:
+                        self.write(batch)
+                    except Exception:
+                        # Keep flushing: a dead flusher would block every receiver on a full queue
+                        logger.exception(f'Error writing {len(batch)} raw GPS packets')
+        finally:
+            connection.close()
+
+    def collect(self):
+        """Block until a full batch is ready or the flush interval has passed"""
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return batch
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        """Synchronously write everything currently queued"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self.write(batch)
+
+    def write(self, batch):
+        close_old_connections()
+        try:
+            RawGPSData.objects.bulk_create(batch, batch_size=self.batch_size)
+        except Exception as e:
+            logger.error(f'Error saving {len(batch)} raw GPS packets: {e}')
+            self.spool_rows(batch)
+            return False
+        with self._lock:
+            self.written += len(batch)
+            self.flushes += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': self.queue.qsize(),
+                'written': self.written,
+                'dropped': self.dropped,
+                'spooled': self.spooled,
+                'flushes': self.flushes,
+                'duplicates': self.dedup.hits if self.dedup is not None else 0,
+            }
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_raw_data_buffer():
+    """Return the process-wide buffer, starting its flusher thread on first use"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                spool_dir = getattr(settings, 'GPS_INGEST_SPOOL_DIR', None)
+                dedup_size = getattr(settings, 'GPS_INGEST_DEDUP_SIZE', 0)
+                _buffer = RawDataBuffer(
+                    spool=DiskSpool(spool_dir) if spool_dir else None,
+                    dedup=PacketDeduplicator(dedup_size) if dedup_size else None,
+                )
+                _buffer.start()
+                atexit.register(_buffer.stop)
+    return _buffer
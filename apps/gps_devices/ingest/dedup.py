@@ -0,0 +1,66 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class PacketDeduplicator:
+    """
+    Bounded LRU of recently seen packets, used to drop tracker retransmissions.
+
+    Trackers on poor GSM links resend a fix until they see an ACK, so the
+    same payload arrives several times. Packets are keyed on the device and
+    a digest of the payload; because the payload carries the fix timestamp,
+    two different fixes never share a key, while a resend of the same fix
+    does. Packets from senders not yet matched to a device are keyed on
+    their source address instead. Entries expire after ``window`` seconds so a device that repeats an
+    identical timestamp-less message is only suppressed for a while.
+    """
+
+    def __init__(self, capacity=None, window=None):
+        self.capacity = capacity if capacity is not None else getattr(settings, 'GPS_INGEST_DEDUP_SIZE', 100000)
+        self.window = window if window is not None else getattr(settings, 'GPS_INGEST_DEDUP_WINDOW', 600.0)
+        self._lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(raw_data):
+        digest = hashlib.blake2b(raw_data.raw_data.encode('utf-8', errors='ignore'), digest_size=12).digest()
+        if raw_data.device_id is None:
+            # Unresolved senders are told apart by address, not lumped together under None
+            return 'ip', raw_data.ip_address, digest
+        return raw_data.device_id, digest
+
+    def is_duplicate(self, raw_data):
+        """Record the packet and report whether it was already seen inside the window"""
+        key = self.key(raw_data)
+        now = time.monotonic()
+        with self._lock:
+            seen_at = self.entries.get(key)
+            if seen_at is not None and now - seen_at < self.window:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True
+            self.entries[key] = now
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+            self.misses += 1
+            return False
+
+    def forget(self, raw_data):
+        """Drop a packet's entry, e.g. when it could not be stored, so its retransmission is accepted"""
+        with self._lock:
+            self.entries.pop(self.key(raw_data), None)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
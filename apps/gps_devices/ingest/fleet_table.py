@@ -0,0 +1,244 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+try:
+    import fcntl
+    LOCKF_AVAILABLE = True
+except ImportError:
+    LOCKF_AVAILABLE = False
+    fcntl = None
+
+from django.conf import settings
+
+from ..models import Device
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GPSF'
+VERSION = 1
+HEADER = struct.Struct('<4sIII48x')
+# seq, device_id, lat, lng, time, battery (-1 unknown), status code (-1 unknown)
+SLOT = struct.Struct('<I4xqdddhb5x')
+SEQ = struct.Struct('<I')
+STATUS_CODES = [code for code, label in Device.STATUS_CHOICES]
+MAX_READ_RETRIES = 100
+
+FleetPosition = namedtuple('FleetPosition', ('lat', 'lng', 'time', 'battery_level', 'status'))
+
+
+class FleetPositionTable:
+    """
+    Memory-mapped table of each device's last position, battery and status.
+
+    The file holds ``slots`` fixed-size records and a device lives in slot
+    ``device_id``, so every process that maps the same file (ideally on
+    ``/dev/shm``) reads the fleet straight out of shared memory. Each slot is
+    guarded by a sequence counter: writers make it odd while they update the
+    slot, and readers retry until they see the same even value before and
+    after copying it. Writers in different processes serialise on a lock of
+    the slot's byte range. Devices whose id does not fit in the table are
+    simply not stored, and callers fall back to the database for them.
+    """
+
+    def __init__(self, path, slots=None):
+        self.path = str(path)
+        self.slots = slots or getattr(settings, 'GPS_FLEET_TABLE_SLOTS', 65536)
+        self.size = HEADER.size + self.slots * SLOT.size
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            self._initialise()
+            self.map = mmap.mmap(self.fd, self.size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        except Exception:
+            os.close(self.fd)
+            raise
+        self.view = memoryview(self.map)
+        self._lock = threading.Lock()
+
+    def _initialise(self):
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, HEADER.size, 0)
+        try:
+            header = os.pread(self.fd, HEADER.size, 0)
+            if len(header) == HEADER.size and header[:4] == MAGIC:
+                magic, version, slots, slot_size = HEADER.unpack(header)
+                if (version, slots, slot_size) != (VERSION, self.slots, SLOT.size):
+                    raise ValueError(
+                        f'{self.path} holds a v{version} table with {slots} slots, expected v{VERSION} with {self.slots}'
+                    )
+                return
+            os.ftruncate(self.fd, self.size)
+            os.pwrite(self.fd, HEADER.pack(MAGIC, VERSION, self.slots, SLOT.size), 0)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, HEADER.size, 0)
+
+    def offset(self, device_id):
+        if not 0 < device_id < self.slots:
+            return None
+        return HEADER.size + device_id * SLOT.size
+
+    def write(self, device_id, lat=None, lng=None, timestamp=None, battery_level=None, status=None):
+        """
+        Update a device's slot, returning False if it does not fit or a given fix was not newer.
+
+        Position fields are only replaced by a newer ``timestamp``; battery
+        and status are kept when passed as None.
+        """
+        offset = self.offset(device_id)
+        if offset is None:
+            return False
+        with self.locked(offset):
+            seq, current_id, cur_lat, cur_lng, cur_time, cur_battery, cur_status = SLOT.unpack_from(self.map, offset)
+            if current_id != device_id:
+                cur_lat = cur_lng = cur_time = 0.0
+                cur_battery = cur_status = -1
+            moved = timestamp is None
+            if timestamp is not None and timestamp.timestamp() > cur_time:
+                cur_lat, cur_lng, cur_time = float(lat), float(lng), timestamp.timestamp()
+                moved = True
+            if battery_level is not None:
+                cur_battery = int(battery_level)
+            if status is not None:
+                cur_status = STATUS_CODES.index(status) if status in STATUS_CODES else -1
+            self.store(offset, seq, device_id, cur_lat, cur_lng, cur_time, cur_battery, cur_status)
+            return moved
+
+    def clear(self, device_id):
+        offset = self.offset(device_id)
+        if offset is None:
+            return
+        with self.locked(offset):
+            self.store(offset, SEQ.unpack_from(self.map, offset)[0], 0, 0.0, 0.0, 0.0, -1, -1)
+
+    @contextmanager
+    def locked(self, offset):
+        # lockf only excludes other processes, so threads of this one take the lock first
+        with self._lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, SLOT.size, offset)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, SLOT.size, offset)
+
+    def store(self, offset, seq, *values):
+        """Seqlock write: odd sequence while the slot is being changed, next even value once done"""
+        writing = (seq + 1) & 0xFFFFFFFF
+        SEQ.pack_into(self.map, offset, writing)
+        SLOT.pack_into(self.map, offset, writing, *values)
+        SEQ.pack_into(self.map, offset, (writing + 1) & 0xFFFFFFFF)
+
+    def read(self, device_id):
+        """Consistent copy of a device's slot, or None if the device is not in the table"""
+        offset = self.offset(device_id)
+        if offset is None:
+            return None
+        view = self.view
+        for _ in range(MAX_READ_RETRIES):
+            seq, current_id, lat, lng, epoch, battery, status = SLOT.unpack_from(view, offset)
+            if seq & 1 or SEQ.unpack_from(view, offset)[0] != seq:
+                continue
+            if current_id != device_id:
+                return None
+            return FleetPosition(
+                Decimal(f'{lat:.6f}') if epoch else None,
+                Decimal(f'{lng:.6f}') if epoch else None,
+                datetime.fromtimestamp(epoch, tz=dt_timezone.utc) if epoch else None,
+                battery if battery >= 0 else None,
+                STATUS_CODES[status] if status >= 0 else None,
+            )
+        logger.warning(f'Gave up reading fleet table slot {device_id} after {MAX_READ_RETRIES} retries')
+        return None
+
+    def get_many(self, device_ids):
+        """
+        Positions of the devices whose slot holds a fix, by device id.
+
+        A slot written only with status or battery (e.g. by the status signal
+        before any fix reached the table) has no position and counts as
+        missing, so callers read those devices from the database.
+        """
+        found = {}
+        for device_id in device_ids:
+            position = self.read(device_id)
+            if position is not None and position.time is not None:
+                found[device_id] = position
+        return found
+
+    def apply(self, devices):
+        """Overlay newer positions onto Device instances, returning them as a list"""
+        devices = list(devices)
+        positions = self.get_many([device.id for device in devices])
+        for device in devices:
+            position = positions.get(device.id)
+            if position is None or position.time is None:
+                continue
+            if device.last_location_time is not None and device.last_location_time >= position.time:
+                continue
+            device.last_location_lat = position.lat
+            device.last_location_lng = position.lng
+            device.last_location_time = position.time
+            if position.battery_level is not None:
+                device.battery_level = position.battery_level
+        return devices
+
+    def put_device(self, device):
+        """Write a device's current row, e.g. after a save or when seeding the table"""
+        timestamp = device.last_location_time
+        if device.last_location_lat is None or device.last_location_lng is None:
+            timestamp = None
+        return self.write(
+            device.id,
+            device.last_location_lat,
+            device.last_location_lng,
+            timestamp,
+            device.battery_level,
+            device.status,
+        )
+
+    def seed(self, queryset=None):
+        """Load every device from the database, returning the number stored"""
+        queryset = queryset if queryset is not None else Device.objects.all()
+        stored = 0
+        for device in queryset.only(
+            'id', 'last_location_lat', 'last_location_lng', 'last_location_time', 'battery_level', 'status'
+        ).iterator(chunk_size=2000):
+            if self.offset(device.id) is not None:
+                self.put_device(device)
+                stored += 1
+        return stored
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+        os.close(self.fd)
+
+
+_table = None
+_table_lock = threading.Lock()
+_unavailable_logged = False
+
+
+def get_fleet_table():
+    """
+    Return the process-wide table, or None when GPS_FLEET_TABLE_PATH is not
+    set or the platform has no fcntl record locks to share it with
+    """
+    global _table, _unavailable_logged
+    path = getattr(settings, 'GPS_FLEET_TABLE_PATH', '')
+    if not path:
+        return None
+    if not LOCKF_AVAILABLE:
+        if not _unavailable_logged:
+            logger.warning('GPS_FLEET_TABLE_PATH is set but fcntl is not available; the fleet table is disabled')
+            _unavailable_logged = True
+        return None
+    if _table is None or _table.path != path:
+        with _table_lock:
+            if _table is None or _table.path != path:
+                _table = FleetPositionTable(path)
+    return _table
@@ -0,0 +1,216 @@
+import asyncio
+import heapq
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.db import close_old_connections
+
+from ..models import Device, RawGPSData
+from .buffer import get_raw_data_buffer
+
+logger = logging.getLogger(__name__)
+
+
+class PollTarget:
+    __slots__ = ('device_id', 'protocol_id', 'url', 'headers', 'interval', 'host', 'failures', 'due')
+
+    def __init__(self, device_id, protocol_id, url, interval, headers=None):
+        self.device_id = device_id
+        self.protocol_id = protocol_id
+        self.url = url
+        self.headers = headers or None
+        self.interval = max(interval, 1)
+        self.host = urlsplit(url).netloc
+        self.failures = 0
+        self.due = 0.0
+
+
+def load_targets():
+    """HTTP-pull devices with a ``url`` in their config, polled every ``update_frequency_seconds``"""
+    targets = {}
+    devices = Device.objects.filter(
+        protocol__protocol_type='http',
+        protocol__is_active=True,
+    ).exclude(status='suspended').values_list(
+        'id', 'protocol_id', 'config_settings', 'protocol__update_frequency_seconds'
+    )
+    for pk, protocol_id, config, interval in devices:
+        url = config.get('url') if isinstance(config, dict) else None
+        if url:
+            targets[pk] = PollTarget(pk, protocol_id, url, interval, config.get('headers'))
+    return targets
+
+
+def _load_targets_in_thread():
+    close_old_connections()
+    return load_targets()
+
+
+class HTTPPoller:
+    """
+    Polls pull-based HTTP devices from one asyncio scheduler.
+
+    Devices are kept in a heap ordered by their next due time, so thousands of
+    endpoints cost one timer rather than one thread each. Requests go through
+    a single pooled ``requests.Session`` on a bounded thread pool (keep-alive
+    connections are reused per host), limited by a global ``concurrency`` and
+    a ``per_host`` semaphore so one slow vendor API cannot starve the rest.
+    Start times are spread over the first interval and every reschedule is
+    jittered; failing endpoints back off exponentially up to ``max_backoff``.
+    Responses are queued on the batched raw-data writer.
+    """
+
+    def __init__(self, concurrency=64, per_host=4, connect_timeout=5.0, read_timeout=10.0, jitter=0.1,
+                 refresh_interval=60.0, max_backoff=3600.0, report_interval=60.0, buffer=None):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = (connect_timeout, read_timeout)
+        self.jitter = jitter
+        self.refresh_interval = refresh_interval
+        self.max_backoff = max_backoff
+        self.report_interval = report_interval
+        self.buffer = buffer or get_raw_data_buffer()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=256, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='gps-http-poll')
+        self.targets = {}
+        self.schedule = []
+        self.in_flight = set()
+        # Devices that came due while a poll of their previous target was running
+        self.deferred = set()
+        self.tasks = set()
+        self.limit = None
+        self.host_limits = {}
+        self.refreshed_at = 0.0
+        self.reported_at = time.monotonic()
+        self.stats = {'polls': 0, 'ok': 0, 'failed': 0, 'bytes': 0, 'max_lag': 0.0}
+
+    def refresh(self, targets, now):
+        """Swap in a new target set, keeping the schedule of devices that are still configured"""
+        for device_id, target in list(targets.items()):
+            current = self.targets.get(device_id)
+            if current is not None and current.url == target.url:
+                # Keep the existing object so its schedule entry and any in-flight poll stay valid
+                current.protocol_id = target.protocol_id
+                current.headers = target.headers
+                current.interval = target.interval
+                targets[device_id] = current
+                continue
+            # Spread new devices over their first interval to avoid a thundering herd
+            target.due = now + random.uniform(0, target.interval)
+            heapq.heappush(self.schedule, (target.due, device_id))
+        self.targets = targets
+        self.refreshed_at = now
+        logger.info(f'HTTP poller tracking {len(targets)} devices')
+
+    def next_delay(self, target):
+        delay = target.interval
+        if target.failures:
+            delay = min(delay * 2 ** min(target.failures, 16), self.max_backoff)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def reschedule(self, target):
+        target.due = time.monotonic() + self.next_delay(target)
+        heapq.heappush(self.schedule, (target.due, target.device_id))
+
+    def dispatch(self, now):
+        """Start a poll for every device that is due"""
+        while self.schedule and self.schedule[0][0] <= now:
+            due, device_id = heapq.heappop(self.schedule)
+            target = self.targets.get(device_id)
+            # Skip entries for removed devices and stale entries after a reschedule
+            if target is None or target.due != due:
+                continue
+            if device_id in self.in_flight:
+                # Its URL changed while the old one was being polled; poll it once that finishes
+                self.deferred.add(device_id)
+                continue
+            self.stats['max_lag'] = max(self.stats['max_lag'], now - due)
+            self.in_flight.add(device_id)
+            task = asyncio.create_task(self.poll(target))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def poll(self, target):
+        loop = asyncio.get_running_loop()
+        host_limit = self.host_limits.get(target.host)
+        if host_limit is None:
+            host_limit = self.host_limits[target.host] = asyncio.Semaphore(self.per_host)
+        try:
+            # Wait for the host first so a saturated host never holds global slots
+            async with host_limit, self.limit:
+                size = await loop.run_in_executor(self.executor, self.fetch, target)
+            target.failures = 0
+            self.stats['ok'] += 1
+            self.stats['bytes'] += size
+        except Exception as e:
+            target.failures += 1
+            self.stats['failed'] += 1
+            logger.warning(f'Polling device {target.device_id} at {target.url} failed ({target.failures}x): {e}')
+        finally:
+            self.stats['polls'] += 1
+            self.in_flight.discard(target.device_id)
+            current = self.targets.get(target.device_id)
+            if current is target:
+                self.reschedule(target)
+            elif target.device_id in self.deferred and current is not None:
+                current.due = time.monotonic()
+                heapq.heappush(self.schedule, (current.due, current.device_id))
+            self.deferred.discard(target.device_id)
+
+    def fetch(self, target):
+        """Blocking GET on the shared session; runs on the pool"""
+        response = self.session.get(target.url, headers=target.headers, timeout=self.timeout)
+        response.raise_for_status()
+        text = response.text.strip()
+        if text:
+            self.buffer.add(RawGPSData(
+                device_id=target.device_id,
+                protocol_id=target.protocol_id,
+                raw_data=text,
+            ))
+        return len(response.content)
+
+    def report(self):
+        logger.info(
+            f"HTTP poller stats: devices={len(self.targets)} in_flight={len(self.in_flight)} "
+            f"polls={self.stats['polls']} ok={self.stats['ok']} failed={self.stats['failed']} "
+            f"max_lag={self.stats['max_lag']:.2f}s"
+        )
+        self.stats['max_lag'] = 0.0
+
+    async def serve(self, duration=None):
+        """Run the scheduler forever, or for ``duration`` seconds then wait for in-flight polls"""
+        loop = asyncio.get_running_loop()
+        self.limit = asyncio.Semaphore(self.concurrency)
+        started = time.monotonic()
+        try:
+            while duration is None or time.monotonic() - started < duration:
+                now = time.monotonic()
+                if now - self.refreshed_at >= self.refresh_interval:
+                    # The ORM is synchronous, so reload the device list off the event loop
+                    targets = await loop.run_in_executor(None, _load_targets_in_thread)
+                    self.refresh(targets, time.monotonic())
+                if now - self.reported_at >= self.report_interval:
+                    self.reported_at = now
+                    self.report()
+                self.dispatch(now)
+                wake = self.schedule[0][0] if self.schedule else now + 1.0
+                await asyncio.sleep(min(max(wake - time.monotonic(), 0.01), 1.0))
+            if self.tasks:
+                await asyncio.gather(*self.tasks, return_exceptions=True)
+        finally:
+            self.executor.shutdown(wait=True)
+            self.session.close()
+
+    def run(self, duration=None):
+        self.refresh(load_targets(), time.monotonic())
+        asyncio.run(self.serve(duration))
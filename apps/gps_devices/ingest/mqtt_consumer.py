@@ -0,0 +1,116 @@
+import logging
+import socket
+
+from django.conf import settings
+
+try:
+    import paho.mqtt.client as mqtt
+    PAHO_AVAILABLE = True
+except ImportError:
+    PAHO_AVAILABLE = False
+    mqtt = None
+
+from ..models import RawGPSData
+from .buffer import get_raw_data_buffer
+from .resolver import get_device_resolver
+from .stats import ReceiverStats
+
+logger = logging.getLogger(__name__)
+
+
+def shared_topic(topic, group):
+    """Wrap a subscription in an MQTT shared-subscription group so the broker load-balances it"""
+    return f'$share/{group}/{topic}' if group else topic
+
+
+class MQTTConsumer:
+    """
+    Fleet-wide MQTT ingestion over a single client connection.
+
+    Subscribes to wildcard topics such as ``devices/+`` instead of opening one
+    client per device. Each message is attributed to a device from its topic
+    through the in-process resolver (a device's configured ``topic``, or the
+    last topic level as IMEI / device_id) and queued on the batched raw-data
+    writer, so thousands of devices cost one socket and one network thread.
+    Several consumers can split the load with a shared-subscription ``group``.
+    """
+
+    def __init__(self, broker=None, port=None, topics=None, qos=1, client_id=None, group=None,
+                 username=None, password=None, keepalive=60, stats=None, buffer=None, resolver=None):
+        if not PAHO_AVAILABLE:
+            raise ImportError("paho-mqtt is not installed. Please install it to use MQTT functionality.")
+        self.broker = broker or settings.GPS_MQTT_BROKER
+        self.port = port or settings.GPS_MQTT_PORT
+        self.topics = [shared_topic(topic, group) for topic in (topics or settings.GPS_MQTT_TOPICS)]
+        self.qos = qos
+        self.client_id = client_id or f'gps-mqtt-{socket.gethostname()}'
+        self.keepalive = keepalive
+        self.connected = False
+        self.stats = stats or ReceiverStats()
+        self.buffer = buffer or get_raw_data_buffer()
+        self.resolver = resolver or get_device_resolver()
+        self.client = self.build_client(username, password)
+
+    def build_client(self, username=None, password=None):
+        kwargs = {'client_id': self.client_id, 'clean_session': False}
+        if hasattr(mqtt, 'CallbackAPIVersion'):
+            # paho-mqtt 2.x requires the callback API version to be chosen explicitly
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, **kwargs)
+        else:
+            client = mqtt.Client(**kwargs)
+        if username:
+            client.username_pw_set(username, password)
+        client.on_connect = self.on_connect
+        client.on_disconnect = self.on_disconnect
+        client.on_message = self.on_message
+        return client
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            self.stats.error()
+            logger.error(f'MQTT broker {self.broker}:{self.port} refused connection (rc={rc})')
+            return
+        self.connected = True
+        self.stats.connection_opened()
+        # Subscribe on every (re)connect; the broker may have lost the session
+        client.subscribe([(topic, self.qos) for topic in self.topics])
+        logger.info(f'MQTT consumer {self.client_id} subscribed to {", ".join(self.topics)}')
+
+    def on_disconnect(self, client, userdata, rc):
+        if self.connected:
+            self.connected = False
+            self.stats.connection_closed()
+        if rc != 0:
+            logger.warning(f'MQTT consumer {self.client_id} lost connection (rc={rc}), reconnecting')
+
+    def on_message(self, client, userdata, message):
+        self.handle_message(message.topic, message.payload)
+
+    def handle_message(self, topic, payload):
+        self.stats.packet_received(len(payload))
+        data = payload.decode('utf-8', errors='ignore').strip()
+        if not data:
+            return
+        try:
+            device_id, protocol_id = self.resolver.resolve_topic(topic)
+            self.buffer.add(RawGPSData(
+                device_id=device_id,
+                protocol_id=protocol_id,
+                raw_data=data,
+            ))
+        except Exception as e:
+            self.stats.error()
+            logger.error(f'Error queueing MQTT message from {topic}: {e}')
+
+    def start(self):
+        """Connect in the background and run the network loop on paho's thread"""
+        self.client.connect_async(self.broker, self.port, self.keepalive)
+        self.client.loop_start()
+
+    def stop(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def run(self):
+        self.client.connect(self.broker, self.port, self.keepalive)
+        self.client.loop_forever(retry_first_connection=True)
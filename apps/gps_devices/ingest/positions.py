@@ -0,0 +1,198 @@
+import atexit
+import logging
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Case, F, Q, Value, When
+
+from ..models import Device
+
+logger = logging.getLogger(__name__)
+
+POSITION_KEY = 'gps_devices:position:{}'
+
+Position = namedtuple('Position', ('lat', 'lng', 'time', 'battery_level'))
+
+
+class LastPositionStore:
+    """
+    Write-behind store for each device's last known position.
+
+    ``record`` keeps the newest fix per device in memory and in the shared
+    cache, so any number of fixes from a chatty tracker cost no database
+    writes. A flusher thread writes the pending positions every
+    ``flush_interval`` seconds as one ``UPDATE ... SET last_location_lat,
+    last_location_lng, last_location_time, battery_level`` per
+    ``batch_size`` devices, never moving a device back in time. ``get_many``
+    and ``apply`` read the store before the table, so pages show positions
+    that have not been flushed yet.
+    """
+
+    def __init__(self, flush_interval=None, batch_size=500, cache_timeout=None):
+        self.flush_interval = flush_interval or getattr(settings, 'GPS_POSITION_FLUSH_INTERVAL', 2.0)
+        self.batch_size = batch_size
+        self.cache_timeout = cache_timeout or getattr(settings, 'GPS_POSITION_CACHE_TIMEOUT', 86400)
+        self.positions = {}
+        self.pending = {}
+        self.thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.written = 0
+        self.flushes = 0
+
+    def record(self, device_id, lat, lng, timestamp, battery_level=None):
+        """Remember a fix, returning False if the device already has a newer one"""
+        position = Position(lat, lng, timestamp, battery_level)
+        with self._lock:
+            current = self.positions.get(device_id)
+            if current is not None and current.time >= timestamp:
+                return False
+            if battery_level is None and current is not None:
+                position = position._replace(battery_level=current.battery_level)
+            self.positions[device_id] = position
+            self.pending[device_id] = position
+            self.recorded += 1
+        cache.set(POSITION_KEY.format(device_id), tuple(position), self.cache_timeout)
+        return True
+
+    def get_many(self, device_ids):
+        """Positions known to this process or the shared cache, keyed by device id"""
+        found = {}
+        missing = []
+        with self._lock:
+            for device_id in device_ids:
+                position = self.positions.get(device_id)
+                if position is None:
+                    missing.append(device_id)
+                else:
+                    found[device_id] = position
+        if missing:
+            cached = cache.get_many([POSITION_KEY.format(device_id) for device_id in missing])
+            for device_id in missing:
+                value = cached.get(POSITION_KEY.format(device_id))
+                if value is not None:
+                    found[device_id] = Position(*value)
+        return found
+
+    def get(self, device_id):
+        return self.get_many([device_id]).get(device_id)
+
+    def apply(self, devices):
+        """Overlay newer stored positions onto Device instances, returning them as a list"""
+        devices = list(devices)
+        positions = self.get_many([device.id for device in devices])
+        for device in devices:
+            position = positions.get(device.id)
+            if position is None:
+                continue
+            if device.last_location_time is not None and device.last_location_time >= position.time:
+                continue
+            device.last_location_lat = position.lat
+            device.last_location_lng = position.lng
+            device.last_location_time = position.time
+            if position.battery_level is not None:
+                device.battery_level = position.battery_level
+        return devices
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self._stopping.clear()
+        self.thread = threading.Thread(target=self.run, name='gps-position-store', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=30):
+        """Stop the flusher thread and write whatever is still pending"""
+        self._stopping.set()
+        if self.thread:
+            self.thread.join(timeout)
+            self.thread = None
+        self.flush()
+
+    def run(self):
+        try:
+            while not self._stopping.wait(self.flush_interval):
+                self.flush()
+        finally:
+            connection.close()
+
+    def flush(self):
+        """Write every pending position, returning the number of devices updated"""
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+        close_old_connections()
+        items = list(pending.items())
+        try:
+            for start in range(0, len(items), self.batch_size):
+                self.write(items[start:start + self.batch_size])
+        except Exception as e:
+            logger.error(f'Error flushing {len(items)} device positions: {e}')
+            with self._lock:
+                # Put the batch back unless a newer fix arrived in the meantime
+                for device_id, position in pending.items():
+                    self.pending.setdefault(device_id, position)
+            return 0
+        with self._lock:
+            self.written += len(items)
+            self.flushes += 1
+        return len(items)
+
+    def write(self, items):
+        """One UPDATE for a batch of devices, skipping rows that already hold a newer fix"""
+        def case(attribute, field, default=None):
+            return Case(
+                *[When(pk=device_id, then=Value(getattr(position, attribute)))
+                  for device_id, position in items if getattr(position, attribute) is not None],
+                default=default,
+                output_field=Device._meta.get_field(field),
+            )
+
+        newest = case('time', 'last_location_time')
+        with transaction.atomic():
+            Device.objects.filter(pk__in=[device_id for device_id, position in items]).filter(
+                Q(last_location_time__isnull=True) | Q(last_location_time__lt=newest)
+            ).update(
+                last_location_lat=case('lat', 'last_location_lat'),
+                last_location_lng=case('lng', 'last_location_lng'),
+                last_location_time=newest,
+                battery_level=case('battery_level', 'battery_level', F('battery_level')),
+            )
+
+    def stats(self):
+        with self._lock:
+            return {
+                'devices': len(self.positions),
+                'pending': len(self.pending),
+                'recorded': self.recorded,
+                'written': self.written,
+                'flushes': self.flushes,
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_position_store():
+    """
+    Return the process-wide store, starting its flusher thread on first use.
+
+    Returns None when ``GPS_POSITION_FLUSH_INTERVAL`` is 0, in which case
+    callers write positions straight to the table.
+    """
+    global _store
+    if not getattr(settings, 'GPS_POSITION_FLUSH_INTERVAL', 2.0):
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = LastPositionStore()
+                _store.start()
+                atexit.register(_store.stop)
+    return _store
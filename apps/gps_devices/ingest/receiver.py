@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from ..parsers.binary import FrameError, detect_decoder
+from .stats import ReceiverStats
+
+logger = logging.getLogger(__name__)
+
+
+def raise_nofile_limit():
+    """Raise the open file soft limit to the hard limit so we can hold many sockets"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        target = hard if hard != resource.RLIM_INFINITY else max(soft, 65536)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError) as e:
+            logger.warning(f'Could not raise open file limit: {e}')
+    return soft
+
+
+class PacketFramer:
+    """
+    Splits a TCP byte stream into packets on a set of delimiter bytes.
+
+    Text trackers terminate each message with a newline or '#'. Anything
+    that grows past ``max_size`` without a delimiter is emitted as-is so a
+    misbehaving device cannot grow the buffer without bound.
+    """
+
+    def __init__(self, delimiters=b'\n#', max_size=4096):
+        self.delimiters = bytes(delimiters)
+        self.separator = re.compile(b'[' + re.escape(self.delimiters) + b']+')
+        self.max_size = max_size
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        packets = []
+        buffer = self.buffer
+        offset = len(buffer)
+        buffer += data
+        # The buffer never keeps a delimiter, so only the new bytes are searched
+        end = max(buffer.rfind(delimiter, offset) for delimiter in self.delimiters)
+        if end >= 0:
+            packets = [bytes(packet) for packet in self.separator.split(buffer[:end]) if packet]
+            del buffer[:end + 1]
+        while len(buffer) >= self.max_size:
+            packets.append(bytes(buffer[:self.max_size]))
+            del buffer[:self.max_size]
+        return packets
+
+    def flush(self):
+        packet = bytes(self.buffer)
+        self.buffer.clear()
+        return packet
+
+
+class AsyncGPSReceiver:
+    """
+    asyncio TCP receiver that keeps device connections open.
+
+    Every connection is a coroutine rather than a thread, so a single process
+    can hold tens of thousands of idle trackers. Decoded packets are handed to
+    ``persist(data, ip_address)`` on a small thread pool, which keeps the
+    blocking ORM calls off the event loop. Connections that open with a
+    binary frame (GT06, Teltonika) are decoded in place, each record is
+    persisted as a JSON document, and the frames are acknowledged once every
+    record was accepted; ``persist`` returns False for a record it could not
+    take, and the connection is then closed without the ACK.
+    """
+
+    def __init__(self, persist, host='0.0.0.0', port=5000, idle_timeout=600,
+                 max_packet_size=4096, backlog=4096, report_interval=10,
+                 persist_workers=8, stats=None, reuse_port=False, report=None):
+        self.persist = persist
+        self.host = host
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.max_packet_size = max_packet_size
+        self.backlog = backlog
+        self.report_interval = report_interval
+        self.stats = stats or ReceiverStats()
+        self.reuse_port = reuse_port
+        self.report = report or self.log_stats
+        self.executor = ThreadPoolExecutor(max_workers=persist_workers, thread_name_prefix='gps-persist')
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(
+            self.handle_connection,
+            self.host,
+            self.port,
+            backlog=self.backlog,
+            reuse_address=True,
+            reuse_port=self.reuse_port or None,
+        )
+        sockname = self.server.sockets[0].getsockname()
+        self.port = sockname[1]
+        logger.info(f'Async GPS receiver listening on {self.host}:{self.port}')
+        return self.server
+
+    async def serve(self):
+        await self.start()
+        reporter = asyncio.create_task(self.report_stats())
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            reporter.cancel()
+
+    async def report_stats(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.report(self.stats.snapshot())
+
+    def log_stats(self, snapshot):
+        logger.info(f'GPS receiver stats: {ReceiverStats.format(snapshot)}')
+
+    async def handle_connection(self, reader, writer):
+        address = writer.get_extra_info('peername') or ('', 0)
+        ip_address = address[0]
+        framer = PacketFramer(max_size=self.max_packet_size)
+        decoder = None
+        first_read = True
+        loop = asyncio.get_running_loop()
+        self.stats.connection_opened()
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(reader.read(self.max_packet_size), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    logger.info(f'Closing idle connection from {address}')
+                    break
+                if not data:
+                    break
+                if first_read:
+                    decoder = detect_decoder(data)
+                    first_read = False
+                if decoder is not None:
+                    records, ack = decoder.feed(data)
+                    self.stats.packet_received(len(data), count=len(records))
+                    if records and not await self.handle_records(loop, records, ip_address):
+                        logger.warning(f'Closing {address} unacknowledged: records were not accepted')
+                        break
+                    if ack:
+                        # Acknowledge only after the records have been handed off
+                        writer.write(ack)
+                        await writer.drain()
+                    continue
+                for packet in framer.feed(data):
+                    await self.handle_packet(loop, packet, ip_address)
+            remainder = framer.flush()
+            if remainder:
+                await self.handle_packet(loop, remainder, ip_address)
+        except FrameError as e:
+            self.stats.error()
+            logger.error(f'Closing {address} after invalid frame: {e}')
+        except (ConnectionError, OSError) as e:
+            self.stats.error()
+            logger.error(f'Error handling client {address}: {e}')
+        finally:
+            self.stats.connection_closed()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def handle_packet(self, loop, packet, ip_address):
+        data = packet.decode('utf-8', errors='ignore').strip()
+        if not data:
+            return
+        self.stats.packet_received(len(packet))
+        try:
+            await loop.run_in_executor(self.executor, self.persist, data, ip_address)
+        except Exception as e:
+            self.stats.error()
+            logger.error(f'Error persisting packet from {ip_address}: {e}')
+
+    async def handle_records(self, loop, records, ip_address):
+        """Persist decoded records, returning whether all of them were accepted"""
+        try:
+            return await loop.run_in_executor(self.executor, self.persist_records, records, ip_address)
+        except Exception as e:
+            self.stats.error()
+            logger.error(f'Error persisting records from {ip_address}: {e}')
+            return False
+
+    def persist_records(self, records, ip_address):
+        accepted = [self.persist(json.dumps(record, separators=(',', ':')), ip_address) for record in records]
+        return False not in accepted
+
+    def run(self):
+        raise_nofile_limit()
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            logger.info('Shutting down async GPS receiver')
+        finally:
+            self.executor.shutdown(wait=True)
@@ -0,0 +1,151 @@
+import logging
+import re
+import threading
+import time
+
+from django.core.cache import cache
+
+from ..models import Device, Protocol
+
+logger = logging.getLogger(__name__)
+
+IMEI_PATTERN = re.compile(r'(?<!\d)(\d{15})(?!\d)')
+TOKEN_SPLIT_PATTERN = re.compile(r'[,;|:\s]')
+CONFIG_VERSION_KEY = 'gps_devices:config_version'
+
+DEFAULT_PROTOCOL_NAME = 'Unknown TCP'
+DEFAULT_PROTOCOL_DEFAULTS = {
+    'protocol_type': 'tcp',
+    'description': 'Default protocol for unknown GPS devices',
+    'default_port': 5000,
+}
+
+
+def bump_version():
+    """Tell resolvers and parser registries in every process sharing the cache to reload"""
+    try:
+        cache.incr(CONFIG_VERSION_KEY)
+    except ValueError:
+        cache.set(CONFIG_VERSION_KEY, 1, None)
+
+
+class DeviceResolver:
+    """
+    In-process identity cache for the receiver hot path.
+
+    Maps IMEI / device_id, MQTT topic and the listening port to
+    ``(device_pk, protocol_pk)`` without touching the database. Tables are loaded once and
+    reloaded lazily after a Device or Protocol change; the change is seen
+    locally through model signals and in other processes through a version
+    counter kept in the shared cache.
+    """
+
+    def __init__(self, check_interval=5.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.version = None
+        self.checked_at = 0.0
+        self.by_identifier = {}
+        self.by_port = {}
+        self.by_topic = {}
+        self.protocol_by_port = {}
+        self.default_protocol_id = None
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        protocol, created = Protocol.objects.get_or_create(
+            name=DEFAULT_PROTOCOL_NAME,
+            defaults=DEFAULT_PROTOCOL_DEFAULTS,
+        )
+        by_identifier = {}
+        by_port = {}
+        by_topic = {}
+        port_owners = {}
+        devices = Device.objects.values_list(
+            'id', 'imei', 'device_id', 'protocol_id', 'assigned_port', 'config_settings__topic'
+        )
+        for pk, imei, device_id, protocol_id, assigned_port, topic in devices:
+            entry = (pk, protocol_id)
+            if imei:
+                by_identifier[imei] = entry
+            if device_id:
+                by_identifier[device_id] = entry
+            if topic and isinstance(topic, str):
+                by_topic[topic] = entry
+            if assigned_port:
+                port_owners.setdefault(assigned_port, []).append(entry)
+        for port, owners in port_owners.items():
+            # A port only identifies a device when it is dedicated to it
+            if len(owners) == 1:
+                by_port[port] = owners[0]
+
+        protocol_by_port = {}
+        protocols = Protocol.objects.filter(is_active=True, default_port__isnull=False).values_list('id', 'default_port')
+        for pk, port in protocols:
+            protocol_by_port.setdefault(port, pk)
+
+        with self._lock:
+            self.by_identifier = by_identifier
+            self.by_port = by_port
+            self.by_topic = by_topic
+            self.protocol_by_port = protocol_by_port
+            self.default_protocol_id = protocol.pk
+            self.version = cache.get(CONFIG_VERSION_KEY)
+            self.checked_at = time.monotonic()
+            self.loaded = True
+        logger.info(f'Device resolver loaded {len(by_identifier)} identifiers and {len(protocol_by_port)} protocol ports')
+
+    def invalidate(self):
+        self.loaded = False
+
+    def ensure_loaded(self):
+        if self.loaded and time.monotonic() - self.checked_at >= self.check_interval:
+            self.checked_at = time.monotonic()
+            if cache.get(CONFIG_VERSION_KEY) != self.version:
+                self.loaded = False
+        if not self.loaded:
+            self.load()
+
+    def resolve(self, identifier=None, port=None):
+        """Return ``(device_pk, protocol_pk)``; device_pk is None when the sender is unknown"""
+        self.ensure_loaded()
+        entry = self.by_identifier.get(identifier) if identifier else None
+        if entry is None and port is not None:
+            entry = self.by_port.get(port)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None, self.protocol_by_port.get(port, self.default_protocol_id)
+
+    def identify(self, data):
+        """Pick the device identifier out of a text packet"""
+        match = IMEI_PATTERN.search(data)
+        if match and match.group(1) in self.by_identifier:
+            return match.group(1)
+        token = TOKEN_SPLIT_PATTERN.split(data.lstrip('$*#>(['), 1)[0]
+        if token in self.by_identifier:
+            return token
+        return match.group(1) if match else None
+
+    def resolve_packet(self, data, port=None):
+        self.ensure_loaded()
+        return self.resolve(self.identify(data), port)
+
+    def resolve_topic(self, topic):
+        """Resolve an MQTT topic: a device's configured topic, else its last level as identifier"""
+        self.ensure_loaded()
+        entry = self.by_topic.get(topic)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        return self.resolve(topic.rstrip('/').rsplit('/', 1)[-1])
+
+
+_resolver = DeviceResolver()
+
+
+def get_device_resolver():
+    return _resolver
@@ -0,0 +1,297 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+    FLOCK_AVAILABLE = True
+except ImportError:
+    FLOCK_AVAILABLE = False
+    fcntl = None
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils.dateparse import parse_datetime
+
+from ..models import Device, Protocol, RawGPSData, SpoolCheckpoint
+
+logger = logging.getLogger(__name__)
+
+OPEN_SUFFIX = '.open'
+CLOSED_SUFFIX = '.seg'
+NEW_SUFFIX = '.new'
+QUARANTINE_SUFFIX = '.bad'
+
+
+def encode_row(raw_data):
+    return json.dumps({
+        'device_id': raw_data.device_id,
+        'protocol_id': raw_data.protocol_id,
+        'raw_data': raw_data.raw_data,
+        'received_at': raw_data.received_at.isoformat() if raw_data.received_at else None,
+        'ip_address': raw_data.ip_address,
+    }, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def decode_row(line):
+    values = json.loads(line)
+    received_at = parse_datetime(values['received_at']) if values.get('received_at') else None
+    raw_data = RawGPSData(
+        device_id=values.get('device_id'),
+        protocol_id=values.get('protocol_id'),
+        raw_data=values['raw_data'],
+        ip_address=values.get('ip_address'),
+    )
+    if received_at is not None:
+        raw_data.received_at = received_at
+    return raw_data
+
+
+class DiskSpool:
+    """
+    Append-only, segmented spool for RawGPSData rows the database could not take.
+
+    Rows are written as JSON lines to ``<created_ns>-<pid>.open`` in the spool
+    directory. A segment is closed (renamed to ``.seg`` and fsynced) once it
+    reaches ``segment_size`` bytes or ``max_age`` seconds, so several receiver
+    processes can share a directory and segment names sort in creation order.
+    ``max_bytes`` caps the total size on disk; past it, rows are refused.
+
+    The writer holds an exclusive flock on its open segment from before it
+    appears under the ``.open`` name until after it is renamed to ``.seg``,
+    so the replayer can tell a live segment from one whose writer died.
+    """
+
+    def __init__(self, directory=None, segment_size=None, max_age=None, max_bytes=None):
+        self.directory = Path(directory or settings.GPS_INGEST_SPOOL_DIR)
+        self.segment_size = segment_size or getattr(settings, 'GPS_INGEST_SPOOL_SEGMENT_SIZE', 16 * 1024 * 1024)
+        self.max_age = max_age or getattr(settings, 'GPS_INGEST_SPOOL_MAX_AGE', 60.0)
+        self.max_bytes = max_bytes or getattr(settings, 'GPS_INGEST_SPOOL_MAX_BYTES', 1024 * 1024 * 1024)
+        self._lock = threading.Lock()
+        self.file = None
+        self.path = None
+        self.opened_at = 0.0
+        self.usage = 0
+        self.written = 0
+        self.refused = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def append(self, rows):
+        """Append unsaved RawGPSData instances, returning False if the spool is full"""
+        payload = b''.join(encode_row(raw_data) for raw_data in rows)
+        if not payload:
+            return True
+        with self._lock:
+            if self.file is not None and (
+                self.file.tell() >= self.segment_size or time.monotonic() - self.opened_at >= self.max_age
+            ):
+                self._close_segment()
+            if self.file is None:
+                # Only rescan the directory between segments; the replayer can only shrink it
+                self.usage = self.disk_usage()
+            if self.usage + len(payload) > self.max_bytes:
+                self.refused += len(rows)
+                logger.error(f'GPS spool {self.directory} is full, refusing {len(rows)} rows')
+                return False
+            if self.file is None:
+                self._open_segment()
+            self.file.write(payload)
+            self.file.flush()
+            self.usage += len(payload)
+            self.written += len(rows)
+        return True
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+    def disk_usage(self):
+        total = 0
+        for path in self.directory.iterdir():
+            if path.suffix in (OPEN_SUFFIX, CLOSED_SUFFIX):
+                try:
+                    total += path.stat().st_size
+                except FileNotFoundError:
+                    pass
+        return total
+
+    def _open_segment(self):
+        path = self.directory / f'{time.time_ns():020d}-{os.getpid()}{NEW_SUFFIX}'
+        file = open(path, 'ab')
+        try:
+            if FLOCK_AVAILABLE:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            # Only visible to the replayer once locked
+            self.path = path.rename(path.with_suffix(OPEN_SUFFIX))
+        except OSError:
+            file.close()
+            path.unlink(missing_ok=True)
+            raise
+        self.file = file
+        self.opened_at = time.monotonic()
+
+    def _close_segment(self):
+        if self.file is None:
+            return
+        try:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            # Rename while still holding the lock, so the segment is never an unlocked .open
+            self.path.rename(self.path.with_suffix(CLOSED_SUFFIX))
+        finally:
+            self.file.close()
+            self.file = None
+            self.path = None
+
+    def stats(self):
+        with self._lock:
+            return {'spooled': self.written, 'refused': self.refused}
+
+
+class SpoolReplayer:
+    """
+    Drains spool segments back into RawGPSData, oldest first, exactly once.
+
+    Each batch is inserted in the same transaction that advances the
+    segment's SpoolCheckpoint, and the checkpoint row is locked while the
+    batch is read, so a crash or a second replayer can neither skip nor
+    duplicate rows. Fully replayed closed segments are deleted. Open segments
+    are replayed up to their last complete line; an open segment whose flock
+    can be taken belonged to a receiver that died, and is treated as closed.
+    Without flock (non-POSIX systems) open segments are only ever replayed,
+    never removed.
+
+    Rows the database will not take, such as those of a device deleted since
+    they were spooled, are appended to ``<segment>.bad`` and skipped, so one
+    bad row never holds up the segments after it.
+    """
+
+    def __init__(self, directory=None, batch_size=None):
+        self.directory = Path(directory or settings.GPS_INGEST_SPOOL_DIR)
+        self.batch_size = batch_size or getattr(settings, 'GPS_INGEST_BATCH_SIZE', 500)
+        self.replayed = 0
+        self.corrupt = 0
+        self.quarantined = 0
+
+    def segments(self):
+        if not self.directory.exists():
+            return []
+        paths = [path for path in self.directory.iterdir() if path.suffix in (OPEN_SUFFIX, CLOSED_SUFFIX)]
+        return sorted(paths, key=lambda path: path.stem)
+
+    def is_closed(self, path):
+        """Whether no writer can append to the segment any more"""
+        if path.suffix == CLOSED_SUFFIX:
+            return True
+        if not FLOCK_AVAILABLE:
+            return False
+        try:
+            with open(path, 'rb') as segment:
+                try:
+                    fcntl.flock(segment.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+                fcntl.flock(segment.fileno(), fcntl.LOCK_UN)
+                return True
+        except FileNotFoundError:
+            return False
+
+    def replay_batch(self, path):
+        """
+        Replay up to ``batch_size`` rows from one segment.
+
+        Returns ``(rows inserted, segment finished, checkpoint advanced)``.
+        """
+        closed = self.is_closed(path)
+        with transaction.atomic():
+            checkpoint, _ = SpoolCheckpoint.objects.select_for_update().get_or_create(segment=path.stem)
+            try:
+                with open(path, 'rb') as segment:
+                    checkpoint_start = offset = checkpoint.offset
+                    segment.seek(offset)
+                    rows = []
+                    while len(rows) < self.batch_size:
+                        line = segment.readline()
+                        if not line.endswith(b'\n'):
+                            # A torn trailing line is only final once its writer has gone away
+                            if line and closed:
+                                logger.warning(f'Discarding {len(line)} byte partial row at the end of {path.name}')
+                                offset += len(line)
+                            break
+                        offset += len(line)
+                        try:
+                            rows.append((decode_row(line), line))
+                        except (KeyError, TypeError, ValueError) as e:
+                            self.corrupt += 1
+                            logger.error(f'Skipping corrupt row in {path.name}: {e}')
+                    at_end = not segment.read(1)
+            except FileNotFoundError:
+                # Renamed from .open to .seg since we listed the directory
+                return 0, False, False
+            inserted = self.insert(path, rows)
+            checkpoint.offset = offset
+            checkpoint.save(update_fields=['offset', 'updated_at'])
+        self.replayed += inserted
+        return inserted, closed and at_end, offset > checkpoint_start
+
+    def insert(self, path, rows):
+        """Insert ``(row, line)`` pairs, quarantining those that fail, and return the number inserted"""
+        # Foreign keys are checked at commit, too late to single out the row, so look for orphans first
+        device_ids = {row.device_id for row, line in rows if row.device_id is not None}
+        protocol_ids = {row.protocol_id for row, line in rows if row.protocol_id is not None}
+        devices = set(Device.objects.filter(id__in=device_ids).values_list('id', flat=True)) if device_ids else set()
+        protocols = (
+            set(Protocol.objects.filter(id__in=protocol_ids).values_list('id', flat=True)) if protocol_ids else set()
+        )
+        valid = []
+        for row, line in rows:
+            if row.device_id is not None and row.device_id not in devices:
+                self.quarantine(path, line, f'unknown device {row.device_id}')
+            elif row.protocol_id is not None and row.protocol_id not in protocols:
+                self.quarantine(path, line, f'unknown protocol {row.protocol_id}')
+            else:
+                valid.append((row, line))
+        try:
+            with transaction.atomic():
+                RawGPSData.objects.bulk_create([row for row, line in valid], batch_size=self.batch_size)
+            return len(valid)
+        except DatabaseError as e:
+            logger.warning(f'Batch from {path.name} rejected ({e}), replaying it row by row')
+        inserted = 0
+        for row, line in valid:
+            try:
+                with transaction.atomic():
+                    RawGPSData.objects.bulk_create([row])
+                inserted += 1
+            except DatabaseError as e:
+                self.quarantine(path, line, e)
+        return inserted
+
+    def quarantine(self, path, line, reason):
+        self.quarantined += 1
+        logger.error(f'Moving a row of {path.name} to {path.stem}{QUARANTINE_SUFFIX}: {reason}')
+        with open(path.with_suffix(QUARANTINE_SUFFIX), 'ab') as bad:
+            bad.write(line)
+
+    def finish(self, path):
+        path.unlink(missing_ok=True)
+        SpoolCheckpoint.objects.filter(segment=path.stem).delete()
+        logger.info(f'Replayed and removed spool segment {path.name}')
+
+    def replay(self):
+        """Replay everything currently in the spool, returning the number of rows inserted"""
+        close_old_connections()
+        total = 0
+        for path in self.segments():
+            while True:
+                count, finished, advanced = self.replay_batch(path)
+                total += count
+                if finished:
+                    self.finish(path)
+                    break
+                if not advanced:
+                    break
+        return total
@@ -0,0 +1,78 @@
+import threading
+import time
+
+
+class ReceiverStats:
+    """
+    Thread-safe throughput counters shared by the GPS receivers.
+
+    ``extra`` is an optional callable whose dict is merged into every
+    snapshot, e.g. counters owned by the write buffer.
+    """
+
+    def __init__(self, extra=None):
+        self.extra = extra
+        self._lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.connections = 0
+        self.open_connections = 0
+        self.packets = 0
+        self.bytes = 0
+        self.errors = 0
+        self._last_time = self.started_at
+        self._last_connections = 0
+        self._last_packets = 0
+
+    def connection_opened(self):
+        with self._lock:
+            self.connections += 1
+            self.open_connections += 1
+
+    def connection_closed(self):
+        with self._lock:
+            self.open_connections -= 1
+
+    def packet_received(self, size, count=1):
+        with self._lock:
+            self.packets += count
+            self.bytes += size
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self):
+        """Return totals plus connection and packet rates since the previous snapshot"""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = max(now - self._last_time, 1e-9)
+            snapshot = {
+                'uptime': now - self.started_at,
+                'connections': self.connections,
+                'open_connections': self.open_connections,
+                'packets': self.packets,
+                'bytes': self.bytes,
+                'errors': self.errors,
+                'connections_per_sec': (self.connections - self._last_connections) / elapsed,
+                'packets_per_sec': (self.packets - self._last_packets) / elapsed,
+            }
+            self._last_time = now
+            self._last_connections = self.connections
+            self._last_packets = self.packets
+        if self.extra is not None:
+            snapshot.update(self.extra())
+        return snapshot
+
+    @staticmethod
+    def format(snapshot):
+        line = (
+            f"conn/s={snapshot['connections_per_sec']:.1f} "
+            f"pkt/s={snapshot['packets_per_sec']:.1f} "
+            f"open={snapshot['open_connections']} "
+            f"total_conn={snapshot['connections']} "
+            f"total_pkt={snapshot['packets']} "
+            f"errors={snapshot['errors']}"
+        )
+        if 'duplicates' in snapshot:
+            line += f" duplicates={snapshot['duplicates']}"
+        return line
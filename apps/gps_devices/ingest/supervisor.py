@@ -0,0 +1,147 @@
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+SUMMED_FIELDS = (
+    'connections', 'open_connections', 'packets', 'bytes', 'errors',
+    'connections_per_sec', 'packets_per_sec', 'duplicates',
+)
+
+
+def _exit_on_signal(signum, frame):
+    raise SystemExit(0)
+
+
+def _worker_main(target, index, stats_queue):
+    # Let the worker's finally blocks (buffer flush) run on SIGTERM
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def report(snapshot):
+        snapshot['pid'] = os.getpid()
+        try:
+            stats_queue.put_nowait((index, snapshot))
+        except queue.Full:
+            pass
+
+    target(index, report)
+
+
+class ReceiverSupervisor:
+    """
+    Runs N forked receiver processes and keeps them alive.
+
+    Workers share the listening port through SO_REUSEPORT, so the kernel
+    spreads new connections across them. Each worker opens its own database
+    connection and write buffer after the fork. Workers push throughput
+    snapshots over a queue; the supervisor logs per-worker and fleet totals
+    and restarts any worker that dies.
+    """
+
+    def __init__(self, target, workers, report_interval=10, restart_delay=1.0):
+        self.target = target
+        self.workers = workers
+        self.report_interval = report_interval
+        self.restart_delay = restart_delay
+        self.context = multiprocessing.get_context('fork')
+        self.stats_queue = self.context.Queue(maxsize=workers * 100)
+        self.processes = {}
+        self.latest = {}
+        self.restarts = 0
+        self.last_report = time.monotonic()
+
+    def spawn(self, index):
+        # Never let children inherit the parent's database sockets
+        connections.close_all()
+        process = self.context.Process(
+            target=_worker_main,
+            args=(self.target, index, self.stats_queue),
+            name=f'gps-receiver-{index}',
+            daemon=False,
+        )
+        process.start()
+        self.processes[index] = process
+        logger.info(f'Started GPS receiver worker {index} (pid {process.pid})')
+        return process
+
+    def start(self):
+        for index in range(self.workers):
+            self.spawn(index)
+
+    def poll(self, timeout=1.0):
+        """Collect stats, restart dead workers and log an aggregate report when due"""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                index, snapshot = self.stats_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            self.latest[index] = snapshot
+
+        for index, process in list(self.processes.items()):
+            if not process.is_alive():
+                process.join()
+                logger.error(f'GPS receiver worker {index} (pid {process.pid}) exited with code {process.exitcode}, restarting')
+                self.latest.pop(index, None)
+                self.restarts += 1
+                time.sleep(self.restart_delay)
+                self.spawn(index)
+
+        if time.monotonic() - self.last_report >= self.report_interval:
+            self.last_report = time.monotonic()
+            self.log_report()
+
+    def aggregate(self):
+        totals = {field: 0 for field in SUMMED_FIELDS}
+        for snapshot in self.latest.values():
+            for field in SUMMED_FIELDS:
+                totals[field] += snapshot.get(field, 0)
+        totals['workers'] = len(self.processes)
+        totals['reporting_workers'] = len(self.latest)
+        totals['restarts'] = self.restarts
+        return totals
+
+    def log_report(self):
+        for index, snapshot in sorted(self.latest.items()):
+            logger.info(
+                f"worker {index} pid={snapshot.get('pid')}: "
+                f"conn/s={snapshot['connections_per_sec']:.1f} pkt/s={snapshot['packets_per_sec']:.1f} "
+                f"open={snapshot['open_connections']}"
+            )
+        totals = self.aggregate()
+        logger.info(
+            f"GPS receiver fleet: workers={totals['workers']} conn/s={totals['connections_per_sec']:.1f} "
+            f"pkt/s={totals['packets_per_sec']:.1f} open={totals['open_connections']} "
+            f"total_pkt={totals['packets']} duplicates={totals['duplicates']} errors={totals['errors']} "
+            f"restarts={totals['restarts']}"
+        )
+
+    def stop(self, timeout=30):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+        self.processes.clear()
+
+    def run(self):
+        self.start()
+        try:
+            while True:
+                self.poll()
+        except KeyboardInterrupt:
+            logger.info('Stopping GPS receiver workers')
+        finally:
+            self.stop()
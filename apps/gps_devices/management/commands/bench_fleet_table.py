@@ -0,0 +1,47 @@
+import os
+import random
+import tempfile
+import time
+from django.core.management.base import BaseCommand, CommandError
+from apps.gps_devices.ingest.fleet_table import FleetPositionTable
+from apps.gps_devices.models import Device
+
+POSITION_COLUMNS = ('id', 'last_location_lat', 'last_location_lng', 'last_location_time', 'battery_level', 'status')
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark last-position reads per second from the fleet table versus the ORM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reads', type=int, default=5000, help='Reads per path')
+        parser.add_argument('--batch', type=int, default=100, help='Devices per read in the fleet map case')
+
+    def handle(self, *args, **options):
+        device_ids = list(Device.objects.values_list('id', flat=True))
+        if not device_ids:
+            raise CommandError('There are no devices to read')
+        reads = options['reads']
+        batch = min(options['batch'], len(device_ids))
+
+        with tempfile.TemporaryDirectory() as directory:
+            table = FleetPositionTable(os.path.join(directory, 'fleet.bin'), slots=max(device_ids) + 1)
+            table.seed()
+            try:
+                cases = [
+                    ('single device', lambda: random.choice(device_ids), table.read,
+                     lambda pk: Device.objects.filter(pk=pk).values_list(*POSITION_COLUMNS).first()),
+                    (f'fleet map ({batch})', lambda: random.sample(device_ids, batch), table.get_many,
+                     lambda pks: list(Device.objects.filter(pk__in=pks).values_list(*POSITION_COLUMNS))),
+                ]
+                self.stdout.write(f'{"read":<20} {"table reads/s":>16} {"orm reads/s":>16}')
+                for name, pick, from_table, from_orm in cases:
+                    keys = [pick() for _ in range(reads)]
+                    self.stdout.write(f'{name:<20} {self.rate(from_table, keys):>16.0f} {self.rate(from_orm, keys):>16.0f}')
+            finally:
+                table.close()
+
+    def rate(self, read, keys):
+        started = time.perf_counter()
+        for key in keys:
+            read(key)
+        return len(keys) / max(time.perf_counter() - started, 1e-9)
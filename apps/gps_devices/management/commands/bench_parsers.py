@@ -0,0 +1,43 @@
+import time
+from django.core.management.base import BaseCommand
+from apps.gps_devices.models import Protocol
+from apps.gps_devices.parsers.registry import BUILTIN_FORMATS, compile_format
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark parse time per message for every registered message format'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000, help='Messages parsed per format')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        formats = [(name, spec) for name, spec in BUILTIN_FORMATS.items()]
+        for protocol in Protocol.objects.filter(is_active=True).exclude(message_format={}):
+            formats.append((protocol.name, protocol.message_format))
+
+        self.stdout.write(f'{"format":<30} {"compiled us/msg":>16} {"uncached us/msg":>16}')
+        for name, spec in formats:
+            sample = spec.get('sample') if isinstance(spec, dict) else None
+            if not sample:
+                self.stdout.write(f'{name:<30} {"(no sample)":>16}')
+                continue
+            try:
+                decoder = compile_format(spec)
+                decoder(sample)
+            except ValueError as e:
+                self.stdout.write(self.style.ERROR(f'{name:<30} invalid format: {e}'))
+                continue
+
+            started = time.perf_counter()
+            for _ in range(iterations):
+                decoder(sample)
+            compiled = (time.perf_counter() - started) / iterations * 1e6
+
+            # Baseline: compile the format for every message, as if nothing were cached
+            started = time.perf_counter()
+            for _ in range(iterations):
+                compile_format(spec)(sample)
+            uncached = (time.perf_counter() - started) / iterations * 1e6
+
+            self.stdout.write(f'{name:<30} {compiled:>16.2f} {uncached:>16.2f}')
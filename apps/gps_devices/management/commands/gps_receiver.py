@@ -1,29 +1,107 @@
+import json
 import socket
 import threading
+import time
 import logging
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
-from apps.gps_devices.models import RawGPSData, Device, Protocol
+from apps.gps_devices.models import RawGPSData
+from apps.gps_devices.ingest.buffer import get_raw_data_buffer
+from apps.gps_devices.ingest.receiver import AsyncGPSReceiver
+from apps.gps_devices.ingest.resolver import get_device_resolver
+from apps.gps_devices.parsers.binary import detect_decoder
+from apps.gps_devices.ingest.stats import ReceiverStats
+from apps.gps_devices.ingest.supervisor import ReceiverSupervisor
 
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
-    help = 'Start GPS data receiver on port 5000'
+    help = 'Start GPS data receiver (asyncio by default, or thread-per-connection)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='0.0.0.0', help='Address to bind')
+        parser.add_argument('--port', type=int, default=5000, help='TCP port to listen on')
+        parser.add_argument(
+            '--mode',
+            choices=['async', 'threaded'],
+            default='async',
+            help='async keeps device connections open on one event loop; threaded spawns a thread per connection',
+        )
+        parser.add_argument('--idle-timeout', type=int, default=600, help='Seconds before an idle connection is closed (async mode)')
+        parser.add_argument('--report-interval', type=int, default=10, help='Seconds between throughput reports')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Fork this many receiver processes sharing the port via SO_REUSEPORT',
+        )
 
     def handle(self, *args, **options):
-        self.stdout.write('Starting GPS receiver on port 5000...')
-        server = GPSReceiver()
-        server.start()
+        host, port, mode, workers = options['host'], options['port'], options['mode'], options['workers']
+        self.stdout.write(f'Starting GPS receiver on {host}:{port} ({mode} mode, {workers} worker(s))...')
+        if workers > 1:
+            if not hasattr(socket, 'SO_REUSEPORT'):
+                raise CommandError('--workers requires SO_REUSEPORT support')
+
+            def worker(index, report):
+                self.run_receiver(options, reuse_port=True, report=report)
+
+            ReceiverSupervisor(worker, workers, report_interval=options['report_interval']).run()
+        else:
+            self.run_receiver(options)
+
+    def run_receiver(self, options, reuse_port=False, report=None):
+        """Run one receiver process with its own resolver, write buffer and DB connection"""
+        host, port = options['host'], options['port']
+        buffer = get_raw_data_buffer()
+        stats = ReceiverStats(extra=lambda: {'duplicates': buffer.stats()['duplicates']})
+        receiver = GPSReceiver(host=host, port=port, report_interval=options['report_interval'],
+                               reuse_port=reuse_port, report=report, stats=stats)
+        get_device_resolver().load()
+        try:
+            if options['mode'] == 'async':
+                AsyncGPSReceiver(
+                    receiver.save_raw_data,
+                    host=host,
+                    port=port,
+                    idle_timeout=options['idle_timeout'],
+                    report_interval=options['report_interval'],
+                    stats=receiver.stats,
+                    reuse_port=reuse_port,
+                    report=report,
+                ).run()
+            else:
+                receiver.start()
+        finally:
+            # Flush queued packets before the process exits
+            buffer.stop()
+            logger.info(f'Raw GPS data buffer stats: {buffer.stats()}')
 
 class GPSReceiver:
-    def __init__(self, host='0.0.0.0', port=5000):
+    def __init__(self, host='0.0.0.0', port=5000, report_interval=10, reuse_port=False, report=None,
+                 stats=None):
         self.host = host
         self.port = port
         self.server_socket = None
+        self.report_interval = report_interval
+        self.reuse_port = reuse_port
+        self.report = report or self.log_stats
+        self.stats = stats or ReceiverStats()
+
+    def report_stats(self):
+        while True:
+            time.sleep(self.report_interval)
+            self.report(self.stats.snapshot())
+
+    def log_stats(self, snapshot):
+        logger.info(f'GPS receiver stats: {ReceiverStats.format(snapshot)}')
 
     def start(self):
+        threading.Thread(target=self.report_stats, daemon=True).start()
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.server_socket.bind((self.host, self.port))
         self.server_socket.listen(5)
         logger.info(f'GPS receiver listening on {self.host}:{self.port}')
@@ -32,6 +110,7 @@ class GPSReceiver:
             while True:
                 client_socket, address = self.server_socket.accept()
                 logger.info(f'Connection from {address}')
+                self.stats.connection_opened()
                 client_thread = threading.Thread(target=self.handle_client, args=(client_socket, address))
                 client_thread.start()
         except KeyboardInterrupt:
@@ -42,34 +121,49 @@ class GPSReceiver:
 
     def handle_client(self, client_socket, address):
         try:
-            data = client_socket.recv(1024).decode('utf-8', errors='ignore').strip()
+            payload = client_socket.recv(1024)
+            decoder = detect_decoder(payload)
+            if decoder is not None:
+                self.handle_binary_client(client_socket, address, decoder, payload)
+                return
+            data = payload.decode('utf-8', errors='ignore').strip()
             if data:
                 logger.info(f'Received data from {address}: {data}')
+                self.stats.packet_received(len(data))
                 self.save_raw_data(data, address[0])
         except Exception as e:
+            self.stats.error()
             logger.error(f'Error handling client {address}: {e}')
         finally:
+            self.stats.connection_closed()
             client_socket.close()
 
+    def handle_binary_client(self, client_socket, address, decoder, payload):
+        """Binary trackers expect ACKs and keep the session open, so read until they hang up"""
+        client_socket.settimeout(600)
+        while payload:
+            records, ack = decoder.feed(payload)
+            self.stats.packet_received(len(payload), count=len(records))
+            accepted = [self.save_raw_data(json.dumps(record, separators=(',', ':')), address[0]) for record in records]
+            if not all(accepted):
+                # Without the ACK the device keeps the records and resends them when it reconnects
+                logger.warning(f'Closing {address} unacknowledged: {accepted.count(False)} record(s) were not accepted')
+                return
+            if ack:
+                client_socket.sendall(ack)
+            payload = client_socket.recv(4096)
+
     def save_raw_data(self, data, ip_address):
+        """Queue a packet for the batched writer, returning False if it was not accepted"""
         try:
-            # Get or create a default protocol
-            protocol, created = Protocol.objects.get_or_create(
-                name='Unknown TCP',
-                defaults={
-                    'protocol_type': 'tcp',
-                    'description': 'Default protocol for unknown GPS devices',
-                    'default_port': 5000,
-                }
-            )
-
-            # Save raw data without device for now
-            raw_data = RawGPSData.objects.create(
-                device=None,
-                protocol=protocol,
+            # Attribute the packet from the in-process identity cache
+            device_id, protocol_id = get_device_resolver().resolve_packet(data, self.port)
+            return get_raw_data_buffer().add(RawGPSData(
+                device_id=device_id,
+                protocol_id=protocol_id,
                 raw_data=data,
                 ip_address=ip_address,
-            )
-            logger.info(f'Saved raw GPS data: {raw_data.id}')
+            ))
         except Exception as e:
-            logger.error(f'Error saving raw data: {e}')
\ No newline at end of file
+            logger.error(f'Error saving raw data: {e}')
+            return False
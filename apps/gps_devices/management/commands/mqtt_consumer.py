@@ -0,0 +1,73 @@
+import logging
+import socket
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.gps_devices.ingest.buffer import get_raw_data_buffer
+from apps.gps_devices.ingest.mqtt_consumer import PAHO_AVAILABLE, MQTTConsumer
+from apps.gps_devices.ingest.resolver import get_device_resolver
+from apps.gps_devices.ingest.stats import ReceiverStats
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Consume GPS data for the whole MQTT fleet through wildcard subscriptions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--broker', default=None, help='Broker host (defaults to GPS_MQTT_BROKER)')
+        parser.add_argument('--port', type=int, default=None, help='Broker port (defaults to GPS_MQTT_PORT)')
+        parser.add_argument(
+            '--topic',
+            action='append',
+            dest='topics',
+            help='Topic filter to subscribe to, may be repeated (defaults to GPS_MQTT_TOPICS)',
+        )
+        parser.add_argument('--qos', type=int, choices=[0, 1, 2], default=1)
+        parser.add_argument('--clients', type=int, default=1, help='Number of client connections sharing the topics')
+        parser.add_argument(
+            '--group',
+            default='gps',
+            help='Shared-subscription group used when --clients is greater than 1',
+        )
+        parser.add_argument('--report-interval', type=int, default=10, help='Seconds between throughput reports')
+
+    def handle(self, *args, **options):
+        if not PAHO_AVAILABLE:
+            raise CommandError('paho-mqtt is not installed')
+        clients = options['clients']
+        buffer = get_raw_data_buffer()
+        get_device_resolver().load()
+        stats = ReceiverStats(extra=lambda: {'duplicates': buffer.stats()['duplicates']})
+        consumers = [
+            MQTTConsumer(
+                broker=options['broker'],
+                port=options['port'],
+                topics=options['topics'],
+                qos=options['qos'],
+                client_id=f'gps-mqtt-{socket.gethostname()}-{index}',
+                group=options['group'] if clients > 1 else None,
+                username=settings.GPS_MQTT_USERNAME or None,
+                password=settings.GPS_MQTT_PASSWORD or None,
+                stats=stats,
+                buffer=buffer,
+            )
+            for index in range(clients)
+        ]
+        self.stdout.write(
+            f'Consuming {", ".join(consumers[0].topics)} from {consumers[0].broker}:{consumers[0].port} '
+            f'with {clients} client(s)...'
+        )
+        for consumer in consumers:
+            consumer.start()
+        try:
+            while True:
+                time.sleep(options['report_interval'])
+                logger.info(f'MQTT consumer stats: {ReceiverStats.format(stats.snapshot())}')
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping MQTT consumer')
+        finally:
+            for consumer in consumers:
+                consumer.stop()
+            buffer.stop()
+            logger.info(f'Raw GPS data buffer stats: {buffer.stats()}')
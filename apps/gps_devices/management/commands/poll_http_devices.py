@@ -0,0 +1,40 @@
+import logging
+from django.core.management.base import BaseCommand
+from apps.gps_devices.ingest.buffer import get_raw_data_buffer
+from apps.gps_devices.ingest.http_poller import HTTPPoller
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Poll pull-based HTTP devices on their protocol update frequency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=64, help='Maximum requests in flight')
+        parser.add_argument('--per-host', type=int, default=4, help='Maximum requests in flight per host')
+        parser.add_argument('--connect-timeout', type=float, default=5.0)
+        parser.add_argument('--read-timeout', type=float, default=10.0)
+        parser.add_argument('--jitter', type=float, default=0.1, help='Fraction of the interval to randomise by')
+        parser.add_argument('--refresh-interval', type=float, default=60.0, help='Seconds between device list reloads')
+        parser.add_argument('--report-interval', type=float, default=60.0, help='Seconds between stats reports')
+
+    def handle(self, *args, **options):
+        buffer = get_raw_data_buffer()
+        poller = HTTPPoller(
+            concurrency=options['concurrency'],
+            per_host=options['per_host'],
+            connect_timeout=options['connect_timeout'],
+            read_timeout=options['read_timeout'],
+            jitter=options['jitter'],
+            refresh_interval=options['refresh_interval'],
+            report_interval=options['report_interval'],
+            buffer=buffer,
+        )
+        self.stdout.write('Starting HTTP device poller...')
+        try:
+            poller.run()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping HTTP device poller')
+        finally:
+            buffer.stop()
+            logger.info(f'Raw GPS data buffer stats: {buffer.stats()}')
@@ -0,0 +1,40 @@
+import logging
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.gps_devices.ingest.spool import SpoolReplayer
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Load raw GPS packets spooled to disk by the receiver back into RawGPSData (exactly once, in order)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None, help='Spool directory (defaults to GPS_INGEST_SPOOL_DIR)')
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows inserted per transaction')
+        parser.add_argument('--once', action='store_true', help='Exit once the spool is drained')
+        parser.add_argument('--sleep', type=float, default=5.0, help='Seconds to wait when the spool is empty')
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or getattr(settings, 'GPS_INGEST_SPOOL_DIR', None)
+        if not directory:
+            raise CommandError('No spool directory configured')
+        replayer = SpoolReplayer(directory, batch_size=options['batch_size'])
+        try:
+            while True:
+                started = time.monotonic()
+                count = replayer.replay()
+                if count:
+                    elapsed = max(time.monotonic() - started, 1e-9)
+                    logger.info(f'Replayed {count} spooled raw rows ({count / elapsed:.0f} rows/sec)')
+                if options['once']:
+                    break
+                if not count:
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping spool replay')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Replayed {replayer.replayed} spooled raw rows ({replayer.corrupt} corrupt rows skipped)'
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.gps_devices.ingest.fleet_table import get_fleet_table
+
+
+class Command(BaseCommand):
+    help = 'Load every device into the shared fleet position table (run after a reboot clears /dev/shm)'
+
+    def handle(self, *args, **options):
+        table = get_fleet_table()
+        if table is None:
+            raise CommandError('GPS_FLEET_TABLE_PATH is not set')
+        stored = table.seed()
+        self.stdout.write(self.style.SUCCESS(f'Stored {stored} devices in {table.path} ({table.slots} slots)'))
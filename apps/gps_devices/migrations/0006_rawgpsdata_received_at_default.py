@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:06
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gps_devices', '0005_alter_rawgpsdata_device_alter_rawgpsdata_protocol'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rawgpsdata',
+            name='received_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='When the packet reached the receiver'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gps_devices', '0006_rawgpsdata_received_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpoolCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('segment', models.CharField(help_text='Spool segment name', max_length=64, unique=True)),
+                ('offset', models.BigIntegerField(default=0, help_text='Bytes of the segment already replayed')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Spool Checkpoint',
+                'verbose_name_plural': 'Spool Checkpoints',
+            },
+        ),
+    ]
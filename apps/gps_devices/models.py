@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from apps.products.models import Product
 
 
@@ -159,7 +160,7 @@ class Device(models.Model):
         self.last_location_lat = lat
         self.last_location_lng = lng
         self.last_location_time = timestamp or timezone.now()
-        self.save()
+        self.save(update_fields=['last_location_lat', 'last_location_lng', 'last_location_time', 'updated_at'])
 
     class Meta:
         verbose_name = 'GPS Device'
@@ -174,7 +175,7 @@ class RawGPSData(models.Model):
     device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='raw_data', null=True, blank=True)
     protocol = models.ForeignKey(Protocol, on_delete=models.CASCADE, null=True, blank=True)
     raw_data = models.TextField(help_text="Raw data received from the device")
-    received_at = models.DateTimeField(auto_now_add=True)
+    received_at = models.DateTimeField(default=timezone.now, help_text="When the packet reached the receiver")
     ip_address = models.GenericIPAddressField(null=True, blank=True, help_text="Source IP address")
     processed = models.BooleanField(default=False, help_text="Whether this data has been processed")
     processed_at = models.DateTimeField(null=True, blank=True)
@@ -207,3 +208,22 @@ class RawGPSData(models.Model):
             models.Index(fields=['device', '-received_at']),
             models.Index(fields=['processed', 'received_at']),
         ]
+
+
+class SpoolCheckpoint(models.Model):
+    """
+    Replay position in a receiver spool segment.
+
+    The offset is advanced in the same transaction that inserts the replayed
+    RawGPSData rows, so a segment is never replayed twice.
+    """
+    segment = models.CharField(max_length=64, unique=True, help_text="Spool segment name")
+    offset = models.BigIntegerField(default=0, help_text="Bytes of the segment already replayed")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.segment} @ {self.offset}"
+
+    class Meta:
+        verbose_name = 'Spool Checkpoint'
+        verbose_name_plural = 'Spool Checkpoints'
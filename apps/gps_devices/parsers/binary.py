@@ -0,0 +1,312 @@
+import logging
+import struct
+from datetime import datetime, timezone as dt_timezone
+
+logger = logging.getLogger(__name__)
+
+
+class FrameError(ValueError):
+    pass
+
+
+def _crc16_table(poly):
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ poly if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC_X25_TABLE = _crc16_table(0x8408)
+CRC_ARC_TABLE = _crc16_table(0xA001)
+
+
+def crc16_x25(data):
+    """CRC-ITU used by GT06 frames"""
+    crc = 0xFFFF
+    table = CRC_X25_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc ^ 0xFFFF
+
+
+def crc16_arc(data):
+    """CRC-16/IBM used by Teltonika AVL packets"""
+    crc = 0
+    table = CRC_ARC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+class FrameDecoder:
+    """
+    Stateful decoder for one device connection.
+
+    ``feed`` appends received bytes to an internal ``bytearray`` and parses
+    every complete frame through a ``memoryview`` with ``struct.unpack_from``,
+    so payloads are never copied before decoding. It returns the decoded
+    location records and the bytes to send back to the device.
+    """
+
+    name = None
+    max_buffer = 64 * 1024
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.imei = None
+
+    def feed(self, data):
+        self.buffer += data
+        records = []
+        acks = []
+        with memoryview(self.buffer) as view:
+            consumed = self.parse(view, records, acks)
+        if consumed:
+            del self.buffer[:consumed]
+        if len(self.buffer) > self.max_buffer:
+            self.buffer.clear()
+            raise FrameError(f'{self.name} frame exceeds {self.max_buffer} bytes')
+        return records, b''.join(acks)
+
+    def parse(self, view, records, acks):
+        """Parse complete frames from ``view``, returning the number of bytes consumed"""
+        raise NotImplementedError
+
+
+class GT06Decoder(FrameDecoder):
+    """
+    Concox GT06 frames: ``78 78 len proto payload serial crc 0D 0A``
+    (or ``79 79`` with a two byte length).
+    """
+
+    name = 'gt06'
+
+    LOGIN = 0x01
+    LOCATION = 0x12
+    HEARTBEAT = 0x13
+    ALARM = 0x16
+    LOCATION_4G = 0x22
+    LOCATION_TYPES = (LOCATION, ALARM, LOCATION_4G)
+    ACK_TYPES = (LOGIN, HEARTBEAT, ALARM)
+
+    LONG_HEADER = struct.Struct('>2sH')
+    SERIAL = struct.Struct('>H')
+    GPS = struct.Struct('>6BBIIBH')
+
+    def parse(self, view, records, acks):
+        offset = 0
+        size = len(view)
+        while size - offset >= 5:
+            first, second = view[offset], view[offset + 1]
+            if first == second == 0x78:
+                length = view[offset + 2]
+                header = 3
+            elif first == second == 0x79:
+                length = self.LONG_HEADER.unpack_from(view, offset)[1]
+                header = 4
+            else:
+                # Resynchronise on the next start marker
+                offset += 1
+                continue
+            end = offset + header + length + 2
+            if end > size:
+                break
+            if view[end - 2] != 0x0D or view[end - 1] != 0x0A:
+                offset += 1
+                continue
+            body_start = offset + 2
+            crc_at = end - 4
+            expected = self.SERIAL.unpack_from(view, crc_at)[0]
+            if crc16_x25(view[body_start:crc_at]) != expected:
+                logger.warning('GT06 frame with bad CRC dropped')
+                offset = end
+                continue
+            protocol = view[offset + header]
+            serial = self.SERIAL.unpack_from(view, crc_at - 2)[0]
+            content_start = offset + header + 1
+            self.handle(protocol, view, content_start, crc_at - 2, records)
+            if protocol in self.ACK_TYPES:
+                acks.append(self.ack(protocol, serial))
+            offset = end
+        return offset
+
+    def handle(self, protocol, view, start, end, records):
+        if protocol == self.LOGIN:
+            self.imei = bytes(view[start:start + 8]).hex()[-15:]
+        elif protocol in self.LOCATION_TYPES and end - start >= self.GPS.size:
+            (year, month, day, hour, minute, second, satellites,
+             raw_lat, raw_lng, speed, course_status) = self.GPS.unpack_from(view, start)
+            latitude = raw_lat / 1800000.0
+            longitude = raw_lng / 1800000.0
+            if not course_status & 0x0400:
+                latitude = -latitude
+            if course_status & 0x0800:
+                longitude = -longitude
+            try:
+                timestamp = datetime(2000 + year, month, day, hour, minute, second, tzinfo=dt_timezone.utc)
+            except ValueError:
+                # The frame itself is intact, so only its record is lost
+                logger.warning('GT06 frame with invalid date dropped')
+                return
+            records.append({
+                'imei': self.imei,
+                'protocol': self.name,
+                'latitude': round(latitude, 6),
+                'longitude': round(longitude, 6),
+                'speed': speed,
+                'heading': course_status & 0x03FF,
+                'timestamp': timestamp.isoformat(),
+                'satellites': satellites & 0x0F,
+                'gps_fixed': bool(course_status & 0x1000),
+            })
+
+    def ack(self, protocol, serial):
+        body = bytes((0x05, protocol)) + self.SERIAL.pack(serial)
+        return b'\x78\x78' + body + self.SERIAL.pack(crc16_x25(body)) + b'\r\n'
+
+
+class TeltonikaDecoder(FrameDecoder):
+    """
+    Teltonika Codec 8 over TCP.
+
+    The device first sends its IMEI (two byte length + ASCII) and waits for
+    ``0x01``. Every AVL packet after that is acknowledged with the number of
+    records accepted as a four byte integer.
+    """
+
+    name = 'teltonika'
+
+    CODEC_8 = 0x08
+    IO_BATTERY_LEVEL = 113
+    IO_GSM_SIGNAL = 21
+
+    IMEI_HEADER = struct.Struct('>H')
+    PACKET_HEADER = struct.Struct('>IIBB')
+    RECORD = struct.Struct('>QBiihHBH')
+    IO_HEADER = struct.Struct('>BB')
+    IO_VALUE_SIZES = (1, 2, 4, 8)
+    COUNT = struct.Struct('>I')
+
+    def parse(self, view, records, acks):
+        offset = 0
+        size = len(view)
+        if self.imei is None:
+            if size < 2:
+                return 0
+            length = self.IMEI_HEADER.unpack_from(view, 0)[0]
+            if length > 32:
+                raise FrameError('Invalid Teltonika IMEI header')
+            if size < 2 + length:
+                return 0
+            self.imei = bytes(view[2:2 + length]).decode('ascii', errors='ignore')
+            acks.append(b'\x01')
+            offset = 2 + length
+
+        while size - offset >= self.PACKET_HEADER.size:
+            preamble, data_length, codec, count = self.PACKET_HEADER.unpack_from(view, offset)
+            if preamble != 0:
+                raise FrameError('Invalid Teltonika preamble')
+            end = offset + 8 + data_length + 4
+            if end > size:
+                break
+            data_start = offset + 8
+            data_end = data_start + data_length
+            crc = self.COUNT.unpack_from(view, data_end)[0]
+            if crc16_arc(view[data_start:data_end]) != crc:
+                logger.warning('Teltonika AVL packet with bad CRC dropped')
+                acks.append(self.COUNT.pack(0))
+                offset = end
+                continue
+            try:
+                packet = self.parse_packet(view, codec, count, data_start, data_end)
+            except FrameError as e:
+                # The packet is framed and checksummed, so the stream is still in sync
+                logger.warning(f'Teltonika AVL packet dropped: {e}')
+                acks.append(self.COUNT.pack(0))
+                offset = end
+                continue
+            records.extend(packet)
+            acks.append(self.COUNT.pack(count))
+            offset = end
+        return offset
+
+    def parse_packet(self, view, codec, count, start, end):
+        """Decode the records of the AVL data at ``view[start:end]``, all or none"""
+        if codec != self.CODEC_8:
+            raise FrameError(f'Unsupported Teltonika codec 0x{codec:02x}')
+        if end - start < 3 or view[end - 1] != count:
+            raise FrameError('Teltonika record counts do not match')
+        packet = []
+        position = start + 2
+        for _ in range(count):
+            position = self.parse_record(view, position, end - 1, packet)
+        if position != end - 1:
+            raise FrameError('Teltonika AVL data has trailing bytes')
+        return packet
+
+    @staticmethod
+    def need(position, size, limit):
+        if position + size > limit:
+            raise FrameError('Teltonika AVL record overruns its packet')
+
+    def parse_record(self, view, position, limit, records):
+        """Decode the record at ``position``, which must end by ``limit``, returning the position after it"""
+        self.need(position, self.RECORD.size + self.IO_HEADER.size, limit)
+        (timestamp_ms, priority, raw_lng, raw_lat, altitude,
+         angle, satellites, speed) = self.RECORD.unpack_from(view, position)
+        position += self.RECORD.size
+        io = {}
+        event_id, total = self.IO_HEADER.unpack_from(view, position)
+        position += 2
+        for value_size in self.IO_VALUE_SIZES:
+            self.need(position, 1, limit)
+            count = view[position]
+            position += 1
+            self.need(position, count * (1 + value_size), limit)
+            for _ in range(count):
+                io_id = view[position]
+                io[io_id] = int.from_bytes(view[position + 1:position + 1 + value_size], 'big')
+                position += 1 + value_size
+        try:
+            timestamp = datetime.fromtimestamp(timestamp_ms / 1000.0, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise FrameError('Teltonika record with invalid timestamp')
+        record = {
+            'imei': self.imei,
+            'protocol': self.name,
+            'latitude': raw_lat / 10000000.0,
+            'longitude': raw_lng / 10000000.0,
+            'altitude': altitude,
+            'heading': angle,
+            'speed': speed,
+            'satellites': satellites,
+            'priority': priority,
+            'event_io': event_id,
+            'timestamp': timestamp.isoformat(),
+        }
+        if self.IO_BATTERY_LEVEL in io:
+            record['battery_level'] = min(io[self.IO_BATTERY_LEVEL], 100)
+        if self.IO_GSM_SIGNAL in io:
+            record['signal_strength'] = min(io[self.IO_GSM_SIGNAL] * 20, 100)
+        if io:
+            record['io'] = {str(key): value for key, value in io.items()}
+        records.append(record)
+        return position
+
+
+DECODERS = {
+    GT06Decoder.name: GT06Decoder,
+    TeltonikaDecoder.name: TeltonikaDecoder,
+}
+
+
+def detect_decoder(data):
+    """Pick a binary decoder from the first bytes of a connection, or None for text"""
+    if data[:2] in (b'\x78\x78', b'\x79\x79'):
+        return GT06Decoder()
+    if len(data) >= 2 and data[0] == 0x00 and 0 < data[1] <= 17 and data[2:2 + data[1]].isdigit():
+        return TeltonikaDecoder()
+    return None
@@ -0,0 +1,263 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.cache import cache
+
+from ..ingest.resolver import CONFIG_VERSION_KEY
+from ..models import Protocol
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CSV_FIELDS = ('identifier', 'latitude', 'longitude', 'speed', 'heading', 'timestamp')
+
+
+class ParseError(ValueError):
+    pass
+
+
+class Decoder:
+    """
+    Base class for compiled message decoders.
+
+    ``message_format`` keys shared by every decoder type:
+
+    * ``timestamp_format`` - strptime format for the ``timestamp`` field (UTC)
+    * ``scale`` - ``{"field": factor}`` multipliers, e.g. knots to km/h
+    * ``sample`` - an example message, used by the parser benchmark
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.sample = spec.get('sample')
+        self.timestamp_format = spec.get('timestamp_format')
+        self.scale = tuple((field, float(factor)) for field, factor in spec.get('scale', {}).items())
+
+    def __call__(self, text):
+        values = self.decode(text)
+        if self.timestamp_format and values.get('timestamp'):
+            try:
+                values['timestamp'] = datetime.strptime(
+                    values['timestamp'], self.timestamp_format
+                ).replace(tzinfo=dt_timezone.utc).isoformat()
+            except ValueError:
+                raise ParseError(f"Invalid timestamp: {values['timestamp']!r}")
+        for field, factor in self.scale:
+            if values.get(field) not in (None, ''):
+                try:
+                    values[field] = float(values[field]) * factor
+                except (TypeError, ValueError):
+                    raise ParseError(f'Invalid number for {field}: {values[field]!r}')
+        return values
+
+    def decode(self, text):
+        raise NotImplementedError
+
+
+class DelimitedDecoder(Decoder):
+    """
+    ``{"type": "delimited", "delimiter": ",", "strip": "$#", "fields": [...]}``
+
+    ``fields`` lists the field name for each column; use ``null`` to skip a
+    column.
+    """
+
+    def __init__(self, spec):
+        super().__init__(spec)
+        self.delimiter = spec.get('delimiter', ',')
+        self.strip = spec.get('strip', '')
+        self.columns = tuple((index, name) for index, name in enumerate(spec['fields']) if name)
+        self.min_columns = spec.get('min_fields', 3)
+
+    def decode(self, text):
+        parts = text.strip().strip(self.strip).split(self.delimiter)
+        if len(parts) < self.min_columns:
+            raise ParseError('Unrecognised payload format')
+        size = len(parts)
+        values = {}
+        for index, name in self.columns:
+            if index < size:
+                value = parts[index].strip()
+                if value:
+                    values[name] = value
+        return values
+
+
+class RegexDecoder(Decoder):
+    """``{"type": "regex", "pattern": "...(?P<latitude>...)..."}`` using named groups"""
+
+    def __init__(self, spec):
+        super().__init__(spec)
+        try:
+            self.pattern = re.compile(spec['pattern'])
+        except re.error as e:
+            raise ValueError(f'Invalid pattern: {e}')
+
+    def decode(self, text):
+        match = self.pattern.search(text)
+        if not match:
+            raise ParseError('Payload does not match protocol pattern')
+        return {name: value for name, value in match.groupdict().items() if value not in (None, '')}
+
+
+class JSONDecoder(Decoder):
+    """
+    ``{"type": "json", "fields": {"latitude": "pos.lat", ...}}``
+
+    Maps LocationData field names to (dotted) keys in the device payload.
+    Without ``fields`` the payload keys are used as-is.
+    """
+
+    def __init__(self, spec):
+        super().__init__(spec)
+        self.paths = tuple((name, tuple(path.split('.'))) for name, path in spec.get('fields', {}).items())
+
+    def decode(self, text):
+        try:
+            payload = json.loads(text)
+        except ValueError as e:
+            raise ParseError(f'Invalid JSON payload: {e}')
+        if not isinstance(payload, dict):
+            raise ParseError('JSON payload must be an object')
+        if not self.paths:
+            values = payload
+        else:
+            values = {}
+            for name, path in self.paths:
+                value = payload
+                for key in path:
+                    value = value.get(key) if isinstance(value, dict) else None
+                if value is not None:
+                    values[name] = value
+        if 'identifier' not in values:
+            values['identifier'] = values.get('imei') or values.get('device_id')
+        return values
+
+
+class DefaultDecoder(Decoder):
+    """Fallback for protocols without a declared format: JSON objects or CSV lines"""
+
+    def __init__(self, spec=None):
+        super().__init__(spec or {})
+        self.json = JSONDecoder({})
+        self.csv = DelimitedDecoder({'fields': DEFAULT_CSV_FIELDS, 'strip': '$#'})
+
+    def decode(self, text):
+        text = text.strip()
+        if text.startswith('{'):
+            return self.json.decode(text)
+        return self.csv.decode(text)
+
+
+DECODER_TYPES = {
+    'delimited': DelimitedDecoder,
+    'regex': RegexDecoder,
+    'json': JSONDecoder,
+}
+
+BUILTIN_FORMATS = {
+    'default-json': {
+        'type': 'json',
+        'sample': '{"imei": "123456789012345", "latitude": 35.6892, "longitude": 51.389, "speed": 42.5, "timestamp": "2026-01-01T10:00:00Z"}',
+    },
+    'default-csv': {
+        'type': 'delimited',
+        'strip': '$#',
+        'fields': list(DEFAULT_CSV_FIELDS),
+        'sample': '123456789012345,35.6892,51.3890,42.5,90,2026-01-01T10:00:00Z',
+    },
+}
+
+
+def format_version(spec):
+    """Stable fingerprint of a message format, used as its cache version"""
+    return hashlib.sha1(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def compile_format(spec):
+    """Compile a message_format dict, or return the default decoder if none is declared"""
+    decoder_type = spec.get('type') if isinstance(spec, dict) else None
+    if decoder_type is None:
+        return DefaultDecoder()
+    decoder_class = DECODER_TYPES.get(decoder_type)
+    if decoder_class is None:
+        raise ValueError(f'Unknown message format type: {decoder_type}')
+    return decoder_class(spec)
+
+
+class ParserRegistry:
+    """
+    Per-protocol cache of compiled decoders.
+
+    A protocol's ``message_format`` is compiled once and reused until the
+    format changes; the fingerprint of the format is the cache version, so
+    saving a Protocol without touching its format keeps the old decoder.
+    Changes made in another process are picked up through the shared config
+    version counter that Protocol signals bump.
+    """
+
+    def __init__(self, check_interval=5.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self.decoders = {}
+        self.stale = set()
+        self.default = DefaultDecoder()
+        self.config_version = None
+        self.checked_at = 0.0
+
+    def invalidate(self, protocol_id=None):
+        with self._lock:
+            if protocol_id is None:
+                self.stale.update(self.decoders)
+            else:
+                self.stale.add(protocol_id)
+
+    def check_version(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return
+        self.checked_at = now
+        version = cache.get(CONFIG_VERSION_KEY)
+        if version != self.config_version:
+            self.config_version = version
+            self.invalidate()
+
+    def load(self, protocol_id):
+        spec = Protocol.objects.filter(pk=protocol_id).values_list('message_format', flat=True).first() or {}
+        version = format_version(spec)
+        with self._lock:
+            current = self.decoders.get(protocol_id)
+            self.stale.discard(protocol_id)
+            if current is not None and current[0] == version:
+                return current[1]
+        try:
+            decoder = compile_format(spec)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f'Invalid message format for protocol {protocol_id}: {e}')
+            decoder = self.default
+        with self._lock:
+            self.decoders[protocol_id] = (version, decoder)
+        return decoder
+
+    def get(self, protocol_id):
+        if protocol_id is None:
+            return self.default
+        self.check_version()
+        entry = self.decoders.get(protocol_id)
+        if entry is None or protocol_id in self.stale:
+            return self.load(protocol_id)
+        return entry[1]
+
+    def parse(self, protocol_id, text):
+        return self.get(protocol_id)(text)
+
+
+_registry = ParserRegistry()
+
+
+def get_parser_registry():
+    return _registry
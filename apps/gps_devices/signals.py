@@ -0,0 +1,51 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .ingest.fleet_table import get_fleet_table
+from .ingest.resolver import bump_version, get_device_resolver
+from .models import Device, Protocol
+from .parsers.registry import get_parser_registry
+
+
+# Saves limited to these fields cannot change a device's identity
+POSITION_FIELDS = frozenset({
+    'last_location_lat', 'last_location_lng', 'last_location_time', 'battery_level', 'updated_at',
+})
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+@receiver(post_save, sender=Protocol)
+@receiver(post_delete, sender=Protocol)
+def invalidate_device_resolver(sender, **kwargs):
+    """Drop cached device/protocol identities after a change"""
+    update_fields = kwargs.get('update_fields')
+    if update_fields and update_fields <= POSITION_FIELDS:
+        return
+    get_device_resolver().invalidate()
+    bump_version()
+
+
+@receiver(post_save, sender=Protocol)
+@receiver(post_delete, sender=Protocol)
+def invalidate_protocol_parser(sender, instance, **kwargs):
+    """Recompile the protocol's decoder on next use if its message format changed"""
+    get_parser_registry().invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Device)
+def update_fleet_table_status(sender, instance, update_fields=None, **kwargs):
+    """Keep the shared fleet table's status column in step with the device row"""
+    table = get_fleet_table()
+    if table is None or (update_fields and 'status' not in update_fields):
+        return
+    table.write(instance.id, status=instance.status)
+
+
+@receiver(post_delete, sender=Device)
+def clear_fleet_table_slot(sender, instance, **kwargs):
+    """Free a deleted device's slot so a later device with the same id starts empty"""
+    table = get_fleet_table()
+    if table is not None:
+        table.clear(instance.id)
+
@@ -1,10 +1,37 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock, skipUnless
 import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.cache import cache
+from django.db import OperationalError
 from django.test import TestCase
 from django.contrib.auth.models import User
 from django.utils import timezone
 from decimal import Decimal
 from apps.products.models import Category, Product
-from apps.gps_devices.models import DeviceType, Protocol, Device
+from apps.gps_devices.models import DeviceType, Protocol, Device, RawGPSData, SpoolCheckpoint
+from apps.gps_devices.communication.service import CommunicationService
+from apps.gps_devices.ingest.buffer import RawDataBuffer
+from apps.gps_devices.ingest.dedup import PacketDeduplicator
+from apps.gps_devices.ingest.http_poller import HTTPPoller, PollTarget
+from apps.gps_devices.ingest.fleet_table import FleetPositionTable, get_fleet_table
+from apps.gps_devices.ingest.positions import LastPositionStore
+from apps.gps_devices.ingest.mqtt_consumer import PAHO_AVAILABLE as MQTT_AVAILABLE, MQTTConsumer
+from apps.gps_devices.ingest.spool import FLOCK_AVAILABLE, DiskSpool, SpoolReplayer
+from apps.gps_devices.ingest.resolver import DeviceResolver, get_device_resolver
+from apps.gps_devices.parsers.binary import GT06Decoder, TeltonikaDecoder, crc16_arc, crc16_x25, detect_decoder
+from apps.gps_devices.parsers.registry import DefaultDecoder, ParseError, ParserRegistry, compile_format
+from apps.gps_devices.ingest.receiver import AsyncGPSReceiver, PacketFramer
+from apps.gps_devices.ingest.supervisor import ReceiverSupervisor
 
 
 class DeviceTypeModelTest(TestCase):
@@ -240,3 +267,1112 @@ class DeviceModelTest(TestCase):
                 name='My Car Tracker 2',
                 protocol=self.protocol
             )
+
+
+class PacketFramerTest(TestCase):
+    """Test cases for splitting the TCP stream into packets"""
+
+    def test_split_on_delimiters(self):
+        """Test packets split across reads are reassembled"""
+        framer = PacketFramer()
+        self.assertEqual(framer.feed(b'imei:1,35.1,51.2\nimei:1,35'), [b'imei:1,35.1,51.2'])
+        self.assertEqual(framer.feed(b'.3,51.4#'), [b'imei:1,35.3,51.4'])
+        self.assertEqual(framer.flush(), b'')
+
+    def test_empty_packets_are_skipped(self):
+        """Test leading, repeated and trailing delimiters yield no empty packets"""
+        framer = PacketFramer()
+        self.assertEqual(framer.feed(b'#a\n\nb#c'), [b'a', b'b'])
+        self.assertEqual(framer.feed(b'd'), [])
+        self.assertEqual(framer.feed(b'\n#'), [b'cd'])
+        self.assertEqual(framer.flush(), b'')
+
+    def test_oversized_packet_is_emitted(self):
+        """Test a delimiter-less stream cannot grow the buffer without bound"""
+        framer = PacketFramer(max_size=8)
+        self.assertEqual(framer.feed(b'0123456789'), [b'01234567'])
+        self.assertEqual(framer.flush(), b'89')
+
+
+class AsyncGPSReceiverTest(TestCase):
+    """Test cases for the asyncio GPS receiver"""
+
+    def test_persistent_connection_multiple_packets(self):
+        """Test one connection can deliver several packets and counters are updated"""
+        received = []
+
+        async def scenario():
+            receiver = AsyncGPSReceiver(lambda data, ip: received.append((data, ip)), host='127.0.0.1', port=0)
+            server = await receiver.start()
+            reader, writer = await asyncio.open_connection('127.0.0.1', receiver.port)
+            writer.write(b'first\nsecond\n')
+            await writer.drain()
+            writer.write(b'third')
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+            for _ in range(100):
+                if len(received) == 3:
+                    break
+                await asyncio.sleep(0.01)
+            server.close()
+            await server.wait_closed()
+            receiver.executor.shutdown(wait=True)
+            return receiver.stats.snapshot()
+
+        snapshot = asyncio.run(scenario())
+        self.assertEqual([data for data, ip in received], ['first', 'second', 'third'])
+        self.assertEqual(received[0][1], '127.0.0.1')
+        self.assertEqual(snapshot['connections'], 1)
+        self.assertEqual(snapshot['packets'], 3)
+
+    def test_reuse_port_allows_shared_listener(self):
+        """Test two receivers can listen on the same port with reuse_port"""
+
+        async def scenario():
+            first = AsyncGPSReceiver(lambda data, ip: None, host='127.0.0.1', port=0, reuse_port=True)
+            await first.start()
+            second = AsyncGPSReceiver(lambda data, ip: None, host='127.0.0.1', port=first.port, reuse_port=True)
+            await second.start()
+            ports = (first.port, second.port)
+            for receiver in (first, second):
+                receiver.server.close()
+                await receiver.server.wait_closed()
+                receiver.executor.shutdown(wait=True)
+            return ports
+
+        first_port, second_port = asyncio.run(scenario())
+        self.assertEqual(first_port, second_port)
+
+
+def report_and_wait(index, report):
+    report({
+        'connections': index + 1, 'open_connections': 1, 'packets': 10, 'bytes': 100, 'errors': 0,
+        'connections_per_sec': 1.0, 'packets_per_sec': 5.0,
+    })
+    time.sleep(30)
+
+
+class ReceiverSupervisorTest(TestCase):
+    """Test cases for the multi-process receiver supervisor"""
+
+    def poll_until(self, supervisor, condition):
+        for _ in range(50):
+            supervisor.poll(timeout=0.1)
+            if condition(supervisor.aggregate()):
+                break
+        return supervisor.aggregate()
+
+    def test_aggregates_worker_stats_and_restarts_dead_workers(self):
+        """Test fleet totals are summed across workers and a killed worker is replaced"""
+        supervisor = ReceiverSupervisor(report_and_wait, workers=2, report_interval=3600, restart_delay=0)
+        supervisor.start()
+        try:
+            totals = self.poll_until(supervisor, lambda totals: totals['reporting_workers'] == 2)
+            self.assertEqual(totals['workers'], 2)
+            self.assertEqual(totals['connections'], 3)
+            self.assertEqual(totals['packets'], 20)
+            self.assertEqual(totals['packets_per_sec'], 10.0)
+
+            victim = supervisor.processes[0]
+            victim.terminate()
+            victim.join(5)
+            totals = self.poll_until(
+                supervisor, lambda totals: totals['restarts'] == 1 and totals['reporting_workers'] == 2
+            )
+            self.assertEqual(totals['restarts'], 1)
+            self.assertEqual(totals['reporting_workers'], 2)
+            self.assertNotEqual(supervisor.processes[0].pid, victim.pid)
+        finally:
+            supervisor.stop(timeout=5)
+        self.assertEqual(supervisor.processes, {})
+
+
+class RawDataBufferTest(TestCase):
+    """Test cases for the batched RawGPSData writer"""
+
+    def setUp(self):
+        self.protocol = Protocol.objects.create(name='Unknown TCP', protocol_type='tcp')
+
+    def test_flush_writes_batches(self):
+        """Test queued packets are written with bulk inserts"""
+        buffer = RawDataBuffer(batch_size=2, max_pending=10)
+        for index in range(5):
+            self.assertTrue(buffer.add(RawGPSData(protocol=self.protocol, raw_data=f'packet-{index}')))
+        self.assertEqual(RawGPSData.objects.count(), 0)
+
+        buffer.flush()
+        self.assertEqual(RawGPSData.objects.count(), 5)
+        self.assertEqual(buffer.stats(), {'pending': 0, 'written': 5, 'dropped': 0, 'spooled': 0, 'flushes': 3, 'duplicates': 0})
+
+    def test_full_buffer_drops_after_timeout(self):
+        """Test producers are pushed back and packets are counted as dropped when full"""
+        buffer = RawDataBuffer(max_pending=1, put_timeout=0.01)
+        self.assertTrue(buffer.add(RawGPSData(protocol=self.protocol, raw_data='first')))
+        self.assertFalse(buffer.add(RawGPSData(protocol=self.protocol, raw_data='second')))
+        self.assertEqual(buffer.stats()['dropped'], 1)
+
+    def test_received_at_is_receive_time(self):
+        """Test rows keep the time they were queued rather than the flush time"""
+        received_at = timezone.now() - timezone.timedelta(minutes=5)
+        buffer = RawDataBuffer()
+        buffer.add(RawGPSData(protocol=self.protocol, raw_data='late', received_at=received_at))
+        buffer.stop()
+        self.assertEqual(RawGPSData.objects.get().received_at, received_at)
+
+
+class PacketDeduplicatorTest(TestCase):
+    """Test cases for retransmission suppression"""
+
+    def setUp(self):
+        self.protocol = Protocol.objects.create(name='Unknown TCP', protocol_type='tcp')
+
+    def packet(self, raw_data, device_id=None):
+        return RawGPSData(device_id=device_id, protocol=self.protocol, raw_data=raw_data)
+
+    def test_retransmission_is_dropped_before_the_database(self):
+        """Test a resent packet is accepted but only written once"""
+        buffer = RawDataBuffer(dedup=PacketDeduplicator(capacity=100, window=60))
+        self.assertTrue(buffer.add(self.packet('123456789012345,35.1,51.2,0,0,2026-01-01T10:00:00Z')))
+        self.assertTrue(buffer.add(self.packet('123456789012345,35.1,51.2,0,0,2026-01-01T10:00:00Z')))
+        self.assertTrue(buffer.add(self.packet('123456789012345,35.1,51.2,0,0,2026-01-01T10:00:05Z')))
+        buffer.flush()
+        self.assertEqual(RawGPSData.objects.count(), 2)
+        self.assertEqual(buffer.stats()['duplicates'], 1)
+
+    def test_key_includes_device(self):
+        """Test identical payloads from different devices are both kept"""
+        dedup = PacketDeduplicator(capacity=100, window=60)
+        self.assertFalse(dedup.is_duplicate(self.packet('ping', device_id=1)))
+        self.assertFalse(dedup.is_duplicate(self.packet('ping', device_id=2)))
+        self.assertTrue(dedup.is_duplicate(self.packet('ping', device_id=1)))
+
+    def test_unresolved_senders_are_keyed_by_address(self):
+        """Test identical payloads from different unknown senders are both kept"""
+        dedup = PacketDeduplicator(capacity=100, window=60)
+        first, second = self.packet('ping'), self.packet('ping')
+        first.ip_address, second.ip_address = '10.0.0.1', '10.0.0.2'
+        self.assertFalse(dedup.is_duplicate(first))
+        self.assertFalse(dedup.is_duplicate(second))
+        self.assertTrue(dedup.is_duplicate(first))
+
+    def test_dropped_packet_is_not_remembered(self):
+        """Test a packet the full buffer dropped is accepted when the device resends it"""
+        buffer = RawDataBuffer(max_pending=1, put_timeout=0.01, dedup=PacketDeduplicator(capacity=100, window=60))
+        self.assertTrue(buffer.add(self.packet('first')))
+        self.assertFalse(buffer.add(self.packet('second')))
+        buffer.flush()
+        self.assertTrue(buffer.add(self.packet('second')))
+        buffer.flush()
+        self.assertEqual(sorted(RawGPSData.objects.values_list('raw_data', flat=True)), ['first', 'second'])
+
+    def test_lru_is_bounded(self):
+        """Test the oldest entries are evicted once capacity is reached"""
+        dedup = PacketDeduplicator(capacity=2, window=60)
+        for payload in ('a', 'b', 'c'):
+            dedup.is_duplicate(self.packet(payload))
+        self.assertEqual(dedup.stats()['size'], 2)
+        self.assertFalse(dedup.is_duplicate(self.packet('a')))
+        self.assertTrue(dedup.is_duplicate(self.packet('c')))
+
+    def test_entries_expire_after_window(self):
+        """Test a repeated payload is accepted again once the window has passed"""
+        dedup = PacketDeduplicator(capacity=100, window=0)
+        self.assertFalse(dedup.is_duplicate(self.packet('heartbeat')))
+        self.assertFalse(dedup.is_duplicate(self.packet('heartbeat')))
+        self.assertEqual(dedup.stats()['hits'], 0)
+
+
+class DiskSpoolTest(TestCase):
+    """Test cases for the receiver disk spool and its replay"""
+
+    def setUp(self):
+        self.protocol = Protocol.objects.create(name='Unknown TCP', protocol_type='tcp')
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tempdir.name)
+        self.addCleanup(self.tempdir.cleanup)
+
+    def spool_packets(self, count, **kwargs):
+        spool = DiskSpool(self.directory, **kwargs)
+        spool.append([RawGPSData(protocol=self.protocol, raw_data=f'packet-{index}') for index in range(count)])
+        spool.close()
+        return spool
+
+    def test_full_buffer_spools_instead_of_dropping(self):
+        """Test packets that do not fit in the queue go to disk and are replayed once"""
+        received_at = timezone.now() - timezone.timedelta(minutes=5)
+        buffer = RawDataBuffer(max_pending=1, put_timeout=0.01, spool=DiskSpool(self.directory))
+        self.assertTrue(buffer.add(RawGPSData(protocol=self.protocol, raw_data='queued')))
+        self.assertTrue(buffer.add(RawGPSData(protocol=self.protocol, raw_data='spooled', received_at=received_at)))
+        buffer.stop()
+        self.assertEqual(buffer.stats()['spooled'], 1)
+        self.assertEqual(buffer.stats()['dropped'], 0)
+
+        replayer = SpoolReplayer(self.directory)
+        self.assertEqual(replayer.replay(), 1)
+        self.assertEqual(replayer.replay(), 0)
+        spooled = RawGPSData.objects.get(raw_data='spooled')
+        self.assertEqual(spooled.received_at, received_at)
+        self.assertEqual(spooled.protocol, self.protocol)
+        self.assertEqual(list(self.directory.iterdir()), [])
+        self.assertFalse(SpoolCheckpoint.objects.exists())
+
+    def test_failed_write_spools_batch(self):
+        """Test a batch the database rejects is spooled rather than lost"""
+        buffer = RawDataBuffer(spool=DiskSpool(self.directory))
+        buffer.add(RawGPSData(protocol=self.protocol, raw_data='first'))
+        buffer.add(RawGPSData(protocol=self.protocol, raw_data='second'))
+        with mock.patch.object(RawGPSData.objects, 'bulk_create', side_effect=OperationalError('database is down')):
+            buffer.flush()
+        buffer.spool.close()
+        self.assertEqual(buffer.stats()['spooled'], 2)
+        self.assertEqual(RawGPSData.objects.count(), 0)
+
+        SpoolReplayer(self.directory).replay()
+        self.assertEqual(sorted(RawGPSData.objects.values_list('raw_data', flat=True)), ['first', 'second'])
+
+    def test_replay_resumes_from_checkpoint(self):
+        """Test a replay interrupted after one batch continues without duplicates"""
+        self.spool_packets(5)
+        segment = next(self.directory.iterdir())
+        count, finished, advanced = SpoolReplayer(self.directory, batch_size=2).replay_batch(segment)
+        self.assertEqual((count, finished, advanced), (2, False, True))
+        self.assertGreater(SpoolCheckpoint.objects.get(segment=segment.stem).offset, 0)
+
+        self.assertEqual(SpoolReplayer(self.directory, batch_size=2).replay(), 3)
+        self.assertEqual(
+            list(RawGPSData.objects.order_by('id').values_list('raw_data', flat=True)),
+            [f'packet-{index}' for index in range(5)],
+        )
+
+    def test_torn_and_corrupt_rows_are_skipped(self):
+        """Test a corrupt line and a partial trailing line do not block the segment"""
+        self.spool_packets(1)
+        segment = next(self.directory.iterdir())
+        with open(segment, 'ab') as handle:
+            handle.write(b'not json\n{"raw_data": "tor')
+        replayer = SpoolReplayer(self.directory)
+        self.assertEqual(replayer.replay(), 1)
+        self.assertEqual(replayer.corrupt, 1)
+        self.assertFalse(segment.exists())
+
+    def test_rows_the_database_rejects_are_quarantined(self):
+        """Test orphaned and failing rows go to a .bad file and the rest of the segment is replayed"""
+        spool = DiskSpool(self.directory)
+        spool.append([
+            RawGPSData(protocol=self.protocol, raw_data='first'),
+            RawGPSData(device_id=999999, protocol=self.protocol, raw_data='orphan'),
+            RawGPSData(protocol=self.protocol, raw_data='boom'),
+            RawGPSData(protocol=self.protocol, raw_data='last'),
+        ])
+        spool.close()
+        segment = next(self.directory.iterdir())
+        bulk_create = RawGPSData.objects.bulk_create
+
+        def failing_bulk_create(rows, **kwargs):
+            if any(row.raw_data == 'boom' for row in rows):
+                raise OperationalError('value rejected')
+            return bulk_create(rows, **kwargs)
+
+        replayer = SpoolReplayer(self.directory)
+        with mock.patch.object(RawGPSData.objects, 'bulk_create', side_effect=failing_bulk_create):
+            self.assertEqual(replayer.replay(), 2)
+        self.assertEqual(replayer.quarantined, 2)
+        self.assertEqual(sorted(RawGPSData.objects.values_list('raw_data', flat=True)), ['first', 'last'])
+        self.assertFalse(segment.exists())
+        bad = [json.loads(line)['raw_data'] for line in segment.with_suffix('.bad').read_bytes().splitlines()]
+        self.assertEqual(bad, ['orphan', 'boom'])
+
+    def test_open_segment_is_replayed_but_kept(self):
+        """Test rows in a segment still being written are replayed without deleting it"""
+        spool = DiskSpool(self.directory)
+        spool.append([RawGPSData(protocol=self.protocol, raw_data='live')])
+        self.assertEqual(SpoolReplayer(self.directory).replay(), 1)
+        self.assertTrue(spool.path.exists())
+        spool.append([RawGPSData(protocol=self.protocol, raw_data='later')])
+        spool.close()
+        self.assertEqual(SpoolReplayer(self.directory).replay(), 1)
+        self.assertEqual(RawGPSData.objects.count(), 2)
+
+    @skipUnless(FLOCK_AVAILABLE, 'flock is not available')
+    def test_idle_segment_of_live_writer_is_kept(self):
+        """Test an open segment idle for long is not removed while its writer holds it"""
+        spool = DiskSpool(self.directory, max_age=0.01)
+        spool.append([RawGPSData(protocol=self.protocol, raw_data='first')])
+        os.utime(spool.path, (time.time() - 3600, time.time() - 3600))
+        self.assertEqual(SpoolReplayer(self.directory).replay(), 1)
+        self.assertTrue(spool.path.exists())
+
+        time.sleep(0.02)
+        self.assertTrue(spool.append([RawGPSData(protocol=self.protocol, raw_data='second')]))
+        spool.close()
+        self.assertEqual(SpoolReplayer(self.directory).replay(), 1)
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+    @skipUnless(FLOCK_AVAILABLE, 'flock is not available')
+    def test_segment_of_dead_writer_is_finished(self):
+        """Test an unlocked open segment, left by a receiver that died, is replayed and removed"""
+        segment = self.directory / f'{time.time_ns():020d}-1.open'
+        segment.write_bytes(b''.join(
+            json.dumps({'protocol_id': self.protocol.pk, 'raw_data': 'orphan'}).encode() + b'\n' for _ in range(2)
+        ))
+        self.assertEqual(SpoolReplayer(self.directory).replay(), 2)
+        self.assertFalse(segment.exists())
+
+    def test_spool_errors_count_as_dropped(self):
+        """Test an unexpected spool failure drops the rows without reaching the receiver"""
+        buffer = RawDataBuffer(spool=DiskSpool(self.directory))
+        with mock.patch.object(buffer.spool, 'append', side_effect=ValueError('I/O operation on closed file')):
+            self.assertFalse(buffer.spool_rows([RawGPSData(protocol=self.protocol, raw_data='lost')]))
+        self.assertEqual(buffer.stats()['dropped'], 1)
+
+    def test_spool_refuses_rows_past_max_bytes(self):
+        """Test the spool stops growing at its size cap"""
+        spool = DiskSpool(self.directory, max_bytes=200)
+        self.assertTrue(spool.append([RawGPSData(protocol=self.protocol, raw_data='x' * 50)]))
+        self.assertFalse(spool.append([RawGPSData(protocol=self.protocol, raw_data='x' * 150)]))
+        spool.close()
+        self.assertEqual(spool.stats(), {'spooled': 1, 'refused': 1})
+
+
+class DeviceResolverTest(TestCase):
+    """Test cases for the receiver identity cache"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.category = Category.objects.create(name='GPS Trackers', slug='gps-trackers')
+        self.product = Product.objects.create(
+            name='GPS Tracker Pro',
+            slug='gps-tracker-pro',
+            category=self.category,
+            price=Decimal('1000000.00'),
+            stock_quantity=50
+        )
+        self.device_type = DeviceType.objects.create(name='Vehicle Tracker', slug='vehicle-tracker', battery_life_hours=48)
+        self.protocol = Protocol.objects.create(name='TK103', protocol_type='tcp', default_port=5013)
+        self.device = Device.objects.create(
+            user=self.user,
+            product=self.product,
+            device_type=self.device_type,
+            imei='123456789012345',
+            serial_number='SN123456789',
+            name='My Car Tracker',
+            protocol=self.protocol
+        )
+        # check_interval=0 makes every lookup compare the shared cache version
+        self.resolver = DeviceResolver(check_interval=0)
+        self.resolver.load()
+
+    def test_resolve_packet_without_queries(self):
+        """Test packets are attributed from the cache with zero queries"""
+        self.resolver.check_interval = 60
+        with self.assertNumQueries(0):
+            result = self.resolver.resolve_packet('imei:123456789012345,tracker,35.6892,51.3890', port=5000)
+        self.assertEqual(result, (self.device.pk, self.protocol.pk))
+
+    def test_unknown_sender_uses_port_protocol(self):
+        """Test unknown senders fall back to the protocol listening on the port"""
+        device_id, protocol_id = self.resolver.resolve_packet('999999999999999,35.6,51.3', port=5013)
+        self.assertIsNone(device_id)
+        self.assertEqual(protocol_id, self.protocol.pk)
+
+        device_id, protocol_id = self.resolver.resolve_packet('garbage', port=6000)
+        self.assertEqual(protocol_id, Protocol.objects.get(name='Unknown TCP').pk)
+
+    def test_device_id_and_dedicated_port(self):
+        """Test alternative identifiers and dedicated ports resolve the device"""
+        self.device.device_id = 'TRK-1'
+        self.device.assigned_port = 7001
+        self.device.save()
+        self.assertEqual(self.resolver.resolve_packet('TRK-1,35.6,51.3'), (self.device.pk, self.protocol.pk))
+        self.assertEqual(self.resolver.resolve_packet('no identifier', port=7001), (self.device.pk, self.protocol.pk))
+
+    def test_signal_invalidates_cache(self):
+        """Test saving a device invalidates the cache"""
+        self.assertTrue(self.resolver.loaded)
+        get_device_resolver().load()
+        self.device.imei = '543210987654321'
+        self.device.save()
+        self.assertFalse(get_device_resolver().loaded)
+        device_id, protocol_id = get_device_resolver().resolve('543210987654321')
+        self.assertEqual(device_id, self.device.pk)
+
+
+class LastPositionStoreTest(TestCase):
+    """Test cases for the write-behind last-position store"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.category = Category.objects.create(name='GPS Trackers', slug='gps-trackers')
+        self.product = Product.objects.create(
+            name='GPS Tracker Pro',
+            slug='gps-tracker-pro',
+            category=self.category,
+            price=Decimal('1000000.00'),
+            stock_quantity=50
+        )
+        self.device_type = DeviceType.objects.create(name='Vehicle Tracker', slug='vehicle-tracker', battery_life_hours=48)
+        self.protocol = Protocol.objects.create(name='TK103', protocol_type='tcp')
+        self.devices = [
+            Device.objects.create(
+                user=self.user,
+                product=self.product,
+                device_type=self.device_type,
+                imei=f'12345678901234{index}',
+                serial_number=f'SN{index}',
+                name=f'Tracker {index}',
+                protocol=self.protocol,
+                battery_level=50,
+            )
+            for index in range(2)
+        ]
+        self.store = LastPositionStore(flush_interval=60)
+        self.now = timezone.now()
+
+    def test_fixes_are_coalesced_into_one_flush(self):
+        """Test many fixes per device cost no writes until the flush writes the newest one"""
+        first, second = self.devices
+        for minute in range(10):
+            self.store.record(first.id, Decimal('35.600000') + minute, Decimal('51.300000'),
+                              self.now + timezone.timedelta(minutes=minute), battery_level=90 - minute)
+        self.store.record(second.id, Decimal('36.000000'), Decimal('52.000000'), self.now)
+        first.refresh_from_db()
+        self.assertIsNone(first.last_location_time)
+
+        self.assertEqual(self.store.flush(), 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.last_location_lat, Decimal('44.600000'))
+        self.assertEqual(first.battery_level, 81)
+        self.assertEqual(second.last_location_lng, Decimal('52.000000'))
+        self.assertEqual(second.battery_level, 50)
+        self.assertEqual(self.store.stats()['pending'], 0)
+        self.assertEqual(self.store.flush(), 0)
+
+    def test_older_fixes_never_move_a_device_back(self):
+        """Test out-of-order fixes are ignored in the store and in the table"""
+        device = self.devices[0]
+        device.update_location(Decimal('35.000000'), Decimal('51.000000'), self.now)
+        self.store.record(device.id, Decimal('10.000000'), Decimal('10.000000'), self.now - timezone.timedelta(hours=1))
+        self.assertFalse(self.store.record(device.id, 1, 1, self.now - timezone.timedelta(hours=2)))
+        self.store.flush()
+        device.refresh_from_db()
+        self.assertEqual(device.last_location_lat, Decimal('35.000000'))
+
+    def test_reads_prefer_the_store(self):
+        """Test unflushed positions are visible locally and through the shared cache"""
+        device = self.devices[0]
+        self.store.record(device.id, Decimal('35.700000'), Decimal('51.400000'), self.now, battery_level=66)
+        other_process = LastPositionStore()
+        self.assertEqual(other_process.get(device.id).lat, Decimal('35.700000'))
+        device, untouched = other_process.apply(Device.objects.filter(pk__in=[d.id for d in self.devices]).order_by('id'))
+        self.assertEqual(device.last_location_lng, Decimal('51.400000'))
+        self.assertEqual(device.battery_level, 66)
+        self.assertIsNone(untouched.last_location_time)
+
+    def test_update_location_writes_only_position_columns(self):
+        """Test Device.update_location skips the config columns and keeps the resolver cache"""
+        device = self.devices[0]
+        resolver = get_device_resolver()
+        resolver.load()
+        Device.objects.filter(pk=device.pk).update(name='Renamed elsewhere')
+        device.update_location(35.6892, 51.3890)
+        device.refresh_from_db()
+        self.assertEqual(device.name, 'Renamed elsewhere')
+        self.assertEqual(device.last_location_lat, Decimal('35.689200'))
+        self.assertTrue(resolver.loaded)
+
+
+def write_fleet_slot(path, device_id, timestamp):
+    FleetPositionTable(path, slots=16).write(
+        device_id, Decimal('35.700000'), Decimal('51.400000'), timestamp, battery_level=55
+    )
+
+
+class FleetPositionTableTest(TestCase):
+    """Test cases for the memory-mapped fleet position table"""
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.path = str(Path(self.tempdir.name) / 'fleet.bin')
+        self.table = FleetPositionTable(self.path, slots=16)
+        self.addCleanup(self.table.close)
+        self.now = timezone.now().replace(microsecond=0)
+
+    def test_write_and_read_slot(self):
+        """Test a fix round-trips and older fixes keep the position but still update status"""
+        self.assertTrue(self.table.write(3, Decimal('35.689200'), Decimal('51.389000'), self.now, 80, 'active'))
+        self.assertFalse(self.table.write(3, Decimal('1'), Decimal('1'), self.now - timezone.timedelta(minutes=1),
+                                          status='maintenance'))
+        position = self.table.read(3)
+        self.assertEqual((position.lat, position.lng), (Decimal('35.689200'), Decimal('51.389000')))
+        self.assertEqual(position.time, self.now)
+        self.assertEqual((position.battery_level, position.status), (80, 'maintenance'))
+        self.assertIsNone(self.table.read(4))
+        self.table.clear(3)
+        self.assertIsNone(self.table.read(3))
+
+    def test_devices_outside_the_table_are_skipped(self):
+        """Test ids beyond the slot count are not stored, so callers fall back to the database"""
+        self.assertFalse(self.table.write(16, 1, 1, self.now))
+        self.assertIsNone(self.table.read(16))
+        self.assertEqual(self.table.get_many([16]), {})
+
+    def test_status_only_slot_has_no_position(self):
+        """Test a slot written with just a status is left out of get_many so callers use the database"""
+        self.table.write(7, status='active')
+        self.assertEqual(self.table.read(7).status, 'active')
+        self.assertEqual(self.table.get_many([7]), {})
+
+    def test_table_is_shared_between_processes(self):
+        """Test a fix written by another process is read from the shared mapping"""
+        process = multiprocessing.get_context('fork').Process(
+            target=write_fleet_slot, args=(self.path, 5, self.now)
+        )
+        process.start()
+        process.join(10)
+        self.assertEqual(process.exitcode, 0)
+        position = self.table.read(5)
+        self.assertEqual(position.time, self.now)
+        self.assertEqual(position.battery_level, 55)
+
+    def test_mismatched_table_is_refused(self):
+        """Test a file created with another slot count is not silently reinterpreted"""
+        with self.assertRaises(ValueError):
+            FleetPositionTable(self.path, slots=32)
+
+    def test_table_is_disabled_without_fcntl(self):
+        """Test platforms without fcntl record locks run without a fleet table"""
+        with self.settings(GPS_FLEET_TABLE_PATH=self.path):
+            with mock.patch('apps.gps_devices.ingest.fleet_table.LOCKF_AVAILABLE', False):
+                self.assertIsNone(get_fleet_table())
+
+
+class FakeMQTTBroker:
+    """Minimal MQTT 3.1.1 broker stand-in: accepts one client, acks its subscription and publishes"""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.subscriptions = []
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.port = self.server.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def encode_length(length):
+        encoded = bytearray()
+        while True:
+            byte, length = length % 128, length // 128
+            encoded.append(byte | (0x80 if length else 0))
+            if not length:
+                return bytes(encoded)
+
+    def read_packet(self, client):
+        header = client.recv(1)
+        if not header:
+            return None, b''
+        length, shift = 0, 0
+        while True:
+            byte = client.recv(1)[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        body = b''
+        while len(body) < length:
+            body += client.recv(length - len(body))
+        return header[0] & 0xF0, body
+
+    def serve(self):
+        client, _ = self.server.accept()
+        with client:
+            while True:
+                packet_type, body = self.read_packet(client)
+                if packet_type is None or packet_type == 0xE0:
+                    return
+                if packet_type == 0x10:
+                    client.sendall(b'\x20\x02\x00\x00')
+                elif packet_type == 0x80:
+                    position = 2
+                    while position < len(body):
+                        size = int.from_bytes(body[position:position + 2], 'big')
+                        self.subscriptions.append(body[position + 2:position + 2 + size].decode())
+                        position += 3 + size
+                    granted = bytes(1 for _ in self.subscriptions)
+                    client.sendall(b'\x90' + self.encode_length(2 + len(granted)) + body[:2] + granted)
+                    for topic, payload in self.messages:
+                        encoded_topic = topic.encode()
+                        variable = len(encoded_topic).to_bytes(2, 'big') + encoded_topic + payload
+                        client.sendall(b'\x30' + self.encode_length(len(variable)) + variable)
+                elif packet_type == 0xC0:
+                    client.sendall(b'\xd0\x00')
+
+    def close(self):
+        self.server.close()
+
+
+@skipUnless(MQTT_AVAILABLE, 'paho-mqtt is not installed')
+class MQTTConsumerTest(TestCase):
+    """Test cases for the fleet-wide MQTT consumer"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        category = Category.objects.create(name='GPS Trackers', slug='gps-trackers')
+        product = Product.objects.create(
+            name='GPS Tracker Pro', slug='gps-tracker-pro', category=category,
+            price=Decimal('1000000.00'), stock_quantity=50
+        )
+        device_type = DeviceType.objects.create(name='Vehicle Tracker', slug='vehicle-tracker', battery_life_hours=48)
+        self.protocol = Protocol.objects.create(name='MQTT JSON', protocol_type='mqtt')
+        device_fields = dict(user=user, product=product, device_type=device_type, protocol=self.protocol)
+        self.by_imei = Device.objects.create(
+            imei='123456789012345', serial_number='SN1', name='By IMEI', **device_fields
+        )
+        self.by_topic = Device.objects.create(
+            device_id='truck-7', serial_number='SN2', name='By Topic',
+            config_settings={'topic': 'fleet/north/truck7'}, **device_fields
+        )
+        # Load in the test thread; paho delivers messages on its own thread
+        self.resolver = DeviceResolver(check_interval=0)
+        self.resolver.load()
+        self.buffer = RawDataBuffer()
+
+    def test_wildcard_subscription_dispatches_by_topic(self):
+        """Test one client receives every device's messages and attributes them by topic"""
+        broker = FakeMQTTBroker([
+            ('devices/123456789012345', b'{"latitude": 35.7, "longitude": 51.4}'),
+            ('fleet/north/truck7', b'{"latitude": 36.1, "longitude": 50.9}'),
+            ('devices/999999999999999', b'{"latitude": 30.0, "longitude": 50.0}'),
+        ])
+        self.addCleanup(broker.close)
+        consumer = MQTTConsumer(
+            broker='127.0.0.1', port=broker.port, topics=['devices/+', 'fleet/#'],
+            buffer=self.buffer, resolver=self.resolver,
+        )
+        consumer.start()
+        try:
+            for _ in range(200):
+                if consumer.stats.snapshot()['packets'] == 3:
+                    break
+                time.sleep(0.01)
+        finally:
+            consumer.stop()
+        self.buffer.flush()
+
+        self.assertEqual(broker.subscriptions, ['devices/+', 'fleet/#'])
+        self.assertEqual(consumer.stats.snapshot()['connections'], 1)
+        rows = {row.raw_data: row for row in RawGPSData.objects.all()}
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows['{"latitude": 35.7, "longitude": 51.4}'].device, self.by_imei)
+        self.assertEqual(rows['{"latitude": 35.7, "longitude": 51.4}'].protocol, self.protocol)
+        self.assertEqual(rows['{"latitude": 36.1, "longitude": 50.9}'].device, self.by_topic)
+        self.assertIsNone(rows['{"latitude": 30.0, "longitude": 50.0}'].device)
+
+    def test_shared_group_prefixes_topics(self):
+        """Test consumers in a group use shared subscriptions"""
+        consumer = MQTTConsumer(
+            broker='127.0.0.1', port=1883, topics=['devices/+'], group='gps',
+            buffer=self.buffer, resolver=self.resolver,
+        )
+        self.assertEqual(consumer.topics, ['$share/gps/devices/+'])
+
+
+class StubDeviceAPI(BaseHTTPRequestHandler):
+    """Local stand-in for vendor device APIs; tracks concurrent requests"""
+
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+    hits = {}
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+            cls.hits[self.path] = cls.hits.get(self.path, 0) + 1
+        try:
+            time.sleep(0.05)
+            if self.path == '/broken':
+                self.send_response(500)
+                self.end_headers()
+                return
+            body = json.dumps({'imei': self.path.strip('/'), 'latitude': 35.7, 'longitude': 51.4}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTPPollerTest(TestCase):
+    """Test cases for the pooled HTTP device poller"""
+
+    def setUp(self):
+        StubDeviceAPI.active = StubDeviceAPI.max_active = 0
+        StubDeviceAPI.hits = {}
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubDeviceAPI)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        category = Category.objects.create(name='GPS Trackers', slug='gps-trackers')
+        product = Product.objects.create(
+            name='GPS Tracker Pro', slug='gps-tracker-pro', category=category,
+            price=Decimal('1000000.00'), stock_quantity=50
+        )
+        device_type = DeviceType.objects.create(name='Vehicle Tracker', slug='vehicle-tracker', battery_life_hours=48)
+        self.protocol = Protocol.objects.create(name='Vendor API', protocol_type='http', update_frequency_seconds=1)
+        self.devices = []
+        for index, path in enumerate(['/111111111111111', '/222222222222222', '/333333333333333', '/broken']):
+            self.devices.append(Device.objects.create(
+                user=user, product=product, device_type=device_type, protocol=self.protocol,
+                device_id=f'http-{index}', serial_number=f'SN{index}', name=f'HTTP {index}',
+                config_settings={'url': base_url + path},
+            ))
+        self.buffer = RawDataBuffer()
+
+    def test_polls_every_device_within_host_limit(self):
+        """Test each endpoint is polled on schedule, failures are counted and the per-host limit holds"""
+        poller = HTTPPoller(per_host=1, jitter=0, buffer=self.buffer)
+        poller.run(duration=2.5)
+        self.buffer.flush()
+
+        self.assertEqual(len(poller.targets), 4)
+        self.assertEqual(StubDeviceAPI.max_active, 1)
+        for path in ('/111111111111111', '/222222222222222', '/333333333333333'):
+            self.assertGreaterEqual(StubDeviceAPI.hits.get(path, 0), 2)
+        self.assertGreaterEqual(poller.stats['failed'], 1)
+        self.assertEqual(poller.targets[self.devices[3].pk].failures, poller.stats['failed'])
+        rows = RawGPSData.objects.filter(device=self.devices[0])
+        self.assertGreaterEqual(rows.count(), 2)
+        self.assertEqual(rows.first().protocol, self.protocol)
+        self.assertFalse(RawGPSData.objects.filter(device=self.devices[3]).exists())
+
+    def test_target_replaced_during_poll_is_polled_after_it(self):
+        """Test a device whose URL changes mid-poll is polled at the new URL once the old poll finishes"""
+        poller = HTTPPoller(jitter=0, buffer=self.buffer)
+        old = PollTarget(1, self.protocol.pk, 'http://127.0.0.1/old', 1)
+        new = PollTarget(1, self.protocol.pk, 'http://127.0.0.1/new', 1)
+        release = threading.Event()
+        fetched = []
+
+        def fetch(target):
+            fetched.append(target.url)
+            if target is old:
+                release.wait(5)
+            return 0
+
+        poller.fetch = fetch
+
+        async def scenario():
+            poller.limit = asyncio.Semaphore(4)
+            poller.refresh({1: old}, time.monotonic())
+            while not fetched:
+                poller.dispatch(time.monotonic())
+                await asyncio.sleep(0.01)
+            poller.refresh({1: new}, time.monotonic())
+            await asyncio.sleep(1.1)
+            poller.dispatch(time.monotonic())
+            self.assertIn(1, poller.deferred)
+            release.set()
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                poller.dispatch(time.monotonic())
+                if len(fetched) > 1:
+                    break
+            await asyncio.gather(*poller.tasks)
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            release.set()
+            poller.executor.shutdown(wait=True)
+        self.assertEqual(fetched, ['http://127.0.0.1/old', 'http://127.0.0.1/new'])
+
+    def test_failing_device_backs_off(self):
+        """Test consecutive failures stretch the polling interval"""
+        poller = HTTPPoller(jitter=0, max_backoff=30, buffer=self.buffer)
+        target = PollTarget(1, self.protocol.pk, 'http://127.0.0.1/broken', 10)
+        self.assertEqual(poller.next_delay(target), 10)
+        target.failures = 2
+        self.assertEqual(poller.next_delay(target), 30)
+
+
+class CommunicationServiceTest(TestCase):
+    """Test cases for the pooled protocol handlers"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        category = Category.objects.create(name='GPS Trackers', slug='gps-trackers')
+        product = Product.objects.create(
+            name='GPS Tracker Pro', slug='gps-tracker-pro', category=category,
+            price=Decimal('1000000.00'), stock_quantity=50
+        )
+        device_type = DeviceType.objects.create(name='Vehicle Tracker', slug='vehicle-tracker', battery_life_hours=48)
+        protocol = Protocol.objects.create(name='Gateway TCP', protocol_type='tcp')
+        self.servers = [socket.create_server(('127.0.0.1', 0)) for _ in range(2)]
+        for server in self.servers:
+            self.addCleanup(server.close)
+        ports = [server.getsockname()[1] for server in self.servers]
+        self.devices = [
+            Device.objects.create(
+                user=user, product=product, device_type=device_type, protocol=protocol,
+                device_id=f'gw-{index}', serial_number=f'SN{index}', name=f'Gateway {index}',
+                config_settings={'host': '127.0.0.1', 'port': port},
+            )
+            for index, port in enumerate([ports[0], ports[0], ports[1]])
+        ]
+
+    def test_devices_on_one_endpoint_share_a_connection(self):
+        """Test the second device reuses the first device's handler and socket"""
+        service = CommunicationService()
+        self.addCleanup(service.close)
+        service.start_communication(self.devices[0])
+        handler = service.get_handler(self.devices[0])
+        service.start_communication(self.devices[1])
+        self.assertIs(service.get_handler(self.devices[1]), handler)
+        self.assertEqual(handler.device, self.devices[1])
+        stats = service.stats()
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['devices'], 2)
+        self.assertEqual(stats['open_connections'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 3)
+
+        service.stop_communication(self.devices[0])
+        self.assertEqual(service.stats()['open_connections'], 1)
+        service.stop_communication(self.devices[1])
+        self.assertEqual(service.stats()['open_connections'], 0)
+        self.assertEqual(handler.sock.fileno(), -1)
+
+    def test_least_recently_used_endpoint_is_evicted(self):
+        """Test the pool disconnects the oldest endpoint when it is full"""
+        service = CommunicationService(max_handlers=1)
+        self.addCleanup(service.close)
+        service.start_communication(self.devices[0])
+        first = service.get_handler(self.devices[0])
+        service.start_communication(self.devices[2])
+        stats = service.stats()
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['open_connections'], 1)
+        self.assertEqual(first.sock.fileno(), -1)
+        self.assertNotIn(self.devices[0].id, service.handlers)
+        self.assertIn(self.devices[2].id, service.handlers)
+
+    def test_idle_handlers_are_closed(self):
+        """Test handlers unused for the idle timeout are disconnected on the next access"""
+        service = CommunicationService(idle_timeout=0.01)
+        self.addCleanup(service.close)
+        service.start_communication(self.devices[0])
+        first = service.get_handler(self.devices[0])
+        time.sleep(0.02)
+        service.get_handler(self.devices[2])
+        self.assertEqual(service.stats()['evictions'], 1)
+        self.assertEqual(first.sock.fileno(), -1)
+
+
+class ParserRegistryTest(TestCase):
+    """Test cases for message_format driven decoders"""
+
+    def test_delimited_format(self):
+        """Test delimited formats with skipped columns, timestamp format and scaling"""
+        decoder = compile_format({
+            'type': 'delimited',
+            'delimiter': ';',
+            'strip': '*#',
+            'fields': ['identifier', None, 'latitude', 'longitude', 'speed', 'timestamp'],
+            'timestamp_format': '%d%m%y%H%M%S',
+            'scale': {'speed': 1.852},
+        })
+        values = decoder('*123456789012345;V1;35.6892;51.3890;10;010126100000#')
+        self.assertEqual(values['identifier'], '123456789012345')
+        self.assertEqual(values['latitude'], '35.6892')
+        self.assertAlmostEqual(values['speed'], 18.52)
+        self.assertEqual(values['timestamp'], '2026-01-01T10:00:00+00:00')
+
+    def test_regex_and_json_formats(self):
+        """Test regex named groups and dotted JSON paths"""
+        regex = compile_format({'type': 'regex', 'pattern': r'imei:(?P<identifier>\d+),lat:(?P<latitude>[-\d.]+),lng:(?P<longitude>[-\d.]+)'})
+        self.assertEqual(regex('imei:1,lat:35.1,lng:51.2')['longitude'], '51.2')
+        with self.assertRaises(ParseError):
+            regex('nothing here')
+
+        decoder = compile_format({'type': 'json', 'fields': {'identifier': 'id', 'latitude': 'pos.lat', 'longitude': 'pos.lng'}})
+        self.assertEqual(decoder('{"id": "A1", "pos": {"lat": 35.1, "lng": 51.2}}'), {'identifier': 'A1', 'latitude': 35.1, 'longitude': 51.2})
+
+    def test_undeclared_format_uses_default(self):
+        """Test protocols without a format type fall back to the default decoder"""
+        self.assertIsInstance(compile_format({'latitude': 'float'}), DefaultDecoder)
+        with self.assertRaises(ValueError):
+            compile_format({'type': 'xml'})
+
+    def test_registry_caches_per_format_version(self):
+        """Test decoders are compiled once and recompiled only when the format changes"""
+        protocol = Protocol.objects.create(
+            name='Custom Text',
+            protocol_type='tcp',
+            message_format={'type': 'delimited', 'fields': ['identifier', 'latitude', 'longitude']},
+        )
+        registry = ParserRegistry()
+        decoder = registry.get(protocol.pk)
+        with self.assertNumQueries(0):
+            self.assertIs(registry.get(protocol.pk), decoder)
+
+        protocol.description = 'Unrelated change'
+        protocol.save()
+        registry.invalidate(protocol.pk)
+        self.assertIs(registry.get(protocol.pk), decoder)
+
+        protocol.message_format = {'type': 'delimited', 'delimiter': '|', 'fields': ['identifier', 'latitude', 'longitude']}
+        protocol.save()
+        registry.invalidate(protocol.pk)
+        self.assertEqual(registry.parse(protocol.pk, 'A1|35.1|51.2')['latitude'], '35.1')
+
+
+GT06_LOGIN = bytes.fromhex('78780D01012345678901234500018CDD0D0A')
+GT06_LOCATION = bytes.fromhex('78781F120B081D112E10CF027AC7EB0C46584900148F01CC00287D001FB8000380810D0A')
+TELTONIKA_IMEI = bytes.fromhex('000F333536333037303432343431303133')
+TELTONIKA_AVL = bytes.fromhex(
+    '000000000000003608010000016B40D8EA30010000000000000000000000000000000105021503010101425E0F01F10000601A014E0000000000000000010000C7CF'
+)
+
+
+class BinaryDecoderTest(TestCase):
+    """Test cases for the GT06 and Teltonika frame decoders"""
+
+    def test_gt06_login_and_location(self):
+        """Test GT06 login is acknowledged and the location frame decoded"""
+        decoder = detect_decoder(GT06_LOGIN)
+        self.assertIsInstance(decoder, GT06Decoder)
+        records, ack = decoder.feed(GT06_LOGIN + GT06_LOCATION[:10])
+        self.assertEqual(records, [])
+        self.assertEqual(ack, bytes.fromhex('787805010001D9DC0D0A'))
+        self.assertEqual(decoder.imei, '123456789012345')
+
+        records, ack = decoder.feed(GT06_LOCATION[10:])
+        self.assertEqual(ack, b'')
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['imei'], '123456789012345')
+        self.assertAlmostEqual(records[0]['latitude'], 23.111668)
+        self.assertAlmostEqual(records[0]['longitude'], 114.409285)
+        self.assertEqual(records[0]['heading'], 143)
+        self.assertEqual(records[0]['timestamp'], '2011-08-29T17:46:16+00:00')
+
+    def test_gt06_bad_crc_is_dropped(self):
+        """Test corrupted frames are skipped without breaking the stream"""
+        corrupted = bytearray(GT06_LOCATION)
+        corrupted[10] ^= 0xFF
+        records, ack = GT06Decoder().feed(bytes(corrupted) + GT06_LOCATION)
+        self.assertEqual(len(records), 1)
+
+    def test_gt06_bad_date_drops_only_its_frame(self):
+        """Test a checksummed frame with an impossible date is skipped and the stream carries on"""
+        frame = bytearray(GT06_LOCATION)
+        frame[5] = 13
+        frame[-6:-4] = struct.pack('>H', crc16_x25(frame[2:-6]))
+        decoder = GT06Decoder()
+        with self.assertLogs('apps.gps_devices.parsers.binary', 'WARNING'):
+            records, ack = decoder.feed(GT06_LOCATION + bytes(frame) + GT06_LOCATION)
+        self.assertEqual(len(records), 2)
+
+    def test_teltonika_codec8(self):
+        """Test the IMEI handshake and AVL packet ACK split across reads"""
+        stream = TELTONIKA_IMEI + TELTONIKA_AVL
+        decoder = detect_decoder(stream)
+        self.assertIsInstance(decoder, TeltonikaDecoder)
+        self.assertEqual(decoder.feed(stream[:10]), ([], b''))
+        self.assertEqual(decoder.feed(stream[10:40]), ([], b'\x01'))
+        records, ack = decoder.feed(stream[40:])
+        self.assertEqual(ack, b'\x00\x00\x00\x01')
+        self.assertEqual(records[0]['imei'], '356307042441013')
+        self.assertEqual(records[0]['timestamp'], '2019-06-10T10:04:46+00:00')
+        self.assertEqual(records[0]['signal_strength'], 60)
+        self.assertEqual(records[0]['io']['66'], 24079)
+
+    def test_teltonika_malformed_packets_are_dropped(self):
+        """Test AVL packets that cannot be decoded are answered with a zero count and the stream carries on"""
+        def packet(data):
+            return struct.pack('>II', 0, len(data)) + data + struct.pack('>I', crc16_arc(data))
+
+        data = TELTONIKA_AVL[8:-4]
+        malformed = {
+            'overrun': data[:2].replace(b'\x01', b'\x02', 1) + data[2:-1] + b'\x02',
+            'count mismatch': data[:-1] + b'\x02',
+            'truncated io': data[:30] + b'\x01',
+            'unsupported codec': b'\x8e' + data[1:],
+        }
+        for name, body in malformed.items():
+            with self.subTest(name):
+                decoder = TeltonikaDecoder()
+                decoder.feed(TELTONIKA_IMEI)
+                with self.assertLogs('apps.gps_devices.parsers.binary', 'WARNING'):
+                    records, ack = decoder.feed(packet(body) + TELTONIKA_AVL)
+                self.assertEqual(ack, b'\x00\x00\x00\x00\x00\x00\x00\x01')
+                self.assertEqual(len(records), 1)
+
+    def test_text_payload_is_not_binary(self):
+        """Test text trackers keep the text path"""
+        self.assertIsNone(detect_decoder(b'123456789012345,35.6892,51.3890'))
+
+    def test_async_receiver_acknowledges_binary_frames(self):
+        """Test the async receiver decodes binary frames, persists records and replies with ACKs"""
+        received = []
+
+        async def scenario():
+            receiver = AsyncGPSReceiver(lambda data, ip: received.append(data), host='127.0.0.1', port=0)
+            server = await receiver.start()
+            reader, writer = await asyncio.open_connection('127.0.0.1', receiver.port)
+            writer.write(GT06_LOGIN)
+            await writer.drain()
+            ack = await reader.readexactly(10)
+            writer.write(GT06_LOCATION)
+            await writer.drain()
+            for _ in range(100):
+                if received:
+                    break
+                await asyncio.sleep(0.01)
+            writer.close()
+            await writer.wait_closed()
+            server.close()
+            await server.wait_closed()
+            receiver.executor.shutdown(wait=True)
+            return ack
+
+        ack = asyncio.run(scenario())
+        self.assertEqual(ack, bytes.fromhex('787805010001D9DC0D0A'))
+        self.assertEqual(len(received), 1)
+        self.assertEqual(json.loads(received[0])['imei'], '123456789012345')
+
+    def test_async_receiver_withholds_ack_for_rejected_records(self):
+        """Test records the buffer did not accept are not acknowledged and the connection is closed"""
+        async def scenario():
+            receiver = AsyncGPSReceiver(lambda data, ip: False, host='127.0.0.1', port=0)
+            server = await receiver.start()
+            reader, writer = await asyncio.open_connection('127.0.0.1', receiver.port)
+            writer.write(TELTONIKA_IMEI)
+            await writer.drain()
+            handshake = await reader.readexactly(1)
+            writer.write(TELTONIKA_AVL)
+            await writer.drain()
+            reply = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            await writer.wait_closed()
+            server.close()
+            await server.wait_closed()
+            receiver.executor.shutdown(wait=True)
+            return handshake, reply
+
+        self.assertEqual(asyncio.run(scenario()), (b'\x01', b''))
@@ -0,0 +1,49 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from apps.subscriptions.retention import RetentionJob, RetentionPolicy
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Delete tracking history older than each device\'s subscription plan allows (storage_days)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=None, help='Seconds to pause between chunks')
+        parser.add_argument('--max-rows', type=int, default=None, help='Stop after reclaiming this many rows')
+        parser.add_argument(
+            '--default-days',
+            type=int,
+            default=None,
+            help='Retention for devices without an active subscription (defaults to GPS_RETENTION_DEFAULT_DAYS)',
+        )
+        parser.add_argument(
+            '--no-drop-partitions',
+            action='store_false',
+            dest='drop_partitions',
+            help='Delete rows only, never drop expired LocationData partitions',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        job = RetentionJob(
+            policy=RetentionPolicy(default_days=options['default_days']).load(),
+            batch_size=options['batch_size'],
+            sleep=options['sleep'],
+            max_rows=options['max_rows'],
+            drop_partitions=options['drop_partitions'],
+        )
+        try:
+            deleted = job.run()
+        except KeyboardInterrupt:
+            deleted = dict(job.deleted)
+            self.stdout.write('Interrupted, the next run continues from here')
+        for name in job.dropped_partitions:
+            self.stdout.write(f'Dropped partition {name}')
+        for label, count in sorted(deleted.items()):
+            self.stdout.write(f'{label:<20} {count:>12}')
+        elapsed = time.monotonic() - started
+        logger.info(f'Retention reclaimed {job.total} rows in {elapsed:.1f}s: {deleted}')
+        self.stdout.write(self.style.SUCCESS(f'Reclaimed {job.total} rows in {elapsed:.1f}s'))
@@ -0,0 +1,167 @@
+import logging
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.api.models import APILog
+from apps.gps_devices.models import Device, RawGPSData
+from apps.tracking.models import Alert, LocationArchive, LocationData, LocationUpdate
+from apps.tracking.partitions import detach_partitions, estimate_rows, is_partitioned, partitions_ending_before
+from .models import Subscription
+
+logger = logging.getLogger(__name__)
+
+# (label, model, time field, owner field, extra filter); alerts go before the fixes they point at
+RETENTION_TARGETS = [
+    ('alerts', Alert, 'created_at', 'device', Q()),
+    ('location_data', LocationData, 'timestamp', 'device', Q()),
+    ('location_archives', LocationArchive, 'end_time', 'device', Q()),
+    ('raw_gps_data', RawGPSData, 'received_at', 'device', Q()),
+    ('location_updates', LocationUpdate, 'received_at', 'device', Q(processed=True)),
+    ('api_logs', APILog, 'created_at', 'user', Q()),
+]
+OWNER_CHUNK = 500
+
+
+class RetentionPolicy:
+    """
+    Effective history retention per device and per user.
+
+    A device keeps data for the longest ``storage_days`` of the active
+    subscriptions covering it: those that list the device, or, for
+    subscriptions without devices, every device of the subscriber. A user's
+    own records (API logs) follow their longest active plan. Devices and
+    users without an active subscription get ``default_days``.
+    """
+
+    def __init__(self, default_days=None, now=None):
+        if default_days is None:
+            default_days = getattr(settings, 'GPS_RETENTION_DEFAULT_DAYS', 30)
+        self.default_days = default_days
+        self.now = now or timezone.now()
+        self.user_days = {}
+        self.device_days = {}
+        self.subscriber_days = {}
+
+    def load(self):
+        active = Subscription.objects.filter(status__in=['trial', 'active']).filter(
+            Q(end_date__isnull=True) | Q(end_date__gt=self.now)
+        )
+        covered = set()
+        through = Subscription.devices.through.objects.filter(subscription__in=active)
+        for subscription_id, device_id, days in through.values_list(
+            'subscription_id', 'device_id', 'subscription__plan__storage_days'
+        ):
+            covered.add(subscription_id)
+            self.device_days[device_id] = max(days, self.device_days.get(device_id, 0))
+        for subscription_id, user_id, days in active.values_list('id', 'user_id', 'plan__storage_days'):
+            self.subscriber_days[user_id] = max(days, self.subscriber_days.get(user_id, 0))
+            if subscription_id not in covered:
+                self.user_days[user_id] = max(days, self.user_days.get(user_id, 0))
+        return self
+
+    def days_for_device(self, device_id, user_id):
+        # A plan may keep nothing (storage_days=0), so only a missing entry falls through
+        days = self.device_days.get(device_id)
+        if days is None:
+            days = self.user_days.get(user_id)
+        return days if days is not None else self.default_days
+
+    def days_for_user(self, user_id):
+        days = self.subscriber_days.get(user_id)
+        return days if days is not None else self.default_days
+
+    def owner_groups(self, scope):
+        """``{days: [owner ids]}`` for every device or user"""
+        groups = defaultdict(list)
+        if scope == 'device':
+            for device_id, user_id in Device.objects.values_list('id', 'user_id').iterator(chunk_size=5000):
+                groups[self.days_for_device(device_id, user_id)].append(device_id)
+        else:
+            for user_id in self.subscriber_days:
+                groups[self.days_for_user(user_id)].append(user_id)
+        return groups
+
+    @property
+    def longest(self):
+        return max([self.default_days, *self.device_days.values(), *self.subscriber_days.values()])
+
+
+class RetentionJob:
+    """
+    Deletes history that has outlived its owner's retention.
+
+    Rows are removed in chunks of ``batch_size`` primary keys, each in its own
+    short transaction with ``sleep`` seconds between chunks, so ingest never
+    waits long on locks. Deletion is driven by the retention predicate
+    itself, so a run stopped by ``max_rows`` or an interrupt simply resumes
+    where it left off next time. On a partitioned LocationData table, whole
+    months past every plan's retention are dropped instead of deleted.
+    """
+
+    def __init__(self, policy=None, batch_size=None, sleep=None, max_rows=None, drop_partitions=True):
+        self.policy = policy or RetentionPolicy().load()
+        self.batch_size = batch_size or getattr(settings, 'GPS_RETENTION_BATCH_SIZE', 1000)
+        self.sleep = sleep if sleep is not None else getattr(settings, 'GPS_RETENTION_SLEEP', 0.1)
+        self.max_rows = max_rows
+        self.drop_partitions = drop_partitions
+        self.deleted = defaultdict(int)
+        self.dropped_partitions = []
+
+    @property
+    def total(self):
+        return sum(self.deleted.values())
+
+    def exhausted(self):
+        return self.max_rows is not None and self.total >= self.max_rows
+
+    def run(self):
+        """Apply retention to every target, returning rows reclaimed per target"""
+        if self.drop_partitions and is_partitioned():
+            self.drop_expired_partitions()
+        for label, model, time_field, owner_field, extra in RETENTION_TARGETS:
+            for days, owners in sorted(self.policy.owner_groups(owner_field).items()):
+                cutoff = self.policy.now - timezone.timedelta(days=days)
+                for start in range(0, len(owners), OWNER_CHUNK):
+                    owner_filter = Q(**{f'{owner_field}__in': owners[start:start + OWNER_CHUNK]})
+                    self.purge(label, model, owner_filter & extra, time_field, cutoff)
+                    if self.exhausted():
+                        return dict(self.deleted)
+            # Rows without an owner (unresolved packets, anonymous API calls) get the default
+            cutoff = self.policy.now - timezone.timedelta(days=self.policy.default_days)
+            unowned = Q(**{f'{owner_field}__isnull': True})
+            if owner_field == 'user':
+                unowned |= ~Q(**{f'{owner_field}__in': list(self.policy.subscriber_days)})
+            self.purge(label, model, unowned & extra, time_field, cutoff)
+            if self.exhausted():
+                break
+        return dict(self.deleted)
+
+    def drop_expired_partitions(self):
+        cutoff = self.policy.now - timezone.timedelta(days=self.policy.longest)
+        names = partitions_ending_before(cutoff)
+        rows = estimate_rows(names)
+        self.dropped_partitions = detach_partitions(before=cutoff, drop=True)
+        self.deleted['location_data'] += rows
+        logger.info(f'Dropped {len(self.dropped_partitions)} expired location partitions (~{rows} rows)')
+
+    def purge(self, label, model, condition, time_field, cutoff):
+        queryset = model.objects.filter(condition, **{f'{time_field}__lt': cutoff}).order_by()
+        while not self.exhausted():
+            limit = self.batch_size
+            if self.max_rows is not None:
+                limit = min(limit, self.max_rows - self.total)
+            pks = list(queryset.values_list('pk', flat=True)[:limit])
+            if not pks:
+                return
+            with transaction.atomic():
+                count, per_model = model.objects.filter(pk__in=pks).delete()
+            self.deleted[label] += per_model.get(model._meta.label, 0)
+            if len(pks) < limit:
+                return
+            if self.sleep:
+                time.sleep(self.sleep)
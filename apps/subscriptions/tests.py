@@ -5,8 +5,11 @@ from django.utils import timezone
 from decimal import Decimal
 from datetime import timedelta
 from apps.products.models import Category, Product
-from apps.gps_devices.models import DeviceType, Protocol, Device
+from apps.api.models import APILog
+from apps.gps_devices.models import DeviceType, Protocol, Device, RawGPSData
 from apps.subscriptions.models import SubscriptionPlan, Subscription, PaymentRecord
+from apps.subscriptions.retention import RetentionJob, RetentionPolicy
+from apps.tracking.models import Alert, LocationData, LocationUpdate
 
 
 class SubscriptionPlanModelTest(TestCase):
@@ -267,3 +270,99 @@ class PaymentRecordModelTest(TestCase):
                 is_successful=True
             )
             self.assertEqual(payment.payment_type, p_type)
+
+
+class RetentionJobTest(TestCase):
+    """Test cases for plan-aware history retention"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        category = Category.objects.create(name='GPS Trackers', slug='gps-trackers')
+        product = Product.objects.create(
+            name='GPS Tracker Pro', slug='gps-tracker-pro', category=category,
+            price=Decimal('1000000.00'), stock_quantity=50
+        )
+        device_type = DeviceType.objects.create(name='Vehicle Tracker', slug='vehicle-tracker', battery_life_hours=48)
+        protocol = Protocol.objects.create(name='TK103', protocol_type='tcp')
+        self.subscriber = User.objects.create_user(username='subscriber', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.covered, self.uncovered, self.unsubscribed = [
+            Device.objects.create(
+                user=user, product=product, device_type=device_type, protocol=protocol,
+                imei=f'12345678901234{index}', serial_number=f'SN{index}', name=f'Tracker {index}',
+            )
+            for index, user in enumerate([self.subscriber, self.subscriber, self.other])
+        ]
+        plan = SubscriptionPlan.objects.create(name='Premium', price_per_year=Decimal('1200000.00'), storage_days=90)
+        subscription = Subscription.objects.create(user=self.subscriber, plan=plan, status='active')
+        subscription.devices.add(self.covered)
+
+    def fix(self, device, days):
+        return LocationData.objects.create(
+            device=device, latitude=Decimal('35.7'), longitude=Decimal('51.4'),
+            timestamp=self.now - timedelta(days=days),
+        )
+
+    def age(self, model, field, days, **filters):
+        model.objects.filter(**filters).update(**{field: self.now - timedelta(days=days)})
+
+    def test_policy_resolves_retention_per_device(self):
+        """Test listed devices follow their plan and everything else the default"""
+        policy = RetentionPolicy(default_days=30, now=self.now).load()
+        self.assertEqual(policy.days_for_device(self.covered.id, self.subscriber.id), 90)
+        self.assertEqual(policy.days_for_device(self.uncovered.id, self.subscriber.id), 30)
+        self.assertEqual(policy.days_for_device(self.unsubscribed.id, self.other.id), 30)
+        self.assertEqual(policy.days_for_user(self.subscriber.id), 90)
+        self.assertEqual(policy.longest, 90)
+
+    def test_zero_day_plans_are_not_the_default(self):
+        """Test a plan or default of zero storage days keeps nothing instead of falling back"""
+        plan = SubscriptionPlan.objects.create(name='Live only', price_per_year=Decimal('100000.00'), storage_days=0)
+        Subscription.objects.create(user=self.other, plan=plan, status='active')
+        policy = RetentionPolicy(default_days=0, now=self.now).load()
+        self.assertEqual(policy.default_days, 0)
+        self.assertEqual(policy.days_for_device(self.unsubscribed.id, self.other.id), 0)
+        self.assertEqual(policy.days_for_user(self.other.id), 0)
+        self.assertEqual(policy.days_for_device(self.covered.id, self.subscriber.id), 90)
+
+    def test_expired_history_is_deleted(self):
+        """Test each table is trimmed to its owner's retention and reclaimed rows are reported"""
+        kept = [self.fix(self.covered, 60), self.fix(self.unsubscribed, 10)]
+        old_fix = self.fix(self.covered, 100)
+        self.fix(self.uncovered, 60)
+        self.fix(self.unsubscribed, 60)
+        Alert.objects.create(device=self.covered, alert_type='geofence_enter', message='old', location_data=old_fix)
+        self.age(Alert, 'created_at', 100)
+        RawGPSData.objects.create(raw_data='unresolved')
+        self.age(RawGPSData, 'received_at', 60)
+        RawGPSData.objects.create(raw_data='recent')
+        LocationUpdate.objects.create(device=self.uncovered, payload={}, processed=True)
+        LocationUpdate.objects.create(device=self.uncovered, payload={})
+        self.age(LocationUpdate, 'received_at', 60)
+        for user in (self.subscriber, self.other):
+            APILog.objects.create(user=user, method='GET', endpoint='/api/', ip_address='127.0.0.1',
+                                  status_code=200, duration_ms=5)
+        self.age(APILog, 'created_at', 60)
+
+        job = RetentionJob(policy=RetentionPolicy(default_days=30, now=self.now).load(), sleep=0)
+        deleted = job.run()
+
+        self.assertEqual(deleted, {
+            'alerts': 1, 'location_data': 3, 'raw_gps_data': 1, 'location_updates': 1, 'api_logs': 1,
+        })
+        self.assertEqual(set(LocationData.objects.values_list('id', flat=True)), {fix.id for fix in kept})
+        self.assertEqual(list(RawGPSData.objects.values_list('raw_data', flat=True)), ['recent'])
+        self.assertFalse(LocationUpdate.objects.filter(processed=True).exists())
+        self.assertEqual(list(APILog.objects.values_list('user', flat=True)), [self.subscriber.id])
+
+    def test_runs_are_chunked_and_resumable(self):
+        """Test a run capped by max_rows stops early and the next run finishes the job"""
+        for days in range(40, 45):
+            self.fix(self.unsubscribed, days)
+        policy = RetentionPolicy(default_days=30, now=self.now).load()
+        first = RetentionJob(policy=policy, batch_size=2, sleep=0, max_rows=3).run()
+        self.assertEqual(first, {'location_data': 3})
+        second = RetentionJob(policy=policy, batch_size=2, sleep=0).run()
+        self.assertEqual(second, {'location_data': 2})
+        self.assertFalse(LocationData.objects.exists())
+
@@ -0,0 +1,40 @@
+from .models import LocationData, Geofence, Alert
+
+
+def check_geofence_alerts(device, lat, lng):
+    """
+    Check if device location triggers any geofence alerts
+    """
+    geofences = Geofence.objects.filter(user=device.user, is_active=True)
+
+    for geofence in geofences:
+        is_inside = geofence.contains_point(lat, lng)
+
+        # Check for enter/exit alerts
+        if geofence.alert_on_enter and is_inside:
+            # Check if device was previously outside
+            last_location = LocationData.objects.filter(
+                device=device
+            ).exclude(id=LocationData.objects.filter(device=device).order_by('-timestamp').first().id if LocationData.objects.filter(device=device).exists() else None).order_by('-timestamp').first()
+
+            if last_location and not geofence.contains_point(last_location.latitude, last_location.longitude):
+                Alert.objects.create(
+                    device=device,
+                    alert_type='geofence_enter',
+                    message=f"دستگاه وارد منطقه {geofence.name} شد",
+                    location_data=LocationData.objects.filter(device=device).order_by('-timestamp').first(),
+                )
+
+        elif geofence.alert_on_exit and not is_inside:
+            # Check if device was previously inside
+            last_location = LocationData.objects.filter(
+                device=device
+            ).exclude(id=LocationData.objects.filter(device=device).order_by('-timestamp').first().id if LocationData.objects.filter(device=device).exists() else None).order_by('-timestamp').first()
+
+            if last_location and geofence.contains_point(last_location.latitude, last_location.longitude):
+                Alert.objects.create(
+                    device=device,
+                    alert_type='geofence_exit',
+                    message=f"دستگاه از منطقه {geofence.name} خارج شد",
+                    location_data=LocationData.objects.filter(device=device).order_by('-timestamp').first(),
+                )
@@ -0,0 +1,418 @@
+"""
+Columnar archive blocks for cold location history.
+
+A block is a 24 byte header followed by one little-endian array per
+column, all the same length, int32 columns first so each array stays
+aligned::
+
+    magic 'GPSA', version (uint16), flags (uint16), count (uint32),
+    base time in ms since the epoch (int64), 4 bytes padding
+
+When bit 0 of flags is set the column section is zlib-compressed. Bit 1
+widens the time deltas to int64, for tracks with gaps over 24 days (never
+the case within a day block). Reading a block with NumPy only needs the
+column table below, e.g. ``np.frombuffer(columns, '<i4', count,
+offset=4 * count)`` for latitude in microdegrees and
+``base + np.cumsum(time_delta)`` for the timestamps.
+"""
+import array
+import logging
+import struct
+import sys
+import zlib
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import LocationArchive, LocationData
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GPSA'
+VERSION = 1
+COMPRESSED = 0x1
+WIDE_TIMES = 0x2
+HEADER = struct.Struct('<4sHHIq4x')
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# (LocationData field, array typecode, NumPy dtype, decimal places, missing-value sentinel)
+COLUMNS = [
+    ('time_delta', 'i', '<i4', None, None),  # ms since the previous fix, 0 for the first
+    ('latitude', 'i', '<i4', 6, None),
+    ('longitude', 'i', '<i4', 6, None),
+    ('altitude', 'i', '<i4', 2, -2 ** 31),
+    ('speed', 'i', '<i4', 2, -2 ** 31),
+    ('heading', 'i', '<i4', 2, -2 ** 31),
+    ('accuracy', 'h', '<i2', 2, -2 ** 15),
+    ('battery_level', 'b', 'i1', 0, -1),
+    ('signal_strength', 'b', 'i1', 0, -1),
+]
+POINT_FIELDS = ('id', 'device_id', 'timestamp', *(column[0] for column in COLUMNS[1:]))
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def to_ms(value):
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+
+def limits(typecode):
+    bits = array.array(typecode).itemsize * 8
+    return -2 ** (bits - 1), 2 ** (bits - 1) - 1
+
+
+def encode(points, compress=True):
+    """
+    Pack LocationData-like points into a block, sorted by timestamp
+
+    Optional values that do not fit their column (the database does not
+    enforce the model's validators) are stored as missing, with a warning.
+    """
+    points = sorted(points, key=lambda point: point.timestamp)
+    if not points:
+        raise ArchiveError('Cannot archive an empty day')
+    times = [to_ms(point.timestamp) for point in points]
+    columns = {'time_delta': [0] + [later - earlier for earlier, later in zip(times, times[1:])]}
+    for name, typecode, dtype, places, missing in COLUMNS[1:]:
+        low, high = limits(typecode)
+        values = []
+        for point in points:
+            value = getattr(point, name)
+            if value is None:
+                values.append(missing)
+                continue
+            value = Decimal(value)
+            scaled = round(value.scaleb(places)) if value.is_finite() else None
+            if missing is not None and (scaled is None or not low <= scaled <= high or scaled == missing):
+                logger.warning(f'Archiving {name}={value} of device {point.device_id} as missing; it does not fit the block')
+                scaled = missing
+            values.append(scaled)
+        columns[name] = values
+
+    flags = 0
+    if max(columns['time_delta']) >= 2 ** 31:
+        flags |= WIDE_TIMES
+    payload = bytearray()
+    for name, typecode, dtype, places, missing in COLUMNS:
+        if name == 'time_delta' and flags & WIDE_TIMES:
+            typecode = 'q'
+        values = array.array(typecode, columns[name])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        payload += values.tobytes()
+    if compress:
+        payload = zlib.compress(bytes(payload))
+        flags |= COMPRESSED
+    return HEADER.pack(MAGIC, VERSION, flags, len(points), times[0]) + bytes(payload)
+
+
+def decode(block):
+    """Unpack a block into ``{field: [values]}`` with timestamps under ``timestamp``"""
+    block = bytes(block)
+    magic, version, flags, count, base = HEADER.unpack_from(block)
+    if magic != MAGIC or version != VERSION:
+        raise ArchiveError(f'Not a v{VERSION} location archive block')
+    payload = block[HEADER.size:]
+    if flags & COMPRESSED:
+        payload = zlib.decompress(payload)
+
+    columns = {}
+    offset = 0
+    for name, typecode, dtype, places, missing in COLUMNS:
+        if name == 'time_delta' and flags & WIDE_TIMES:
+            typecode = 'q'
+        values = array.array(typecode)
+        size = values.itemsize * count
+        values.frombytes(payload[offset:offset + size])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        offset += size
+        if name == 'time_delta':
+            timestamps = []
+            current = base
+            for delta in values:
+                current += delta
+                timestamps.append(EPOCH + timedelta(milliseconds=current))
+            columns['timestamp'] = timestamps
+        elif places:
+            columns[name] = [None if value == missing else Decimal(value).scaleb(-places) for value in values]
+        else:
+            columns[name] = [None if value == missing else value for value in values]
+    if offset != len(payload):
+        raise ArchiveError(f'Block holds {len(payload)} bytes of columns, expected {offset}')
+    return columns
+
+
+def read_points(archive):
+    """Unsaved LocationData instances for an archive, oldest first"""
+    columns = decode(archive.data)
+    names = list(columns)
+    return [
+        LocationData(device_id=archive.device_id, raw_data={}, **dict(zip(names, values)))
+        for values in zip(*columns.values())
+    ]
+
+
+def day_bounds(day):
+    """Aware start and end of a local day"""
+    return (
+        timezone.make_aware(datetime.combine(day, time.min)),
+        timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min)),
+    )
+
+
+class LocationArchiver:
+    """
+    Moves LocationData older than ``after_days`` into per device-day blocks.
+
+    Days are archived oldest first, one device-day per transaction: the
+    block is written (merged with any block already there, for fixes that
+    arrived late) and the rows are deleted together, so an interrupted run
+    loses nothing and the next run carries on.
+    """
+
+    def __init__(self, after_days=None, now=None, compress=True):
+        self.after_days = after_days if after_days is not None else getattr(settings, 'GPS_ARCHIVE_AFTER_DAYS', 90)
+        self.now = now or timezone.now()
+        self.compress = compress
+        self.archived = 0
+        self.blocks = 0
+
+    @property
+    def cutoff(self):
+        return day_bounds(timezone.localdate(self.now) - timedelta(days=self.after_days))[0]
+
+    def run(self, max_days=None):
+        """Archive whole days before the cutoff, returning the number of days processed"""
+        days = 0
+        while max_days is None or days < max_days:
+            oldest = LocationData.objects.filter(timestamp__lt=self.cutoff).order_by('timestamp').values_list(
+                'timestamp', flat=True
+            ).first()
+            if oldest is None:
+                break
+            self.archive_day(timezone.localdate(oldest))
+            days += 1
+        return days
+
+    def archive_day(self, day):
+        start, end = day_bounds(day)
+        device_ids = LocationData.objects.filter(timestamp__gte=start, timestamp__lt=end).order_by().values_list(
+            'device_id', flat=True
+        ).distinct()
+        for device_id in list(device_ids):
+            self.archive_device_day(device_id, day)
+        logger.info(f'Archived location history for {day}')
+
+    def archive_device_day(self, device_id, day):
+        """Fold a device's live fixes for ``day`` into its block, returning the number moved"""
+        start, end = day_bounds(day)
+        with transaction.atomic():
+            archive = LocationArchive.objects.select_for_update().filter(device_id=device_id, day=day).first()
+            fixes = list(
+                LocationData.objects.filter(device_id=device_id, timestamp__gte=start, timestamp__lt=end)
+                .order_by('timestamp', 'id')
+                .only(*POINT_FIELDS)
+            )
+            if not fixes:
+                return 0
+            points = fixes + (read_points(archive) if archive is not None else [])
+            points.sort(key=lambda point: point.timestamp)
+            if archive is None:
+                archive = LocationArchive(device_id=device_id, day=day)
+            archive.data = encode(points, self.compress)
+            archive.point_count = len(points)
+            archive.start_time = points[0].timestamp
+            archive.end_time = points[-1].timestamp
+            archive.save()
+            ids = [fix.id for fix in fixes]
+            for index in range(0, len(ids), 1000):
+                LocationData.objects.filter(pk__in=ids[index:index + 1000]).delete()
+        self.archived += len(fixes)
+        self.blocks += 1
+        return len(fixes)
+
+
+def archived_points(device_ids, since=None, until=None):
+    """Archived fixes of the given devices (all with None) within ``[since, until]``, block by block"""
+    archives = LocationArchive.objects.all()
+    if device_ids is not None:
+        archives = archives.filter(device_id__in=device_ids)
+    if since is not None:
+        archives = archives.filter(end_time__gte=since)
+    if until is not None:
+        archives = archives.filter(start_time__lte=until)
+    for archive in archives.order_by('day', 'device_id').iterator(chunk_size=100):
+        for point in read_points(archive):
+            if (since is None or point.timestamp >= since) and (until is None or point.timestamp <= until):
+                yield point
+
+
+def history_key(point):
+    """
+    Position of a fix in newest-first history: ``(timestamp, id)``.
+
+    Archived fixes have no id; they take ``-device_id`` so they sort below
+    live rows of the same instant and stay distinct across devices.
+    """
+    return point.timestamp, point.id if point.id is not None else -point.device_id
+
+
+class DaySegment:
+    """Newest-first fixes of one local day: archive blocks plus rows that arrived after archiving"""
+
+    def __init__(self, day, archives, live, since, until, after=None):
+        self.day = day
+        self.archives = archives
+        self.live = live
+        self.since = since
+        self.until = until
+        self.after = after
+        self._points = None
+
+    def count(self):
+        if self._points is None and all(self.inside(archive) for archive in self.archives):
+            return sum(archive.point_count for archive in self.archives) + self.live.count()
+        return len(self.points)
+
+    def inside(self, archive):
+        if self.after is not None and archive.end_time >= self.after[0]:
+            return False
+        return archive.start_time >= self.since and (self.until is None or archive.end_time <= self.until)
+
+    def includes(self, point):
+        if point.timestamp < self.since or (self.until is not None and point.timestamp > self.until):
+            return False
+        return self.after is None or history_key(point) < self.after
+
+    @property
+    def points(self):
+        if self._points is None:
+            points = list(self.live)
+            for archive in self.archives:
+                points.extend(point for point in read_points(archive) if self.includes(point))
+            points.sort(key=history_key, reverse=True)
+            self._points = points
+        return self._points
+
+    def __iter__(self):
+        return iter(self.points)
+
+    def __getitem__(self, index):
+        return self.points[index]
+
+
+class LocationHistory:
+    """
+    Newest-first sequence over live LocationData and archived blocks.
+
+    ``queryset`` must already be limited to the devices and the
+    ``[since, until]`` range; archives of ``device_ids`` in that range are
+    merged in. It supports ``len()`` and slicing like a list, so paginators
+    can page through years of history while only the blocks on the
+    requested page are decoded.
+
+    It is ordered by ``history_key``; ``after()`` and ``head()`` let keyset
+    paginators resume below a key without counting what came before.
+    """
+    model = LocationData
+    ordering = ('-timestamp', '-id')
+
+    def __init__(self, queryset, device_ids, since, until=None, after=None):
+        self.queryset = queryset
+        self.device_ids = device_ids
+        self.since = since
+        self.until = until
+        self.boundary = after
+        if after is not None:
+            timestamp, key = after
+            queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=key))
+            until = timestamp if until is None else min(until, timestamp)
+        archives = LocationArchive.objects.filter(device_id__in=device_ids, end_time__gte=since).defer('data')
+        if until is not None:
+            archives = archives.filter(start_time__lte=until)
+        self._lengths = None
+        by_day = {}
+        for archive in archives:
+            by_day.setdefault(archive.day, []).append(archive)
+        self.archives = [archive for day_archives in by_day.values() for archive in day_archives]
+        self.segments = []
+        if not by_day:
+            self.segments.append(queryset.order_by(*self.ordering))
+            return
+
+        horizon = day_bounds(max(by_day))[1]
+        self.segments.append(queryset.filter(timestamp__gte=horizon).order_by(*self.ordering))
+        # Live rows below the horizon: stragglers of archived days or days not archived yet
+        older = queryset.filter(timestamp__lt=horizon)
+        live_days = older.annotate(day=TruncDate('timestamp')).order_by().values_list('day', flat=True).distinct()
+        for day in sorted(set(by_day) | set(live_days), reverse=True):
+            start, end = day_bounds(day)
+            live = older.filter(timestamp__gte=start, timestamp__lt=end)
+            self.segments.append(DaySegment(day, by_day.get(day, []), live, since, until, after))
+
+    def after(self, key):
+        """The history below ``key``, a ``history_key`` of a listed fix"""
+        return LocationHistory(self.queryset, self.device_ids, self.since, self.until, after=tuple(key))
+
+    def head(self, count):
+        """The first ``count`` fixes, touching only the segments they come from"""
+        items = []
+        for segment in self.segments:
+            if len(items) >= count:
+                break
+            items.extend(segment[:count - len(items)])
+        return items
+
+    def cursor_values(self, point):
+        return list(history_key(point))
+
+    def estimate_count(self, estimate):
+        """
+        Approximate length: ``estimate(queryset)`` for the live rows plus the
+        archived point counts, or None when the estimate is not available.
+        """
+        live = estimate(self.queryset)
+        if live is None:
+            return None
+        return live + sum(archive.point_count for archive in self.archives)
+
+    @property
+    def lengths(self):
+        if self._lengths is None:
+            self._lengths = [segment.count() for segment in self.segments]
+        return self._lengths
+
+    def count(self):
+        return sum(self.lengths)
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        for segment in self.segments:
+            yield from segment
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            items = self[index:index + 1]
+            if not items:
+                raise IndexError(index)
+            return items[0]
+        start, stop, step = index.indices(self.count())
+        items = []
+        offset = 0
+        for segment, length in zip(self.segments, self.lengths):
+            if stop <= offset:
+                break
+            if start < offset + length:
+                items.extend(segment[max(start - offset, 0):stop - offset])
+            offset += length
+        return items[::step] if step != 1 else items
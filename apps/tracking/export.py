@@ -0,0 +1,138 @@
+"""
+Streaming exports of a device's location history as GPX, GeoJSON or CSV.
+
+Live rows are read with ``values_list(...).iterator(chunk_size=...)`` and
+merged in time order with archived days decoded one block at a time; each
+format is written ``EXPORT_BATCH`` fixes per chunk. Memory stays flat
+however long the range, and the first bytes go out before the last rows
+are read.
+"""
+import csv
+import heapq
+import json
+from datetime import timezone as dt_timezone
+from itertools import islice
+from operator import itemgetter
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, slugify
+
+from .archive import archived_points
+from .models import LocationData
+
+EXPORT_FIELDS = (
+    'timestamp', 'latitude', 'longitude', 'altitude', 'speed', 'heading', 'accuracy', 'battery_level',
+    'signal_strength',
+)
+# name: (media type, file extension)
+EXPORT_FORMATS = {
+    'gpx': ('application/gpx+xml', 'gpx'),
+    'geojson': ('application/geo+json', 'geojson'),
+    'csv': ('text/csv', 'csv'),
+}
+EXPORT_BATCH = 500
+
+
+def export_rows(device_id, since, until=None, chunk_size=None):
+    """``EXPORT_FIELDS`` tuples of a device's live and archived fixes over ``[since, until]``, oldest first"""
+    chunk_size = chunk_size or getattr(settings, 'GPS_EXPORT_CHUNK_SIZE', 2000)
+    live = LocationData.objects.filter(device_id=device_id, timestamp__gte=since)
+    if until is not None:
+        live = live.filter(timestamp__lte=until)
+    live = live.order_by('timestamp', 'id').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    archived = (
+        tuple(getattr(point, field) for field in EXPORT_FIELDS)
+        for point in archived_points([device_id], since, until)
+    )
+    return heapq.merge(archived, live, key=itemgetter(0))
+
+
+def batches(rows, size=EXPORT_BATCH):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def utc(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def number(value):
+    return float(value) if value is not None else None
+
+
+def gpx_chunks(device, rows):
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx version="1.1" creator="GPS Store" xmlns="http://www.topografix.com/GPX/1/1">\n'
+        f'<trk><name>{escape(device.name)}</name><trkseg>\n'
+    )
+    for batch in batches(rows):
+        yield ''.join(
+            f'<trkpt lat={quoteattr(str(lat))} lon={quoteattr(str(lng))}>'
+            + (f'<ele>{altitude}</ele>' if altitude is not None else '')
+            + f'<time>{utc(timestamp)}</time></trkpt>\n'
+            for timestamp, lat, lng, altitude, *_ in batch
+        )
+    yield '</trkseg></trk>\n</gpx>\n'
+
+
+def geojson_chunks(device, rows):
+    """A FeatureCollection with one Point feature per fix"""
+    header = {'type': 'FeatureCollection', 'properties': {'device_id': device.id, 'device_name': device.name}}
+    yield json.dumps(header)[:-1] + ', "features": ['
+    separator = '\n'
+    for batch in batches(rows):
+        features = []
+        for timestamp, lat, lng, altitude, speed, heading, accuracy, battery, signal in batch:
+            coordinates = [float(lng), float(lat)] + ([float(altitude)] if altitude is not None else [])
+            features.append(json.dumps({
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': coordinates},
+                'properties': {
+                    'time': utc(timestamp), 'speed': number(speed), 'heading': number(heading),
+                    'accuracy': number(accuracy), 'battery_level': battery, 'signal_strength': signal,
+                },
+            }))
+        yield separator + ',\n'.join(features)
+        separator = ',\n'
+    yield '\n]}\n'
+
+
+class Echo:
+    """File-like object for csv.writer that hands each line back instead of buffering it"""
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(device, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for batch in batches(rows):
+        yield ''.join(writer.writerow((utc(row[0]), *row[1:])) for row in batch)
+
+
+WRITERS = {'gpx': gpx_chunks, 'geojson': geojson_chunks, 'csv': csv_chunks}
+
+
+def export_response(name, device, rows, filename, compress=False):
+    """
+    Attachment streaming ``rows`` in the ``name`` format.
+
+    With ``compress`` the body is gzipped on the fly with
+    ``Content-Encoding: gzip``, chunk by chunk.
+    """
+    media_type, extension = EXPORT_FORMATS[name]
+    content = (chunk.encode() for chunk in WRITERS[name](device, rows))
+    if compress:
+        content = compress_sequence(content)
+    response = StreamingHttpResponse(content, content_type=f'{media_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{slugify(filename)}.{extension}"'
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
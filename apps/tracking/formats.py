@@ -0,0 +1,128 @@
+"""
+Compact representations of location tracks.
+
+Besides the default JSON, history endpoints can answer with:
+
+* ``polyline`` (``application/vnd.google.polyline+json``): the coordinates as
+  a Google encoded polyline (1e-5 degree precision) plus ``times``, the
+  first fix in epoch seconds followed by second deltas.
+* ``track`` (``application/vnd.gps.track``): an uncompressed archive block
+  (see apps.tracking.archive), i.e. little-endian int32 microdegrees, ms time
+  deltas and the scaled speed/heading/battery columns, readable with NumPy.
+
+Both list fixes oldest first.
+"""
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+
+from .archive import encode
+
+JSON_MEDIA_TYPE = 'application/json'
+POLYLINE_MEDIA_TYPE = 'application/vnd.google.polyline+json'
+TRACK_MEDIA_TYPE = 'application/vnd.gps.track'
+TRACK_FORMATS = {'json': JSON_MEDIA_TYPE, 'polyline': POLYLINE_MEDIA_TYPE, 'track': TRACK_MEDIA_TYPE}
+
+TrackPoint = namedtuple(
+    'TrackPoint',
+    ('timestamp', 'latitude', 'longitude', 'altitude', 'speed', 'heading', 'accuracy', 'battery_level',
+     'signal_strength'),
+    defaults=(None,) * 6,
+)
+
+
+def vertex_point(vertex):
+    """TrackPoint for a simplified ``(lat, lng, epoch, speed, battery)`` vertex"""
+    lat, lng, epoch, speed, battery = vertex
+    return TrackPoint(datetime.fromtimestamp(epoch, tz=dt_timezone.utc), lat, lng, speed=speed, battery_level=battery)
+
+
+def encode_polyline(coordinates, precision=5):
+    """Google encoded polyline for ``(lat, lng)`` pairs"""
+    factor = 10 ** precision
+    chunks = []
+    previous_lat = previous_lng = 0
+    for lat, lng in coordinates:
+        lat, lng = round(float(lat) * factor), round(float(lng) * factor)
+        for delta in (lat - previous_lat, lng - previous_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous_lat, previous_lng = lat, lng
+    return ''.join(chunks)
+
+
+def decode_polyline(polyline, precision=5):
+    """``(lat, lng)`` pairs from a Google encoded polyline"""
+    coordinates = []
+    index = lat = lng = 0
+    factor = 10 ** precision
+    while index < len(polyline):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(polyline[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        coordinates.append((lat / factor, lng / factor))
+    return coordinates
+
+
+def polyline_payload(points):
+    points = sorted(points, key=lambda point: point.timestamp)
+    seconds = [round(point.timestamp.timestamp()) for point in points]
+    return {
+        'points': len(points),
+        'polyline': encode_polyline((point.latitude, point.longitude) for point in points),
+        'times': seconds[:1] + [later - earlier for earlier, later in zip(seconds, seconds[1:])],
+    }
+
+
+def pack_points(points):
+    """Uncompressed archive block for the points, or an empty body without any"""
+    return encode(points, compress=False) if points else b''
+
+
+def requested_format(request):
+    """
+    ``json``, ``polyline`` or ``track``, from ``?format=`` or the Accept header.
+
+    JSON stays the default for browsers and clients that send ``*/*``.
+    """
+    name = request.GET.get('format')
+    if name in TRACK_FORMATS:
+        return name
+    media_type = request.get_preferred_type(list(TRACK_FORMATS.values()))
+    for name, candidate in TRACK_FORMATS.items():
+        if media_type == candidate:
+            return name
+    return 'json'
+
+
+def compact_response(name, points, metadata):
+    """
+    ``polyline`` or ``track`` response for ``points``.
+
+    ``metadata`` (device, window...) goes next to the polyline fields, or
+    into ``X-`` headers alongside the binary block.
+    """
+    if name == 'polyline':
+        response = JsonResponse({**metadata, **polyline_payload(points)}, content_type=POLYLINE_MEDIA_TYPE)
+    else:
+        response = HttpResponse(pack_points(points), content_type=TRACK_MEDIA_TYPE)
+        for key, value in metadata.items():
+            response[f"X-{key.replace('_', '-').title()}"] = str(value)
+        response['X-Point-Count'] = str(len(points))
+    patch_vary_headers(response, ['Accept'])
+    return response
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from apps.tracking.archive import LocationArchiver
+
+
+class Command(BaseCommand):
+    help = 'Pack location fixes older than GPS_ARCHIVE_AFTER_DAYS into compact per device-day archive blocks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after-days', type=int, default=None, help='Archive days older than this many days')
+        parser.add_argument('--max-days', type=int, default=None, help='Stop after archiving this many days')
+        parser.add_argument('--no-compress', action='store_true', help='Store the columns without zlib compression')
+
+    def handle(self, *args, **options):
+        archiver = LocationArchiver(after_days=options['after_days'], compress=not options['no_compress'])
+        try:
+            days = archiver.run(max_days=options['max_days'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping archiver; the next run carries on from the oldest live day')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archiver.archived} fixes from {days} days into {archiver.blocks} blocks '
+            f'(everything before {archiver.cutoff:%Y-%m-%d})'
+        ))
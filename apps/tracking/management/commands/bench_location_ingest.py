@@ -0,0 +1,65 @@
+import json
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from apps.gps_devices.models import Device
+from apps.tracking.processing import LocationUpdateProcessor
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Compare p50/p99 response latency of the synchronous and queued location update endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('device_id', type=int, help='Device to post fixes for')
+        parser.add_argument('--requests', type=int, default=500, help='Requests sent to each endpoint')
+        parser.add_argument('--keep', action='store_true', help='Keep the rows written by the benchmark')
+
+    def handle(self, *args, **options):
+        try:
+            device = Device.objects.select_related('user').get(pk=options['device_id'])
+        except Device.DoesNotExist:
+            raise CommandError(f'Device {options["device_id"]} does not exist')
+
+        client = Client()
+        client.force_login(device.user)
+        endpoints = [
+            ('sync', reverse('tracking:update_device_location', args=[device.id]), 200),
+            ('queue', reverse('tracking:enqueue_device_location', args=[device.id]), 202),
+        ]
+        self.stdout.write(f'{"mode":<8} {"p50 ms":>10} {"p99 ms":>10} {"mean ms":>10}')
+        # Pin the plain endpoint to sync mode so the two columns are comparable
+        with override_settings(GPS_LOCATION_INGEST_MODE='sync'), transaction.atomic():
+            for mode, url, expected in endpoints:
+                samples = []
+                for _ in range(options['requests']):
+                    body = json.dumps({
+                        'latitude': round(35.6892 + random.uniform(-0.05, 0.05), 6),
+                        'longitude': round(51.3890 + random.uniform(-0.05, 0.05), 6),
+                        'speed': round(random.uniform(0, 120), 2),
+                        'timestamp': timezone.now().isoformat(),
+                    })
+                    started = time.perf_counter()
+                    response = client.post(url, body, content_type='application/json')
+                    samples.append((time.perf_counter() - started) * 1000)
+                    if response.status_code != expected:
+                        raise CommandError(f'{mode} endpoint answered {response.status_code}: {response.content!r}')
+                self.stdout.write(
+                    f'{mode:<8} {percentile(samples, 0.5):>10.2f} {percentile(samples, 0.99):>10.2f} '
+                    f'{statistics.fmean(samples):>10.2f}'
+                )
+
+            processor = LocationUpdateProcessor()
+            consumed, rate = processor.run(once=True)
+            self.stdout.write(f'Worker applied {consumed} queued updates at {rate:.0f} updates/sec')
+            if not options['keep']:
+                transaction.set_rollback(True)
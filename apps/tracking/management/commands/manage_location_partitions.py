@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from apps.tracking.partitions import create_partitions, detach_partitions, is_partitioned, list_partitions
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly LocationData partitions and detach old ones (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3, help='Months of future partitions to keep ready')
+        parser.add_argument(
+            '--retain',
+            type=int,
+            default=None,
+            help='Detach partitions that ended more than this many months ago (default: keep all)',
+        )
+        parser.add_argument('--drop', action='store_true', help='Drop detached partitions instead of keeping them')
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            self.stdout.write('LocationData is not partitioned on this database, nothing to do')
+            return
+        for name in create_partitions(ahead=options['ahead']):
+            self.stdout.write(f'Created {name}')
+        if options['retain'] is not None:
+            for name in detach_partitions(options['retain'], drop=options['drop']):
+                self.stdout.write(f'{"Dropped" if options["drop"] else "Detached"} {name}')
+        self.stdout.write(self.style.SUCCESS(f'{len(list_partitions())} monthly partitions attached'))
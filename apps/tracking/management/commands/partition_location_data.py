@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from apps.tracking.partitions import list_partitions, partition_table
+
+
+class Command(BaseCommand):
+    help = (
+        'Convert LocationData into a table partitioned by month (PostgreSQL). Copies every row under an '
+        'exclusive lock, so run it in a maintenance window and take a backup first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3, help='Months of future partitions to create')
+        parser.add_argument('--yes', action='store_true', help='Do not ask for confirmation')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write('LocationData can only be partitioned on PostgreSQL, nothing to do')
+            return
+        if not options['yes']:
+            answer = input('This rebuilds the location table and blocks writes until it is done. Continue? [y/N] ')
+            if answer.strip().lower() != 'y':
+                raise CommandError('Aborted')
+        try:
+            copied = partition_table(ahead=options['ahead'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'Partitioned LocationData: {copied} rows copied into {len(list_partitions())} monthly partitions'
+        ))
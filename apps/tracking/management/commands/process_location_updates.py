@@ -0,0 +1,43 @@
+import logging
+from django.core.management.base import BaseCommand
+from apps.tracking.processing import LocationUpdateProcessor
+from apps.tracking.rollups import RollupBuilder
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Apply queued LocationUpdate rows: store fixes, move devices and evaluate geofence alerts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Queued updates claimed per transaction')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is drained')
+        parser.add_argument('--sleep', type=float, default=0.2, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--max-rows', type=int, default=None, help='Stop after consuming this many updates')
+        parser.add_argument(
+            '--no-rollups', action='store_true', help='Leave the hourly/daily rollups to update_location_rollups'
+        )
+
+    def handle(self, *args, **options):
+        processor = LocationUpdateProcessor(
+            chunk_size=options['chunk_size'],
+            rollups=None if options['no_rollups'] else RollupBuilder(),
+        )
+
+        def report(count, rate):
+            logger.info(f'Applied chunk of {count} location updates ({rate:.0f} updates/sec)')
+
+        try:
+            consumed, rate = processor.run(
+                once=options['once'],
+                idle_sleep=options['sleep'],
+                max_rows=options['max_rows'],
+                report=report,
+            )
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping location update worker')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Consumed {consumed} location updates ({processor.processed} ok, {processor.failed} failed) '
+            f'at {rate:.0f} updates/sec'
+        ))
@@ -0,0 +1,42 @@
+import logging
+from django.core.management.base import BaseCommand
+from apps.tracking.processing import RawGPSProcessor
+from apps.tracking.rollups import RollupBuilder
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Convert unprocessed RawGPSData rows into LocationData (safe to run as several parallel workers)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Raw rows claimed per transaction')
+        parser.add_argument('--once', action='store_true', help='Exit once the backlog is drained')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when there is nothing to process')
+        parser.add_argument('--max-rows', type=int, default=None, help='Stop after consuming this many rows')
+        parser.add_argument(
+            '--no-rollups', action='store_true', help='Leave the hourly/daily rollups to update_location_rollups'
+        )
+
+    def handle(self, *args, **options):
+        processor = RawGPSProcessor(
+            chunk_size=options['chunk_size'],
+            rollups=None if options['no_rollups'] else RollupBuilder(),
+        )
+
+        def report(count, rate):
+            logger.info(f'Processed chunk of {count} raw rows ({rate:.0f} rows/sec)')
+
+        try:
+            consumed, rate = processor.run(
+                once=options['once'],
+                idle_sleep=options['sleep'],
+                max_rows=options['max_rows'],
+                report=report,
+            )
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping raw GPS processor')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Consumed {consumed} raw rows ({processor.processed} ok, {processor.failed} failed) at {rate:.0f} rows/sec'
+        ))
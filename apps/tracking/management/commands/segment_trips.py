@@ -0,0 +1,51 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.gps_devices.models import Device
+from apps.tracking.trips import TripBuilder
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Detect trips and stops in new LocationData, resuming from each device\'s checkpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', type=int, action='append', dest='devices', help='Only this device id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=None, help='Fixes segmented per transaction')
+        parser.add_argument('--lag', type=float, default=None, help='Seconds after it is received before a fix is used')
+        parser.add_argument('--max-rows', type=int, default=None, help='Stop after consuming this many fixes')
+        parser.add_argument('--follow', action='store_true', help='Keep running, catching up every --sleep seconds')
+        parser.add_argument('--sleep', type=float, default=30.0, help='Seconds between catch-ups with --follow')
+        parser.add_argument(
+            '--rebuild',
+            type=int,
+            default=None,
+            metavar='DAYS',
+            help='Segment the last DAYS days again, archived days included, replacing their trips and stops',
+        )
+
+    def handle(self, *args, **options):
+        builder = TripBuilder(batch_size=options['batch_size'], lag=options['lag'])
+        device_ids = options['devices']
+        if options['rebuild'] is not None:
+            since = timezone.now() - timezone.timedelta(days=options['rebuild'])
+            rebuilt = 0
+            for device_id in device_ids or Device.objects.order_by('id').values_list('id', flat=True):
+                rebuilt += builder.rebuild(device_id, since)
+            self.stdout.write(f'Segmented {rebuilt} stored fixes again')
+
+        try:
+            while True:
+                started = time.monotonic()
+                consumed = builder.catch_up(device_ids, max_rows=options['max_rows'])
+                if consumed:
+                    elapsed = max(time.monotonic() - started, 1e-9)
+                    logger.info(f'Segmented {consumed} fixes into trips ({consumed / elapsed:.0f} fixes/sec)')
+                if not options['follow']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping trip segmentation')
+        self.stdout.write(self.style.SUCCESS(f'Segmented {builder.consumed} fixes into trips and stops'))
@@ -0,0 +1,46 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.tracking.rollups import RollupBuilder
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Fold new LocationData into the hourly and daily rollups (only rows added since the last run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Fixes folded per transaction')
+        parser.add_argument('--lag', type=float, default=None, help='Seconds a fix must settle before it is folded (not on PostgreSQL)')
+        parser.add_argument('--max-rows', type=int, default=None, help='Stop after folding this many fixes')
+        parser.add_argument('--follow', action='store_true', help='Keep running, catching up every --sleep seconds')
+        parser.add_argument('--sleep', type=float, default=10.0, help='Seconds between catch-ups with --follow')
+        parser.add_argument(
+            '--rebuild',
+            type=int,
+            default=None,
+            metavar='DAYS',
+            help='Recompute the rollups of the last DAYS days from the stored fixes first',
+        )
+
+    def handle(self, *args, **options):
+        builder = RollupBuilder(batch_size=options['batch_size'], lag=options['lag'])
+        if options['rebuild'] is not None:
+            since = timezone.now() - timezone.timedelta(days=options['rebuild'])
+            rebuilt = builder.rebuild(since)
+            self.stdout.write(f'Rebuilt rollups from {rebuilt} stored fixes')
+
+        try:
+            while True:
+                started = time.monotonic()
+                folded = builder.catch_up(max_rows=options['max_rows'])
+                if folded:
+                    elapsed = max(time.monotonic() - started, 1e-9)
+                    logger.info(f'Folded {folded} fixes into rollups ({folded / elapsed:.0f} fixes/sec)')
+                if not options['follow']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping rollup updates')
+        self.stdout.write(self.style.SUCCESS(f'Folded {builder.folded} fixes into location rollups'))
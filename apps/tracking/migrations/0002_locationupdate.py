@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gps_devices', '0007_spoolcheckpoint'),
+        ('tracking', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField(help_text='Location fix as posted by the device')),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed', models.BooleanField(default=False)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('error_message', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Location Update',
+                'verbose_name_plural': 'Location Updates',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['alert_type'], name='tracking_al_alert_t_845c35_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['severity'], name='tracking_al_severit_099b20_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='locationdata',
+            index=models.Index(fields=['timestamp'], name='tracking_lo_timesta_b7e871_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='locationdata',
+            index=models.Index(fields=['device', 'timestamp'], name='tracking_lo_device__c4822e_idx'),
+        ),
+        migrations.AddField(
+            model_name='locationupdate',
+            name='device',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_updates', to='gps_devices.device'),
+        ),
+        migrations.AddIndex(
+            model_name='locationupdate',
+            index=models.Index(fields=['processed', 'id'], name='tracking_lo_process_b426a9_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0002_locationupdate'),
+    ]
+
+    # Dropping the FK constraint lets the table be partitioned later with
+    # manage.py partition_location_data; the conversion is not a migration.
+    operations = [
+        migrations.AlterField(
+            model_name='alert',
+            name='location_data',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='tracking.locationdata'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gps_devices', '0007_spoolcheckpoint'),
+        ('tracking', '0003_partition_locationdata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LocationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField(help_text='Start of the hour or day')),
+                ('point_count', models.PositiveIntegerField(default=0)),
+                ('distance_km', models.FloatField(default=0)),
+                ('max_speed', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('speed_total', models.FloatField(default=0, help_text='Sum of reported speeds, for the average')),
+                ('speed_samples', models.PositiveIntegerField(default=0)),
+                ('min_battery', models.PositiveIntegerField(blank=True, null=True)),
+                ('first_time', models.DateTimeField()),
+                ('first_lat', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('first_lng', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('last_time', models.DateTimeField()),
+                ('last_lat', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('last_lng', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('min_lat', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('max_lat', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('min_lng', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('max_lng', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_rollups', to='gps_devices.device')),
+            ],
+            options={
+                'verbose_name': 'Location Rollup',
+                'verbose_name_plural': 'Location Rollups',
+                'ordering': ['device', 'period', 'bucket'],
+                'constraints': [models.UniqueConstraint(fields=('device', 'period', 'bucket'), name='unique_location_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gps_devices', '0007_spoolcheckpoint'),
+        ('tracking', '0004_location_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Local day the fixes were recorded on')),
+                ('start_time', models.DateTimeField(help_text='Timestamp of the first fix in the block')),
+                ('end_time', models.DateTimeField(help_text='Timestamp of the last fix in the block')),
+                ('point_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_archives', to='gps_devices.device')),
+            ],
+            options={
+                'verbose_name': 'Location Archive',
+                'verbose_name_plural': 'Location Archives',
+                'ordering': ['device', '-day'],
+                'indexes': [models.Index(fields=['day'], name='tracking_lo_day_2c5fdd_idx')],
+                'constraints': [models.UniqueConstraint(fields=('device', 'day'), name='unique_location_archive')],
+            },
+        ),
+    ]
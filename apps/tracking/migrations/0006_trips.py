@@ -0,0 +1,73 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gps_devices', '0007_spoolcheckpoint'),
+        ('tracking', '0005_location_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('state', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('device', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trip_checkpoint', to='gps_devices.device')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Stop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('latitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('longitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('point_count', models.PositiveIntegerField(default=0)),
+                ('is_open', models.BooleanField(default=True, help_text='The device has not moved away yet')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stops', to='gps_devices.device')),
+            ],
+            options={
+                'verbose_name': 'Stop',
+                'verbose_name_plural': 'Stops',
+                'ordering': ['device', '-start_time'],
+                'indexes': [models.Index(fields=['device', '-start_time'], name='tracking_st_device__d65897_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Trip',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('start_latitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('start_longitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('end_latitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('end_longitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('distance_km', models.FloatField(default=0)),
+                ('point_count', models.PositiveIntegerField(default=0)),
+                ('max_speed', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('avg_speed', models.FloatField(blank=True, help_text='Distance over duration, in km/h', null=True)),
+                ('is_open', models.BooleanField(default=True, help_text='Still in progress: no stop detected yet')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trips', to='gps_devices.device')),
+            ],
+            options={
+                'verbose_name': 'Trip',
+                'verbose_name_plural': 'Trips',
+                'ordering': ['device', '-start_time'],
+                'indexes': [models.Index(fields=['device', '-start_time'], name='tracking_tr_device__eeabac_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0006_trips'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollupcheckpoint',
+            name='pending_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rollupcheckpoint',
+            name='pending_xid',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rollupcheckpoint',
+            name='ready_id',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
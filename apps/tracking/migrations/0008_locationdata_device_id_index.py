@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gps_devices', '0007_spoolcheckpoint'),
+        ('tracking', '0007_rollup_commit_horizon'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='locationdata',
+            index=models.Index(fields=['device', 'id'], name='tracking_lo_device__c28514_idx'),
+        ),
+    ]
@@ -1,12 +1,17 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from apps.gps_devices.models import Device
 
 
 class LocationData(models.Model):
     """
     GPS location data points from devices
+
+    On PostgreSQL the table can be partitioned by month on ``timestamp``
+    (``partition_location_data``, then ``manage_location_partitions``), so
+    history queries should always be bounded in time.
     """
     device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='location_data')
     latitude = models.DecimalField(max_digits=9, decimal_places=6, validators=[MinValueValidator(-90), MaxValueValidator(90)])
@@ -39,6 +44,7 @@ class LocationData(models.Model):
             models.Index(fields=['latitude', 'longitude']),
             models.Index(fields=['timestamp']),
             models.Index(fields=['device', 'timestamp']),
+            models.Index(fields=['device', 'id']),
         ]
 
 
@@ -150,7 +156,10 @@ class Alert(models.Model):
     device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='alerts')
     alert_type = models.CharField(max_length=20, choices=ALERT_TYPES)
     message = models.TextField()
-    location_data = models.ForeignKey(LocationData, on_delete=models.SET_NULL, null=True, blank=True)
+    # No database constraint: a partitioned LocationData table has no unique index on id alone
+    location_data = models.ForeignKey(
+        LocationData, on_delete=models.SET_NULL, null=True, blank=True, db_constraint=False
+    )
 
     # Alert metadata
     severity = models.CharField(max_length=10, choices=[('low', 'کم'), ('medium', 'متوسط'), ('high', 'زیاد'), ('critical', 'بحرانی')], default='medium')
@@ -185,3 +194,230 @@ class Alert(models.Model):
             models.Index(fields=['alert_type']),
             models.Index(fields=['severity']),
         ]
+
+
+class LocationUpdate(models.Model):
+    """
+    Durable queue of accepted location updates awaiting the worker.
+
+    The fast-ack ingest path only validates and appends here; the primary
+    key doubles as the sequence number returned to the device.
+    process_location_updates applies the writes and geofence alerts.
+    """
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='location_updates')
+    payload = models.JSONField(help_text="Location fix as posted by the device")
+    received_at = models.DateTimeField(default=timezone.now)
+    processed = models.BooleanField(default=False)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    error_message = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Update #{self.pk} for device {self.device_id}"
+
+    class Meta:
+        verbose_name = 'Location Update'
+        verbose_name_plural = 'Location Updates'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['processed', 'id']),
+        ]
+
+
+class LocationRollup(models.Model):
+    """
+    Per-device summary of the fixes recorded in one hour or one day.
+
+    Buckets start on local (TIME_ZONE) hour and day boundaries. Rows are
+    maintained incrementally by apps.tracking.rollups from new LocationData,
+    so long-range reports read a few rows per day instead of every fix.
+    ``distance_km`` covers the segments between fixes inside the bucket;
+    the step from one bucket into the next is added when buckets are combined.
+    """
+    PERIOD_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='location_rollups')
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField(help_text="Start of the hour or day")
+
+    point_count = models.PositiveIntegerField(default=0)
+    distance_km = models.FloatField(default=0)
+    max_speed = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    speed_total = models.FloatField(default=0, help_text="Sum of reported speeds, for the average")
+    speed_samples = models.PositiveIntegerField(default=0)
+    min_battery = models.PositiveIntegerField(null=True, blank=True)
+
+    first_time = models.DateTimeField()
+    first_lat = models.DecimalField(max_digits=9, decimal_places=6)
+    first_lng = models.DecimalField(max_digits=9, decimal_places=6)
+    last_time = models.DateTimeField()
+    last_lat = models.DecimalField(max_digits=9, decimal_places=6)
+    last_lng = models.DecimalField(max_digits=9, decimal_places=6)
+
+    min_lat = models.DecimalField(max_digits=9, decimal_places=6)
+    max_lat = models.DecimalField(max_digits=9, decimal_places=6)
+    min_lng = models.DecimalField(max_digits=9, decimal_places=6)
+    max_lng = models.DecimalField(max_digits=9, decimal_places=6)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.device_id} {self.period} {self.bucket:%Y-%m-%d %H:%M}"
+
+    @property
+    def avg_speed(self):
+        return self.speed_total / self.speed_samples if self.speed_samples else None
+
+    class Meta:
+        verbose_name = 'Location Rollup'
+        verbose_name_plural = 'Location Rollups'
+        ordering = ['device', 'period', 'bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'period', 'bucket'], name='unique_location_rollup'),
+        ]
+
+
+class RollupCheckpoint(models.Model):
+    """
+    Highest LocationData id folded into the rollups.
+
+    The row is locked while a batch is folded, so the ingest workers and the
+    catch-up command can all advance it without counting a fix twice. On
+    PostgreSQL ``ready_id`` is the highest id known to have no uncommitted
+    rows below it, and ``pending_id`` the next candidate, ready once every
+    transaction before ``pending_xid`` has ended.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    ready_id = models.BigIntegerField(default=0)
+    pending_id = models.BigIntegerField(null=True, blank=True)
+    pending_xid = models.BigIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
+
+
+class LocationArchive(models.Model):
+    """
+    One device's fixes for one local day, packed into a columnar block.
+
+    Written by apps.tracking.archive once a day is older than
+    GPS_ARCHIVE_AFTER_DAYS; the matching LocationData rows are then deleted.
+    The block keeps every LocationData column except ``raw_data`` and
+    ``address``, at about 28 bytes per fix before compression.
+    """
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='location_archives')
+    day = models.DateField(help_text="Local day the fixes were recorded on")
+    start_time = models.DateTimeField(help_text="Timestamp of the first fix in the block")
+    end_time = models.DateTimeField(help_text="Timestamp of the last fix in the block")
+    point_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.device_id} on {self.day} ({self.point_count} fixes)"
+
+    class Meta:
+        verbose_name = 'Location Archive'
+        verbose_name_plural = 'Location Archives'
+        ordering = ['device', '-day']
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'day'], name='unique_location_archive'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+
+class Trip(models.Model):
+    """
+    A stretch of movement between two stops, detected by apps.tracking.trips.
+
+    The summary is kept up to date while the trip is open, so trip lists
+    read these rows only; playback reads the device's fixes between
+    ``start_time`` and ``end_time``.
+    """
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='trips')
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    start_latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    start_longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    end_latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    end_longitude = models.DecimalField(max_digits=9, decimal_places=6)
+
+    distance_km = models.FloatField(default=0)
+    point_count = models.PositiveIntegerField(default=0)
+    max_speed = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    avg_speed = models.FloatField(null=True, blank=True, help_text="Distance over duration, in km/h")
+    is_open = models.BooleanField(default=True, help_text="Still in progress: no stop detected yet")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.device_id} trip {self.start_time:%Y-%m-%d %H:%M} ({self.distance_km:.1f} km)"
+
+    @property
+    def duration(self):
+        return self.end_time - self.start_time
+
+    class Meta:
+        verbose_name = 'Trip'
+        verbose_name_plural = 'Trips'
+        ordering = ['device', '-start_time']
+        indexes = [
+            models.Index(fields=['device', '-start_time']),
+        ]
+
+
+class Stop(models.Model):
+    """A dwell of one device within a small radius, between two trips"""
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='stops')
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    point_count = models.PositiveIntegerField(default=0)
+    is_open = models.BooleanField(default=True, help_text="The device has not moved away yet")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.device_id} stop {self.start_time:%Y-%m-%d %H:%M}"
+
+    @property
+    def duration(self):
+        return self.end_time - self.start_time
+
+    class Meta:
+        verbose_name = 'Stop'
+        verbose_name_plural = 'Stops'
+        ordering = ['device', '-start_time']
+        indexes = [
+            models.Index(fields=['device', '-start_time']),
+        ]
+
+
+class TripCheckpoint(models.Model):
+    """
+    Where trip segmentation of a device stands.
+
+    ``last_id`` is the highest LocationData id consumed and
+    ``last_timestamp`` the time of the latest fix segmented; ``state`` holds
+    the open trip, stop or dwell candidate so the next run carries on
+    mid-segment.
+    """
+    device = models.OneToOneField(Device, on_delete=models.CASCADE, related_name='trip_checkpoint')
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    last_id = models.BigIntegerField(default=0)
+    state = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.device_id} @ {self.last_timestamp}"
@@ -0,0 +1,276 @@
+import logging
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+
+from .models import Alert, LocationData
+from .processing import to_timestamp
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = LocationData._meta.db_table
+ALERT_TABLE = Alert._meta.db_table
+ALERT_COLUMN = Alert._meta.get_field('location_data').column
+PARTITION_PATTERN = re.compile(rf'^{PARENT_TABLE}_y(\d{{4}})m(\d{{2}})$')
+
+
+def month_start(value):
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+    return f'{PARENT_TABLE}_y{month:%Y}m{month:%m}'
+
+
+def history_range(since=None, until=None, now=None):
+    """
+    Parse ``since``/``until`` into the bounds of a history query.
+
+    ``since`` defaults to ``GPS_LOCATION_HISTORY_DAYS`` before ``until`` so
+    that queries on the partitioned table only scan the months they need.
+    Raises ParseError for values that are not timestamps.
+    """
+    end = to_timestamp(until, None)
+    start = to_timestamp(since, None)
+    if start is None:
+        days = getattr(settings, 'GPS_LOCATION_HISTORY_DAYS', 30)
+        start = (end or now or timezone.now()) - timezone.timedelta(days=days)
+    return start, end
+
+
+def is_partitioned(using='default'):
+    """Whether LocationData is a natively partitioned table (PostgreSQL only)"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [PARENT_TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def list_partitions(using='default'):
+    """Monthly partitions currently attached, as ``{month_start: table_name}``"""
+    if not is_partitioned(using):
+        return {}
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = to_regclass(%s)',
+            [PARENT_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            partitions[datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)] = name
+    return partitions
+
+
+def partition_table(ahead=3, using='default'):
+    """
+    Rebuild LocationData as a table partitioned by month on ``timestamp``, returning the rows copied.
+
+    PostgreSQL only, run on demand by ``manage.py partition_location_data``.
+    Monthly partitions cover the oldest row to ``ahead`` months out, plus a
+    DEFAULT partition. The primary key becomes ``(id, timestamp)`` because a
+    partitioned table's unique constraints must include the partition key;
+    indexes and foreign keys are recreated and ids continue from the old
+    sequence. Everything runs in one transaction under an exclusive lock,
+    and it rolls back unless the row count, maximum id and sequence all
+    match the old table afterwards. Raises ValueError when the table cannot
+    be converted or a check fails.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        raise ValueError('Only PostgreSQL tables can be partitioned')
+    if is_partitioned(using):
+        raise ValueError(f'{PARENT_TABLE} is already partitioned')
+    table, old_table, sequence = PARENT_TABLE, f'{PARENT_TABLE}_unpartitioned', f'{PARENT_TABLE}_id_seq'
+    quote = connection.ops.quote_name
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(
+            "SELECT conrelid::regclass::text FROM pg_constraint WHERE confrelid = to_regclass(%s) AND contype = 'f'",
+            [table],
+        )
+        referencing = [row[0] for row in cursor.fetchall()]
+        if referencing:
+            raise ValueError(f'Foreign keys from {", ".join(referencing)} would block the conversion')
+        cursor.execute(
+            'SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s '
+            'AND indexname <> %s',
+            [table, f'{table}_pkey'],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = to_regclass(%s) "
+            "AND contype = 'f'",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f'SELECT count(*), min("timestamp"), max(id) FROM {quote(table)}')
+        count, first, last_id = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME CONSTRAINT {quote(table + "_pkey")} TO {quote(old_table + "_pkey")}')
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(old_table)}')
+        cursor.execute(
+            f'CREATE TABLE {quote(table)} (LIKE {quote(old_table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE ("timestamp")'
+        )
+        # The old id default or identity goes with the old table; a new sequence replaces it below
+        cursor.execute(f'ALTER TABLE {quote(table)} ALTER COLUMN id DROP DEFAULT')
+        cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(table + "_pkey")} PRIMARY KEY (id, "timestamp")')
+        current = month_start(timezone.now())
+        month = month_start(first) if first is not None else current
+        while month <= add_months(current, ahead):
+            cursor.execute(
+                f'CREATE TABLE {quote(partition_name(month))} PARTITION OF {quote(table)} '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            )
+            month = add_months(month, 1)
+        cursor.execute(f'CREATE TABLE {quote(table + "_default")} PARTITION OF {quote(table)} DEFAULT')
+
+        cursor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(old_table)}')
+        copied = cursor.rowcount
+        cursor.execute(f'DROP TABLE {quote(old_table)}')
+        cursor.execute(f'CREATE SEQUENCE {quote(sequence)} OWNED BY {quote(table)}.id')
+        cursor.execute(f"ALTER TABLE {quote(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        if last_id:
+            cursor.execute('SELECT setval(%s, %s)', [sequence, last_id])
+        for indexdef in indexes:
+            cursor.execute(indexdef)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}')
+
+        cursor.execute(f'SELECT count(*), max(id) FROM {quote(table)}')
+        if (copied, *cursor.fetchone()) != (count, count, last_id):
+            raise ValueError(f'Copied {copied} of {count} rows; the conversion was rolled back')
+        if last_id:
+            cursor.execute(f'SELECT last_value FROM {quote(sequence)}')
+            if cursor.fetchone()[0] != last_id:
+                raise ValueError(f'{sequence} is behind id {last_id}; the conversion was rolled back')
+    logger.info(f'Partitioned {table}: {copied} rows copied')
+    return copied
+
+
+def default_partition(cursor):
+    """Name of the DEFAULT partition catching rows outside the monthly ones, if there is one"""
+    cursor.execute(
+        'SELECT c.relname FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partdefid '
+        'WHERE p.partrelid = to_regclass(%s)',
+        [PARENT_TABLE],
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def create_partitions(ahead=3, now=None, using='default'):
+    """
+    Create the monthly partitions from this month to ``ahead`` months out, returning the new tables.
+
+    Rows that already landed in the DEFAULT partition for a month (fixes with
+    clocks far ahead) would make a plain ``PARTITION OF`` fail, so such a
+    month is built as a standalone table, its rows moved out of the default
+    partition, and then attached. Each month is its own transaction; one
+    that fails is logged and the others are still created.
+    """
+    if not is_partitioned(using):
+        return []
+    current = month_start(now or timezone.now())
+    existing = list_partitions(using)
+    created = []
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    for offset in range(ahead + 1):
+        month = add_months(current, offset)
+        if month in existing:
+            continue
+        name = partition_name(month)
+        # Bounds are generated here, never user input; DDL cannot take bind parameters
+        start, end = f"'{month.isoformat()}'", f"'{add_months(month, 1).isoformat()}'"
+        try:
+            with transaction.atomic(using=using), connection.cursor() as cursor:
+                default = default_partition(cursor)
+                stray = False
+                if default is not None:
+                    cursor.execute(
+                        f'SELECT EXISTS (SELECT 1 FROM {quote(default)} WHERE "timestamp" >= {start} AND "timestamp" < {end})'
+                    )
+                    stray = cursor.fetchone()[0]
+                if not stray:
+                    cursor.execute(
+                        f'CREATE TABLE {quote(name)} PARTITION OF {quote(PARENT_TABLE)} FOR VALUES FROM ({start}) TO ({end})'
+                    )
+                else:
+                    cursor.execute(
+                        f'CREATE TABLE {quote(name)} (LIKE {quote(PARENT_TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+                    )
+                    cursor.execute(
+                        f'WITH moved AS (DELETE FROM {quote(default)} WHERE "timestamp" >= {start} AND "timestamp" < {end} '
+                        f'RETURNING *) INSERT INTO {quote(name)} SELECT * FROM moved'
+                    )
+                    logger.info(f'Moved {cursor.rowcount} rows from {default} to {name}')
+                    # Attaching builds the parent's indexes on the new table
+                    cursor.execute(
+                        f'ALTER TABLE {quote(PARENT_TABLE)} ATTACH PARTITION {quote(name)} FOR VALUES FROM ({start}) TO ({end})'
+                    )
+        except DatabaseError:
+            logger.exception(f'Could not create location partition {name}')
+            continue
+        created.append(name)
+        logger.info(f'Created location partition {name}')
+    return created
+
+
+def detach_partitions(retain_months=None, now=None, drop=False, before=None, using='default'):
+    """
+    Detach monthly partitions that ended more than ``retain_months`` months ago, or by ``before``.
+
+    Detached tables keep their rows and can be archived or dropped later;
+    with ``drop`` they are removed straight away. Alerts pointing at their
+    fixes are unlinked first, as ``Alert.location_data`` has no database
+    constraint to do it. Returns the table names.
+    """
+    if not is_partitioned(using):
+        return []
+    cutoff = before or add_months(month_start(now or timezone.now()), -retain_months)
+    detached = []
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    for name in partitions_ending_before(cutoff, using):
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {quote(ALERT_TABLE)} SET {quote(ALERT_COLUMN)} = NULL '
+                f'WHERE {quote(ALERT_COLUMN)} IN (SELECT id FROM {quote(name)})'
+            )
+            cursor.execute(f'ALTER TABLE {quote(PARENT_TABLE)} DETACH PARTITION {quote(name)}')
+            if drop:
+                cursor.execute(f'DROP TABLE {quote(name)}')
+        detached.append(name)
+        logger.info(f'{"Dropped" if drop else "Detached"} location partition {name}')
+    return detached
+
+
+def estimate_rows(names, using='default'):
+    """Planner row estimates for the given partitions, cheap enough to report before dropping them"""
+    if not names:
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT coalesce(sum(greatest(reltuples, 0)), 0) FROM pg_class WHERE relname = ANY(%s)', [list(names)])
+        return int(cursor.fetchone()[0])
+
+
+def partitions_ending_before(cutoff, using='default'):
+    return [name for month, name in sorted(list_partitions(using).items()) if add_months(month, 1) <= cutoff]
+
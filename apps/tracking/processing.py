@@ -0,0 +1,278 @@
+import logging
+import time
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import Case, Q, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.gps_devices.ingest.fleet_table import get_fleet_table
+from apps.gps_devices.ingest.positions import get_position_store
+from apps.gps_devices.ingest.resolver import get_device_resolver
+from apps.gps_devices.models import Device, RawGPSData
+from apps.gps_devices.parsers.registry import ParseError, get_parser_registry
+from .alerts import check_geofence_alerts
+from .models import LocationData, LocationUpdate
+
+logger = logging.getLogger(__name__)
+
+LOCATION_FIELDS = ('altitude', 'speed', 'heading', 'accuracy', 'battery_level', 'signal_strength')
+# Largest magnitude each decimal column can store, so one bad fix cannot fail a whole bulk insert
+FIELD_LIMITS = {
+    field.name: Decimal(10) ** (field.max_digits - field.decimal_places)
+    for field in LocationData._meta.get_fields()
+    if field.name in LOCATION_FIELDS and getattr(field, 'max_digits', None)
+}
+# What building one fix from untrusted values can raise; callers reject that fix alone
+BUILD_ERRORS = (ParseError, TypeError, ValueError, ArithmeticError)
+
+
+def to_decimal(value, places):
+    if value is None:
+        return None
+    try:
+        number = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        raise ParseError(f'Invalid number: {value!r}')
+    if not number.is_finite():
+        raise ParseError(f'Invalid number: {value!r}')
+    return round(number, places)
+
+
+def to_timestamp(value, default):
+    if value in (None, ''):
+        return default
+    if isinstance(value, (int, float)) or str(value).isdigit():
+        try:
+            return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise ParseError(f'Invalid timestamp: {value!r}')
+    timestamp = parse_datetime(str(value))
+    if timestamp is None:
+        raise ParseError(f'Invalid timestamp: {value!r}')
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp, dt_timezone.utc)
+    return timestamp
+
+
+def build_location(values, device_id, default_timestamp):
+    latitude = to_decimal(values.get('latitude'), 6)
+    longitude = to_decimal(values.get('longitude'), 6)
+    if latitude is None or longitude is None:
+        raise ParseError('Missing latitude/longitude')
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ParseError(f'Coordinates out of range: {latitude}, {longitude}')
+    location = LocationData(
+        device_id=device_id,
+        latitude=latitude,
+        longitude=longitude,
+        timestamp=to_timestamp(values.get('timestamp'), default_timestamp),
+        raw_data=values,
+    )
+    for field in LOCATION_FIELDS:
+        value = values.get(field)
+        if value in (None, ''):
+            continue
+        if field in ('battery_level', 'signal_strength'):
+            value = int(value)
+            if not 0 <= value <= 100:
+                raise ParseError(f'{field} out of range: {value}')
+        else:
+            value = to_decimal(value, 2)
+            if abs(value) >= FIELD_LIMITS[field]:
+                raise ParseError(f'{field} out of range: {value}')
+        setattr(location, field, value)
+    return location
+
+
+def latest_by_device(locations):
+    latest = {}
+    for location in locations:
+        current = latest.get(location.device_id)
+        if current is None or location.timestamp > current.timestamp:
+            latest[location.device_id] = location
+    return latest
+
+
+def publish_positions(write, latest):
+    for device_id, location in latest.items():
+        write(device_id, location.latitude, location.longitude, location.timestamp, location.battery_level)
+
+
+def update_device_positions(locations):
+    """
+    Move each device's last known position to its newest fix.
+
+    The shared fleet table is updated when configured. Positions go through
+    the write-behind LastPositionStore when it is enabled, otherwise they are
+    written with one UPDATE per device. The table and the store live outside
+    the database, so they are only told once the fixes have committed.
+    """
+    latest = latest_by_device(locations)
+    table = get_fleet_table()
+    if table is not None:
+        transaction.on_commit(lambda: publish_positions(table.write, latest))
+    store = get_position_store()
+    if store is not None:
+        transaction.on_commit(lambda: publish_positions(store.record, latest))
+        return latest
+    for device_id, location in latest.items():
+        fields = {
+            'last_location_lat': location.latitude,
+            'last_location_lng': location.longitude,
+            'last_location_time': location.timestamp,
+        }
+        if location.battery_level is not None:
+            fields['battery_level'] = location.battery_level
+        Device.objects.filter(pk=device_id).filter(
+            Q(last_location_time__isnull=True) | Q(last_location_time__lt=location.timestamp)
+        ).update(**fields)
+    return latest
+
+
+class RawGPSProcessor:
+    """
+    Drains unprocessed RawGPSData rows into LocationData in chunks.
+
+    Each chunk is claimed inside a transaction with ``SELECT ... FOR UPDATE
+    SKIP LOCKED`` where the database supports it, so several workers can run
+    side by side without processing the same rows twice. With a
+    RollupBuilder as ``rollups`` the worker also keeps the hourly and daily
+    rollups up to date between chunks.
+    """
+
+    model = RawGPSData
+    claim_fields = ('id', 'device_id', 'protocol_id', 'raw_data', 'received_at')
+    claim_order = ('received_at', 'id')
+
+    def __init__(self, chunk_size=500, rollups=None):
+        self.chunk_size = chunk_size
+        self.rollups = rollups
+        self.resolver = get_device_resolver()
+        self.parsers = get_parser_registry()
+        self.processed = 0
+        self.failed = 0
+
+    def claim_queryset(self):
+        queryset = self.model.objects.filter(processed=False).order_by(*self.claim_order)
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        return queryset.only(*self.claim_fields)
+
+    def build(self, raw):
+        values = self.parsers.parse(raw.protocol_id, raw.raw_data)
+        device_id = raw.device_id
+        if device_id is None:
+            device_id, protocol_id = self.resolver.resolve(values.get('identifier'))
+        if device_id is None:
+            raise ParseError('Unknown device')
+        return build_location(values, device_id, raw.received_at)
+
+    def after_write(self, locations):
+        update_device_positions(locations)
+
+    def process_chunk(self):
+        """Process one chunk, returning the number of raw rows consumed"""
+        with transaction.atomic():
+            rows = list(self.claim_queryset()[:self.chunk_size])
+            if not rows:
+                return 0
+            locations = []
+            errors = {}
+            for raw in rows:
+                try:
+                    locations.append(self.build(raw))
+                except BUILD_ERRORS as e:
+                    errors[raw.pk] = str(e) or e.__class__.__name__
+
+            LocationData.objects.bulk_create(locations, batch_size=self.chunk_size)
+            self.after_write(locations)
+            self.mark_processed(rows, errors)
+
+        self.processed += len(rows) - len(errors)
+        self.failed += len(errors)
+        return len(rows)
+
+    def mark_processed(self, rows, errors):
+        """Flag the whole chunk as processed with a single UPDATE"""
+        error_message = Value('')
+        if errors:
+            error_message = Case(
+                *[When(pk=pk, then=Value(message)) for pk, message in errors.items()],
+                default=Value(''),
+            )
+        self.model.objects.filter(pk__in=[raw.pk for raw in rows]).update(
+            processed=True,
+            processed_at=timezone.now(),
+            error_message=error_message,
+        )
+
+    def update_rollups(self):
+        if self.rollups is None:
+            return
+        try:
+            self.rollups.catch_up()
+        except Exception as e:
+            # Rollups can always catch up later; never let them stall ingest
+            logger.error(f'Error updating location rollups: {e}')
+
+    def run(self, once=False, idle_sleep=1.0, max_rows=None, report=None):
+        """Process chunks until the backlog is empty (``once``) or forever"""
+        started = time.monotonic()
+        consumed = 0
+        while max_rows is None or consumed < max_rows:
+            chunk_started = time.monotonic()
+            try:
+                count = self.process_chunk()
+            except Exception:
+                # The chunk rolled back and stays unclaimed; log it and try again after a pause
+                logger.exception(f'Error processing a chunk of {self.model.__name__} rows')
+                if once:
+                    break
+                time.sleep(idle_sleep)
+                continue
+            consumed += count
+            if count and report:
+                elapsed = max(time.monotonic() - chunk_started, 1e-9)
+                report(count, count / elapsed)
+            self.update_rollups()
+            if not count:
+                if once:
+                    break
+                time.sleep(idle_sleep)
+        elapsed = max(time.monotonic() - started, 1e-9)
+        return consumed, consumed / elapsed
+
+
+class LocationUpdateProcessor(RawGPSProcessor):
+    """
+    Applies queued LocationUpdate rows from the fast-ack ingest path.
+
+    Rows are applied in sequence order; each chunk is one bulk insert, one
+    position update per device and one geofence evaluation per device.
+    """
+
+    model = LocationUpdate
+    claim_fields = ('id', 'device_id', 'payload', 'received_at')
+    claim_order = ('id',)
+
+    def build(self, update):
+        location = build_location(update.payload, update.device_id, update.received_at)
+        location.raw_data = update.payload.get('raw_data', {})
+        return location
+
+    def after_write(self, locations):
+        latest = update_device_positions(locations)
+        devices = Device.objects.select_related('user').in_bulk(list(latest))
+        for device_id, location in latest.items():
+            device = devices.get(device_id)
+            if device is None:
+                continue
+            # One device's geofence failure must not roll back, and so re-claim, the whole chunk
+            try:
+                with transaction.atomic():
+                    check_geofence_alerts(device, location.latitude, location.longitude)
+            except Exception:
+                logger.exception(f'Error checking geofences of device {device_id}')
@@ -0,0 +1,296 @@
+import logging
+import math
+from collections import defaultdict
+from copy import copy
+from itertools import chain, takewhile
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .archive import archived_points
+from .models import LocationData, LocationRollup, RollupCheckpoint
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT = 'location_rollups'
+PERIODS = ('hour', 'day')
+EARTH_RADIUS_KM = 6371.0
+FIX_FIELDS = ('id', 'device_id', 'latitude', 'longitude', 'speed', 'battery_level', 'timestamp', 'received_at')
+UPDATE_FIELDS = [
+    'point_count', 'distance_km', 'max_speed', 'speed_total', 'speed_samples', 'min_battery',
+    'first_time', 'first_lat', 'first_lng', 'last_time', 'last_lat', 'last_lng',
+    'min_lat', 'max_lat', 'min_lng', 'max_lng', 'updated_at',
+]
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points (haversine)"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (float(lat1), float(lng1), float(lat2), float(lng2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bucket_start(value, period):
+    """Start of the local hour or day containing ``value``"""
+    start = timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+    return start.replace(hour=0) if period == 'day' else start
+
+
+def summarize_fixes(device_id, period, bucket, fixes):
+    """Unsaved rollup for fixes of one bucket, sorted by timestamp"""
+    first, last = fixes[0], fixes[-1]
+    speeds = [fix.speed for fix in fixes if fix.speed is not None]
+    batteries = [fix.battery_level for fix in fixes if fix.battery_level is not None]
+    return LocationRollup(
+        device_id=device_id,
+        period=period,
+        bucket=bucket,
+        point_count=len(fixes),
+        distance_km=sum(
+            distance_km(a.latitude, a.longitude, b.latitude, b.longitude) for a, b in zip(fixes, fixes[1:])
+        ),
+        max_speed=max(speeds, default=None),
+        speed_total=float(sum(speeds)),
+        speed_samples=len(speeds),
+        min_battery=min(batteries, default=None),
+        first_time=first.timestamp, first_lat=first.latitude, first_lng=first.longitude,
+        last_time=last.timestamp, last_lat=last.latitude, last_lng=last.longitude,
+        min_lat=min(fix.latitude for fix in fixes), max_lat=max(fix.latitude for fix in fixes),
+        min_lng=min(fix.longitude for fix in fixes), max_lng=max(fix.longitude for fix in fixes),
+    )
+
+
+def present(*values):
+    return [value for value in values if value is not None]
+
+
+def merge(rollup, other):
+    """
+    Fold ``other`` into ``rollup`` in place.
+
+    The step between the two is added to the distance when one follows the
+    other in time. Late fixes that fall between fixes already counted cannot
+    be placed without the raw points, so no step is added for them;
+    ``update_location_rollups --rebuild`` recomputes such buckets exactly.
+    """
+    if other.first_time >= rollup.last_time:
+        step = distance_km(rollup.last_lat, rollup.last_lng, other.first_lat, other.first_lng)
+    elif other.last_time <= rollup.first_time:
+        step = distance_km(other.last_lat, other.last_lng, rollup.first_lat, rollup.first_lng)
+    else:
+        step = 0.0
+    rollup.distance_km += other.distance_km + step
+    rollup.point_count += other.point_count
+    rollup.speed_total += other.speed_total
+    rollup.speed_samples += other.speed_samples
+    rollup.max_speed = max(present(rollup.max_speed, other.max_speed), default=None)
+    rollup.min_battery = min(present(rollup.min_battery, other.min_battery), default=None)
+    if other.first_time < rollup.first_time:
+        rollup.first_time, rollup.first_lat, rollup.first_lng = other.first_time, other.first_lat, other.first_lng
+    if other.last_time > rollup.last_time:
+        rollup.last_time, rollup.last_lat, rollup.last_lng = other.last_time, other.last_lat, other.last_lng
+    rollup.min_lat = min(rollup.min_lat, other.min_lat)
+    rollup.max_lat = max(rollup.max_lat, other.max_lat)
+    rollup.min_lng = min(rollup.min_lng, other.min_lng)
+    rollup.max_lng = max(rollup.max_lng, other.max_lng)
+    return rollup
+
+
+def combine(rollups):
+    """One unsaved rollup spanning the given buckets, or None if there are none"""
+    rollups = sorted(rollups, key=lambda rollup: rollup.first_time)
+    if not rollups:
+        return None
+    total = copy(rollups[0])
+    total.pk = None
+    for rollup in rollups[1:]:
+        merge(total, rollup)
+    return total
+
+
+def covering_rollups(device_id, since, until):
+    """
+    Rollups covering ``[since, until)`` for a device, oldest first.
+
+    Whole days come from day buckets and the partial days at either end from
+    hour buckets, so a range of months costs a few hundred rows. Both ends
+    are widened to the hour.
+    """
+    first_day = bucket_start(since, 'day')
+    if first_day < since:
+        first_day += timezone.timedelta(days=1)
+    last_day = bucket_start(until, 'day')
+    queryset = LocationRollup.objects.filter(device_id=device_id)
+    since = bucket_start(since, 'hour')
+    if first_day < last_day:
+        queryset = queryset.filter(
+            Q(period='day', bucket__gte=first_day, bucket__lt=last_day)
+            | Q(period='hour', bucket__gte=since, bucket__lt=first_day)
+            | Q(period='hour', bucket__gte=last_day, bucket__lt=until)
+        )
+    else:
+        queryset = queryset.filter(period='hour', bucket__gte=since, bucket__lt=until)
+    return list(queryset.order_by('bucket'))
+
+
+def summarize(device_id, since, until):
+    """Totals for a device over ``[since, until)`` read from the rollups, or None without data"""
+    return combine(covering_rollups(device_id, since, until))
+
+
+class RollupBuilder:
+    """
+    Folds new LocationData rows into the hourly and daily rollups.
+
+    Progress is the highest folded id in a RollupCheckpoint row, locked for
+    the duration of each batch so several workers can call ``catch_up``
+    concurrently; a worker that finds it locked, by another worker or a
+    ``rebuild``, skips the round instead of waiting. A lower id may belong
+    to a transaction that has not committed yet, so only ids below the
+    committed horizon are folded: on PostgreSQL it follows the transactions
+    in flight (see ``advance_horizon``), elsewhere fixes younger than
+    ``lag`` seconds are left for the next call.
+    """
+
+    def __init__(self, batch_size=None, lag=None):
+        self.batch_size = batch_size or getattr(settings, 'GPS_ROLLUP_BATCH_SIZE', 5000)
+        self.lag = lag if lag is not None else getattr(settings, 'GPS_ROLLUP_LAG', 5.0)
+        self.folded = 0
+
+    def catch_up(self, max_rows=None):
+        """Fold batches until no settled fixes are left, returning the number folded"""
+        folded = 0
+        while max_rows is None or folded < max_rows:
+            limit = self.batch_size if max_rows is None else min(self.batch_size, max_rows - folded)
+            count = self.fold_batch(limit)
+            folded += count
+            if count < limit:
+                break
+        return folded
+
+    def fold_batch(self, limit=None):
+        with transaction.atomic():
+            checkpoint = self.lock_checkpoint(skip_locked=True)
+            if checkpoint is None:
+                return 0
+            fixes = LocationData.objects.filter(id__gt=checkpoint.last_id)
+            ready_id = self.committed_id(checkpoint)
+            if ready_id is not None:
+                fixes = fixes.filter(id__lte=ready_id)
+            fixes = list(fixes.order_by('id').only(*FIX_FIELDS)[:limit or self.batch_size])
+            if ready_id is None:
+                horizon = timezone.now() - timezone.timedelta(seconds=self.lag)
+                fixes = list(takewhile(lambda fix: fix.received_at < horizon, fixes))
+            if not fixes:
+                return 0
+            self.fold(fixes)
+            checkpoint.last_id = fixes[-1].id
+            checkpoint.save(update_fields=['last_id', 'updated_at'])
+        self.folded += len(fixes)
+        return len(fixes)
+
+    def lock_checkpoint(self, skip_locked=False):
+        """The locked checkpoint row; with ``skip_locked`` None while someone else holds it"""
+        RollupCheckpoint.objects.get_or_create(name=CHECKPOINT)
+        return RollupCheckpoint.objects.select_for_update(skip_locked=skip_locked).filter(name=CHECKPOINT).first()
+
+    def committed_id(self, checkpoint):
+        """Highest id with every lower row committed, on PostgreSQL; None elsewhere"""
+        connection = connections[LocationData.objects.db]
+        if connection.vendor != 'postgresql':
+            return None
+        # Read the newest id before the snapshot, so whoever holds a lower id is in its xid list
+        last = LocationData.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_snapshot_xmax(s)::text::bigint, ARRAY(SELECT x::text::bigint FROM pg_snapshot_xip(s) x '
+                'WHERE x IS DISTINCT FROM pg_current_xact_id_if_assigned()) FROM pg_current_snapshot() s'
+            )
+            xmax, in_flight = cursor.fetchone()
+        self.advance_horizon(checkpoint, last, xmax, in_flight)
+        return checkpoint.ready_id
+
+    @staticmethod
+    def advance_horizon(checkpoint, last_id, xmax, in_flight):
+        """
+        Move ``checkpoint.ready_id`` up given the newest id and a snapshot's ``xmax`` and in-flight xids.
+
+        With nothing in flight every id up to ``last_id`` is committed.
+        Otherwise ``last_id`` becomes the pending candidate, and it is ready
+        once no transaction that started before ``xmax`` is still running.
+        """
+        changed = False
+        if checkpoint.pending_xid is not None and all(xid >= checkpoint.pending_xid for xid in in_flight):
+            checkpoint.ready_id = max(checkpoint.ready_id, checkpoint.pending_id)
+            checkpoint.pending_id = checkpoint.pending_xid = None
+            changed = True
+        if not in_flight:
+            if last_id > checkpoint.ready_id:
+                checkpoint.ready_id = last_id
+                changed = True
+        elif checkpoint.pending_xid is None and last_id > checkpoint.ready_id:
+            checkpoint.pending_id, checkpoint.pending_xid = last_id, xmax
+            changed = True
+        if changed:
+            checkpoint.save(update_fields=['ready_id', 'pending_id', 'pending_xid', 'updated_at'])
+
+    def fold(self, fixes):
+        """Add fixes to their hour and day rollups with one read, one insert and one update"""
+        groups = defaultdict(list)
+        for fix in sorted(fixes, key=lambda fix: (fix.device_id, fix.timestamp)):
+            for period in PERIODS:
+                groups[(fix.device_id, period, bucket_start(fix.timestamp, period))].append(fix)
+
+        existing = {
+            (rollup.device_id, rollup.period, rollup.bucket): rollup
+            for rollup in LocationRollup.objects.filter(
+                device_id__in={key[0] for key in groups},
+                bucket__in={key[2] for key in groups},
+            )
+        }
+        created, updated = [], []
+        now = timezone.now()
+        for key, group in groups.items():
+            part = summarize_fixes(*key, group)
+            rollup = existing.get(key)
+            if rollup is None:
+                created.append(part)
+            else:
+                merge(rollup, part)
+                rollup.updated_at = now
+                updated.append(rollup)
+        LocationRollup.objects.bulk_create(created, batch_size=1000)
+        LocationRollup.objects.bulk_update(updated, UPDATE_FIELDS, batch_size=1000)
+
+    def rebuild(self, since):
+        """
+        Recompute every rollup from the start of ``since``'s day, returning the fixes folded.
+
+        Archived days are read from their blocks and live fixes per device in
+        time order, so distances come out exact even where late fixes were
+        merged out of order. Older rollups are kept: their raw fixes may
+        already be gone to retention. Workers skip their catch-up while the
+        rebuild holds the checkpoint.
+        """
+        start = bucket_start(since, 'day')
+        folded = 0
+        with transaction.atomic():
+            checkpoint = self.lock_checkpoint()
+            LocationRollup.objects.filter(bucket__gte=start).delete()
+            fixes = LocationData.objects.filter(timestamp__gte=start, id__lte=checkpoint.last_id).order_by(
+                'device_id', 'timestamp', 'id'
+            ).only(*FIX_FIELDS)
+            batch = []
+            for fix in chain(archived_points(None, since=start), fixes.iterator(chunk_size=self.batch_size)):
+                batch.append(fix)
+                if len(batch) >= self.batch_size:
+                    self.fold(batch)
+                    folded += len(batch)
+                    batch = []
+            if batch:
+                self.fold(batch)
+                folded += len(batch)
+        logger.info(f'Rebuilt location rollups from {start:%Y-%m-%d} ({folded} fixes)')
+        return folded
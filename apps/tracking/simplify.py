@@ -0,0 +1,159 @@
+import logging
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .archive import day_bounds, decode
+from .models import LocationArchive, LocationData
+
+logger = logging.getLogger(__name__)
+
+TRACK_KEY = 'tracking:track:{}:{}:{}:{}:{}'
+METERS_PER_DEGREE = 111320.0
+# Web Mercator ground resolution at the equator for zoom 0, in metres per pixel
+ZOOM_0_RESOLUTION = 156543.03392
+MAX_ZOOM = 24
+
+
+def zoom_tolerance(zoom, latitude=0.0):
+    """Metres covered by one map pixel at ``zoom`` and ``latitude``"""
+    zoom = min(max(int(zoom), 0), MAX_ZOOM)
+    return ZOOM_0_RESOLUTION * math.cos(math.radians(latitude)) / 2 ** zoom
+
+
+def project(lats, lngs):
+    """Equirectangular projection to metres around the track's mean latitude"""
+    scale = math.cos(math.radians(sum(lats) / len(lats))) * METERS_PER_DEGREE
+    return [lng * scale for lng in lngs], [lat * METERS_PER_DEGREE for lat in lats]
+
+
+def douglas_peucker(xs, ys, tolerance):
+    """
+    Indices of the vertices kept by Douglas-Peucker at ``tolerance``.
+
+    Distances are measured to the segment rather than the infinite line, so
+    out-and-back trips keep their turning point.
+    """
+    count = len(xs)
+    if count < 3 or tolerance <= 0:
+        return list(range(count))
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        x0, y0 = xs[first], ys[first]
+        dx, dy = xs[last] - x0, ys[last] - y0
+        length = dx * dx + dy * dy
+        farthest, split = -1.0, None
+        for index in range(first + 1, last):
+            px, py = xs[index] - x0, ys[index] - y0
+            t = min(max((px * dx + py * dy) / length, 0.0), 1.0) if length else 0.0
+            distance = math.hypot(px - t * dx, py - t * dy)
+            if distance > farthest:
+                farthest, split = distance, index
+        if farthest > tolerance:
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return [index for index, kept in enumerate(keep) if kept]
+
+
+def simplify(vertices, tolerance=None, zoom=None):
+    """
+    Simplify ``(lat, lng, ...)`` tuples in time order.
+
+    ``tolerance`` is in metres; ``zoom`` picks one map pixel at that zoom
+    level instead.
+    """
+    if len(vertices) < 3:
+        return list(vertices)
+    lats = [vertex[0] for vertex in vertices]
+    lngs = [vertex[1] for vertex in vertices]
+    if tolerance is None:
+        tolerance = zoom_tolerance(zoom, sum(lats) / len(lats))
+    xs, ys = project(lats, lngs)
+    return [vertices[index] for index in douglas_peucker(xs, ys, tolerance)]
+
+
+def day_vertices(device_id, day):
+    """Every fix of a device on a local day as ``(lat, lng, epoch seconds, speed, battery)``, oldest first"""
+    start, end = day_bounds(day)
+    vertices = [
+        (float(lat), float(lng), timestamp.timestamp(), float(speed) if speed else None, battery)
+        for lat, lng, timestamp, speed, battery in LocationData.objects.filter(
+            device_id=device_id, timestamp__gte=start, timestamp__lt=end
+        ).order_by().values_list('latitude', 'longitude', 'timestamp', 'speed', 'battery_level')
+    ]
+    for archive in LocationArchive.objects.filter(device_id=device_id, day=day):
+        columns = decode(archive.data)
+        vertices.extend(
+            (float(lat), float(lng), timestamp.timestamp(), float(speed) if speed else None, battery)
+            for lat, lng, timestamp, speed, battery in zip(
+                columns['latitude'], columns['longitude'], columns['timestamp'],
+                columns['speed'], columns['battery_level'],
+            )
+        )
+    vertices.sort(key=lambda vertex: vertex[2])
+    return vertices
+
+
+def vertex_json(vertex):
+    lat, lng, epoch, speed, battery = vertex
+    return {
+        'latitude': lat,
+        'longitude': lng,
+        'speed': speed,
+        'timestamp': datetime.fromtimestamp(epoch, tz=dt_timezone.utc).isoformat(),
+        'battery_level': battery,
+    }
+
+
+def simplified_track(device_id, since, until=None, tolerance=None, zoom=None):
+    """
+    Simplified vertices of a device's track over ``[since, until]``, oldest first.
+
+    Each local day is simplified on its own and cached per device, day and
+    zoom/tolerance. The cache key carries the day's live and archived fix
+    counts, so a day is recomputed as soon as new fixes arrive or it is
+    archived, and complete days are served without touching their points.
+    """
+    until = until or timezone.now()
+    label = f'z{min(max(int(zoom), 0), MAX_ZOOM)}' if tolerance is None else f't{float(tolerance):g}'
+    first_day, last_day = timezone.localdate(since), timezone.localdate(until)
+    live = dict(
+        LocationData.objects.filter(
+            device_id=device_id, timestamp__gte=day_bounds(first_day)[0], timestamp__lt=day_bounds(last_day)[1]
+        )
+        .annotate(day=TruncDate('timestamp')).order_by().values('day').annotate(count=Count('id'))
+        .values_list('day', 'count')
+    )
+    archived = dict(
+        LocationArchive.objects.filter(
+            device_id=device_id, day__gte=first_day, day__lte=last_day
+        ).values_list('day', 'point_count')
+    )
+    days = sorted(set(live) | set(archived))
+    keys = {day: TRACK_KEY.format(device_id, day, label, live.get(day, 0), archived.get(day, 0)) for day in days}
+    cached = cache.get_many(list(keys.values()))
+
+    track = []
+    timeout = getattr(settings, 'GPS_TRACK_CACHE_TIMEOUT', 86400)
+    for day in days:
+        vertices = cached.get(keys[day])
+        if vertices is None:
+            vertices = simplify(day_vertices(device_id, day), tolerance=tolerance, zoom=zoom)
+            cache.set(keys[day], vertices, timeout)
+        start, end = day_bounds(day)
+        if start < since or end > until:
+            low, high = since.timestamp(), until.timestamp()
+            vertices = [vertex for vertex in vertices if low <= vertex[2] <= high]
+        track.extend(vertices)
+    return track
@@ -1,11 +1,39 @@
+import array
+import csv
+import gzip
+import io
+import json
+import zlib
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from unittest import mock, skipUnless
 import pytest
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
 from django.contrib.auth.models import User
 from django.utils import timezone
 from decimal import Decimal
 from apps.products.models import Category, Product
-from apps.gps_devices.models import DeviceType, Protocol, Device
-from apps.tracking.models import LocationData, Geofence, Alert
+from apps.gps_devices.models import DeviceType, Protocol, Device, RawGPSData
+from apps.tracking.archive import HEADER, LocationArchiver, LocationHistory, day_bounds, decode, encode, read_points
+from apps.tracking.models import (
+    LocationArchive, LocationData, LocationRollup, LocationUpdate, Geofence, Alert, RollupCheckpoint, Stop, Trip,
+    TripCheckpoint,
+)
+from apps.tracking.partitions import (
+    add_months, create_partitions, detach_partitions, history_range, is_partitioned, list_partitions, partition_name,
+    partition_table,
+)
+from apps.tracking.processing import LocationUpdateProcessor, RawGPSProcessor
+from apps.tracking.rollups import RollupBuilder, distance_km, summarize
+from apps.tracking import simplify
+from apps.tracking.export import export_rows
+from apps.tracking.trips import TripBuilder
+from apps.tracking.formats import POLYLINE_MEDIA_TYPE, TRACK_MEDIA_TYPE, decode_polyline, encode_polyline
 
 
 class LocationDataModelTest(TestCase):
@@ -261,3 +289,1058 @@ class AlertModelTest(TestCase):
                 message=f'Test {alert_type} alert'
             )
             self.assertEqual(alert.alert_type, alert_type)
+
+
+class DeviceFixtureMixin:
+    """Shared device setup for ingestion and history tests"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.category = Category.objects.create(
+            name='GPS Trackers',
+            slug='gps-trackers'
+        )
+        self.product = Product.objects.create(
+            name='GPS Tracker Pro',
+            slug='gps-tracker-pro',
+            category=self.category,
+            price=Decimal('1000000.00'),
+            stock_quantity=50
+        )
+        self.device_type = DeviceType.objects.create(
+            name='Vehicle Tracker',
+            slug='vehicle-tracker',
+            battery_life_hours=48
+        )
+        self.protocol = Protocol.objects.create(
+            name='TCP Protocol',
+            protocol_type='tcp'
+        )
+        self.device = Device.objects.create(
+            user=self.user,
+            product=self.product,
+            device_type=self.device_type,
+            imei='123456789012345',
+            serial_number='SN123456789',
+            name='My Car Tracker',
+            protocol=self.protocol
+        )
+
+
+@override_settings(GPS_POSITION_FLUSH_INTERVAL=0)
+class RawGPSProcessorTest(DeviceFixtureMixin, TestCase):
+    """Test cases for draining RawGPSData into LocationData"""
+
+    def test_process_chunk(self):
+        """Test valid rows become locations and invalid rows record an error"""
+        RawGPSData.objects.create(device=self.device, protocol=self.protocol, raw_data='123456789012345,35.6892,51.3890,42.5,90,2026-01-01T10:00:00Z')
+        RawGPSData.objects.create(protocol=self.protocol, raw_data='{"imei": "123456789012345", "latitude": 35.7, "longitude": 51.4, "battery_level": 80, "timestamp": "2026-01-01T10:01:00Z"}')
+        RawGPSData.objects.create(protocol=self.protocol, raw_data='999999999999999,35.6,51.3')
+        RawGPSData.objects.create(protocol=self.protocol, raw_data='garbage')
+
+        processor = RawGPSProcessor(chunk_size=10)
+        self.assertEqual(processor.process_chunk(), 4)
+        self.assertEqual(processor.process_chunk(), 0)
+
+        self.assertEqual(LocationData.objects.filter(device=self.device).count(), 2)
+        self.assertFalse(RawGPSData.objects.filter(processed=False).exists())
+        errors = set(RawGPSData.objects.exclude(error_message='').values_list('error_message', flat=True))
+        self.assertEqual(errors, {'Unknown device', 'Unrecognised payload format'})
+
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.last_location_lat, Decimal('35.700000'))
+        self.assertEqual(self.device.battery_level, 80)
+        self.assertEqual((processor.processed, processor.failed), (2, 2))
+
+    def test_non_finite_values_fail_only_their_row(self):
+        """Test NaN coordinates, NaN speeds and overflowing epochs reject one row, not the chunk"""
+        for raw_data in (
+            'x,NaN,51.3',
+            '{"imei": "123456789012345", "latitude": NaN, "longitude": 51.4}',
+            '{"imei": "123456789012345", "latitude": 35.7, "longitude": 51.4, "speed": "nan"}',
+            '{"imei": "123456789012345", "latitude": 35.7, "longitude": 51.4, "timestamp": 1e300}',
+            'x,35.7,51.4',
+        ):
+            RawGPSData.objects.create(device=self.device, protocol=self.protocol, raw_data=raw_data)
+        consumed, rate = RawGPSProcessor(chunk_size=10).run(once=True)
+        self.assertEqual(consumed, 5)
+        self.assertEqual(LocationData.objects.count(), 1)
+        self.assertEqual(RawGPSData.objects.exclude(error_message='').count(), 4)
+
+    def test_run_once_drains_backlog(self):
+        """Test the worker loop drains the backlog in chunks and reports a rate"""
+        for index in range(5):
+            RawGPSData.objects.create(device=self.device, protocol=self.protocol, raw_data=f'x,35.{index},51.3')
+        consumed, rate = RawGPSProcessor(chunk_size=2).run(once=True)
+        self.assertEqual(consumed, 5)
+        self.assertGreater(rate, 0)
+        self.assertEqual(LocationData.objects.count(), 5)
+
+
+@override_settings(GPS_POSITION_FLUSH_INTERVAL=0)
+class BulkLocationUploadTest(DeviceFixtureMixin, TestCase):
+    """Test cases for the batch location upload endpoint"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='testuser', password='testpass123')
+        self.url = reverse('tracking:bulk_update_locations')
+
+    def points(self, count, **extra):
+        base = timezone.now() - timezone.timedelta(minutes=count)
+        return [
+            dict({
+                'latitude': 35.6 + index * 0.001,
+                'longitude': 51.3,
+                'speed': 40,
+                'battery_level': 90 - index % 50,
+                'timestamp': (base + timezone.timedelta(minutes=index)).isoformat(),
+            }, **extra)
+            for index in range(count)
+        ]
+
+    def test_batch_is_inserted_and_device_updated_once(self):
+        """Test hundreds of points are stored with one request and the newest becomes the last position"""
+        points = self.points(300)
+        response = self.client.post(
+            self.url, json.dumps({'device_id': self.device.id, 'points': points}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 300)
+        self.assertEqual(LocationData.objects.filter(device=self.device).count(), 300)
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.last_location_lat, Decimal('35.899000'))
+        self.assertEqual(self.device.battery_level, 41)
+
+    def test_gzip_body_and_per_point_errors(self):
+        """Test gzip bodies are inflated and invalid points are reported without failing the batch"""
+        points = self.points(3, device_id=self.device.id)
+        points[1]['latitude'] = 123
+        points.append({'device_id': 999999, 'latitude': 1, 'longitude': 1})
+        body = gzip.compress(json.dumps(points).encode())
+        response = self.client.post(
+            self.url, body, content_type='application/json', HTTP_CONTENT_ENCODING='gzip'
+        )
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result['created'], 2)
+        self.assertEqual([error['index'] for error in result['rejected']], [1, 3])
+
+    def test_other_users_devices_are_rejected(self):
+        """Test points for devices the user does not own are not stored"""
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.login(username='other', password='testpass123')
+        response = self.client.post(
+            self.url, json.dumps({'device_id': self.device.id, 'points': self.points(2)}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(LocationData.objects.exists())
+
+
+    def test_malformed_points_are_rejected_by_index(self):
+        """Test NaN values and unhashable device ids reject their point instead of the batch"""
+        points = self.points(4)
+        points[0]['latitude'] = float('nan')
+        points[1]['speed'] = 'nan'
+        points[2]['device_id'] = [self.device.id]
+        response = self.client.post(
+            self.url, json.dumps({'device_id': self.device.id, 'points': points}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result['created'], 1)
+        self.assertEqual([error['index'] for error in result['rejected']], [0, 1, 2])
+
+@override_settings(GPS_POSITION_FLUSH_INTERVAL=0)
+class QueuedLocationUpdateTest(DeviceFixtureMixin, TestCase):
+    """Test cases for the fast-ack location endpoint and its worker"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='testuser', password='testpass123')
+        self.url = reverse('tracking:enqueue_device_location', args=[self.device.id])
+
+    def post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_update_is_queued_and_acknowledged(self):
+        """Test the endpoint answers 202 with a sequence number without touching location history"""
+        first = self.post(self.url, {'latitude': 35.7, 'longitude': 51.4})
+        second = self.post(self.url, {'latitude': 35.71, 'longitude': 51.4})
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(first.json()['status'], 'queued')
+        self.assertGreater(second.json()['sequence'], first.json()['sequence'])
+        self.assertEqual(LocationUpdate.objects.filter(processed=False).count(), 2)
+        self.assertFalse(LocationData.objects.exists())
+
+    def test_invalid_update_is_rejected_before_queueing(self):
+        """Test validation errors are reported to the device and nothing is queued"""
+        response = self.post(self.url, {'latitude': 135, 'longitude': 51.4})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(LocationUpdate.objects.exists())
+
+    def test_other_users_devices_cannot_be_queued(self):
+        """Test a user cannot queue fixes for a device they do not own"""
+        User.objects.create_user(username='other', password='testpass123')
+        self.client.login(username='other', password='testpass123')
+        response = self.post(self.url, {'latitude': 35.7, 'longitude': 51.4})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(LocationUpdate.objects.exists())
+
+    def test_non_finite_update_is_rejected(self):
+        """Test NaN values are a 400, not a server error"""
+        response = self.client.post(self.url, '{"latitude": NaN, "longitude": 51.4}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.post(self.url, {'latitude': 35.7, 'longitude': 51.4, 'speed': 'nan'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(LocationUpdate.objects.exists())
+
+    @override_settings(GPS_LOCATION_INGEST_MODE='queue')
+    def test_queue_mode_switches_the_plain_endpoint(self):
+        """Test GPS_LOCATION_INGEST_MODE routes the existing endpoint through the queue"""
+        url = reverse('tracking:update_device_location', args=[self.device.id])
+        response = self.post(url, {'latitude': 35.7, 'longitude': 51.4})
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(LocationUpdate.objects.filter(device=self.device).exists())
+
+    def test_worker_applies_updates_and_alerts(self):
+        """Test the worker stores fixes, moves the device and raises geofence alerts"""
+        Geofence.objects.create(
+            user=self.user,
+            name='Home',
+            center_lat=Decimal('35.700000'),
+            center_lng=Decimal('51.400000'),
+            radius=Decimal('1000.00'),
+        )
+        LocationData.objects.create(
+            device=self.device,
+            latitude=Decimal('36.000000'),
+            longitude=Decimal('52.000000'),
+            timestamp=timezone.now() - timezone.timedelta(minutes=5),
+        )
+        self.post(self.url, {'latitude': 35.7, 'longitude': 51.4, 'battery_level': 77})
+        self.post(self.url, {'latitude': 135, 'longitude': 51.4})
+        LocationUpdate.objects.create(device=self.device, payload={'latitude': 'north', 'longitude': 51.4})
+
+        processor = LocationUpdateProcessor()
+        consumed, rate = processor.run(once=True)
+
+        self.assertEqual(consumed, 2)
+        self.assertEqual((processor.processed, processor.failed), (1, 1))
+        self.assertFalse(LocationUpdate.objects.filter(processed=False).exists())
+        self.assertTrue(LocationUpdate.objects.exclude(error_message='').exists())
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.last_location_lat, Decimal('35.700000'))
+        self.assertEqual(self.device.battery_level, 77)
+        self.assertTrue(Alert.objects.filter(device=self.device, alert_type='geofence_enter').exists())
+
+    def test_geofence_errors_do_not_roll_back_the_chunk(self):
+        """Test a failing geofence check is logged and the fixes are still stored"""
+        self.post(self.url, {'latitude': 35.7, 'longitude': 51.4})
+
+        with mock.patch('apps.tracking.processing.check_geofence_alerts', side_effect=RuntimeError('boom')):
+            consumed, rate = LocationUpdateProcessor().run(once=True)
+
+        self.assertEqual(consumed, 1)
+        self.assertFalse(LocationUpdate.objects.filter(processed=False).exists())
+        self.assertTrue(LocationData.objects.filter(device=self.device).exists())
+
+    def test_fleet_table_is_only_written_after_commit(self):
+        """Test the fleet table never sees fixes from a chunk that has not committed"""
+        table = mock.Mock()
+        self.post(self.url, {'latitude': 35.7, 'longitude': 51.4})
+
+        with mock.patch('apps.tracking.processing.get_fleet_table', return_value=table):
+            with self.captureOnCommitCallbacks() as callbacks:
+                LocationUpdateProcessor().run(once=True)
+            table.write.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+        table.write.assert_called_once()
+        self.assertEqual(table.write.call_args.args[0], self.device.id)
+
+
+@override_settings(GPS_POSITION_FLUSH_INTERVAL=0)
+class FleetPositionsTest(DeviceFixtureMixin, TestCase):
+    """Test cases for fleet positions served from the shared fleet table"""
+
+    def setUp(self):
+        super().setUp()
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        override = self.settings(GPS_FLEET_TABLE_PATH=str(Path(tempdir.name) / 'fleet.bin'), GPS_FLEET_TABLE_SLOTS=4096)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client.login(username='testuser', password='testpass123')
+
+    def test_positions_come_from_the_fleet_table(self):
+        """Test ingested fixes and status changes reach the table and the endpoint reads it"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('tracking:bulk_update_locations'),
+                json.dumps({'device_id': self.device.id, 'points': [
+                    {'latitude': 35.7, 'longitude': 51.4, 'battery_level': 64, 'timestamp': '2026-01-01T10:00:00Z'},
+                ]}),
+                content_type='application/json',
+            )
+        self.device.status = 'active'
+        self.device.save()
+        # The table, not the row, is what the endpoint reports
+        Device.objects.filter(pk=self.device.pk).update(last_location_lat=Decimal('1.000000'))
+
+        response = self.client.get(reverse('tracking:fleet_positions'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['devices'], [{
+            'device_id': self.device.id,
+            'latitude': 35.7,
+            'longitude': 51.4,
+            'timestamp': '2026-01-01T10:00:00+00:00',
+            'battery_level': 64,
+            'status': 'active',
+        }])
+
+    def test_devices_missing_from_the_table_fall_back_to_the_database(self):
+        """Test devices the table has never seen are read from their row"""
+        Device.objects.filter(pk=self.device.pk).update(
+            last_location_lat=Decimal('35.100000'), last_location_lng=Decimal('51.100000'),
+            last_location_time=timezone.now(),
+        )
+        with self.settings(GPS_FLEET_TABLE_PATH=''):
+            devices = self.client.get(reverse('tracking:fleet_positions')).json()['devices']
+        self.assertEqual(devices[0]['latitude'], 35.1)
+
+
+    def test_status_only_slots_fall_back_to_the_database(self):
+        """Test a slot holding only a status change does not hide the position stored on the row"""
+        Device.objects.filter(pk=self.device.pk).update(
+            last_location_lat=Decimal('35.100000'), last_location_lng=Decimal('51.100000'),
+            last_location_time=timezone.now(),
+        )
+        self.device.status = 'active'
+        self.device.save(update_fields=['status'])
+        devices = self.client.get(reverse('tracking:fleet_positions')).json()['devices']
+        self.assertEqual((devices[0]['latitude'], devices[0]['status']), (35.1, 'active'))
+
+class LocationPartitionTest(TestCase):
+    """Test cases for LocationData partition management"""
+
+    def test_month_arithmetic_and_names(self):
+        """Test partition bounds roll over year boundaries and names sort by month"""
+        november = timezone.datetime(2026, 11, 1, tzinfo=timezone.get_fixed_timezone(0))
+        self.assertEqual(add_months(november, 2).date().isoformat(), '2027-01-01')
+        self.assertEqual(add_months(november, -11).date().isoformat(), '2025-12-01')
+        self.assertEqual(partition_name(november), 'tracking_locationdata_y2026m11')
+
+    def test_history_range_defaults_to_recent_days(self):
+        """Test history queries get a lower bound even when the caller gives none"""
+        now = timezone.now()
+        start, end = history_range(now=now)
+        self.assertEqual(start, now - timezone.timedelta(days=30))
+        self.assertIsNone(end)
+        start, end = history_range(until='2026-01-31T00:00:00Z')
+        self.assertEqual(start.isoformat(), '2026-01-01T00:00:00+00:00')
+
+    def test_sqlite_is_left_alone(self):
+        """Test the partition command is a no-op on databases without native partitioning"""
+        self.assertFalse(is_partitioned())
+        self.assertEqual(create_partitions(), [])
+        out = io.StringIO()
+        call_command('manage_location_partitions', '--retain', '12', stdout=out)
+        self.assertIn('not partitioned', out.getvalue())
+        call_command('partition_location_data', '--yes', stdout=out)
+        self.assertIn('only be partitioned on PostgreSQL', out.getvalue())
+
+    def partition_sql(self, fetched, fail=()):
+        """Run create_partitions against a recording cursor, returning the created tables and the SQL run"""
+        executed = []
+
+        def execute(sql, params=None):
+            executed.append(sql)
+            if any(text in sql for text in fail):
+                raise DatabaseError('boom')
+
+        database = mock.MagicMock()
+        database.ops.quote_name = lambda name: f'"{name}"'
+        cursor = database.cursor.return_value.__enter__.return_value
+        cursor.execute.side_effect = execute
+        cursor.fetchone.side_effect = fetched
+        now = timezone.datetime(2026, 10, 18, tzinfo=timezone.get_fixed_timezone(0))
+        with mock.patch('apps.tracking.partitions.is_partitioned', return_value=True), \
+                mock.patch('apps.tracking.partitions.list_partitions', return_value={}), \
+                mock.patch('apps.tracking.partitions.connections', {'default': database}):
+            return create_partitions(ahead=1, now=now), executed
+
+    def test_rows_in_the_default_partition_move_to_the_new_month(self):
+        """Test a month with rows already in the default partition is built, filled and attached"""
+        default = ('tracking_locationdata_default',)
+        created, executed = self.partition_sql([default, (False,), default, (True,)])
+        self.assertEqual(created, ['tracking_locationdata_y2026m10', 'tracking_locationdata_y2026m11'])
+        self.assertIn('CREATE TABLE "tracking_locationdata_y2026m10" PARTITION OF "tracking_locationdata"', executed[2])
+        november = executed[5:]
+        self.assertIn('(LIKE "tracking_locationdata"', november[0])
+        self.assertIn('DELETE FROM "tracking_locationdata_default"', november[1])
+        self.assertIn('INSERT INTO "tracking_locationdata_y2026m11"', november[1])
+        self.assertIn(
+            'ATTACH PARTITION "tracking_locationdata_y2026m11" '
+            "FOR VALUES FROM ('2026-11-01T00:00:00+00:00') TO ('2026-12-01T00:00:00+00:00')",
+            november[2],
+        )
+
+    def test_failed_month_does_not_stop_the_others(self):
+        """Test a month whose DDL fails is logged and skipped"""
+        with self.assertLogs('apps.tracking.partitions', 'ERROR'):
+            created, executed = self.partition_sql([None, None], fail=('y2026m10',))
+        self.assertEqual(created, ['tracking_locationdata_y2026m11'])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'native partitioning needs PostgreSQL')
+class PartitionedLocationDataTest(DeviceFixtureMixin, TestCase):
+    """Test cases for partition management against a partitioned PostgreSQL table"""
+
+    def setUp(self):
+        super().setUp()
+        self.before = [
+            LocationData.objects.create(
+                device=self.device, latitude=Decimal('35.7'), longitude=Decimal('51.4'),
+                timestamp=timezone.now() - timezone.timedelta(days=days),
+            )
+            for days in (70, 40, 1)
+        ]
+        self.copied = partition_table(ahead=1)
+
+    def test_conversion_keeps_rows_ids_and_foreign_keys(self):
+        """Test the rebuilt table holds every row, continues the ids and still cascades from devices"""
+        self.assertEqual(self.copied, 3)
+        self.assertTrue(is_partitioned())
+        self.assertGreaterEqual(len(list_partitions()), 4)
+        self.assertEqual(
+            sorted(LocationData.objects.values_list('id', flat=True)), sorted(fix.id for fix in self.before)
+        )
+        fix = LocationData.objects.create(
+            device=self.device, latitude=Decimal('35.7'), longitude=Decimal('51.4'), timestamp=timezone.now(),
+        )
+        self.assertGreater(fix.id, max(item.id for item in self.before))
+        with self.assertRaises(ValueError):
+            partition_table()
+        self.device.delete()
+        self.assertFalse(LocationData.objects.exists())
+
+    def test_dropped_partitions_unlink_their_alerts(self):
+        """Test alerts on fixes in a dropped month lose the reference instead of dangling"""
+        old_alert = Alert.objects.create(
+            device=self.device, alert_type='geofence_enter', message='old', location_data=self.before[0]
+        )
+        recent_alert = Alert.objects.create(
+            device=self.device, alert_type='geofence_enter', message='recent', location_data=self.before[2]
+        )
+        detach_partitions(before=add_months(timezone.now(), -1), drop=True)
+        old_alert.refresh_from_db()
+        recent_alert.refresh_from_db()
+        self.assertIsNone(old_alert.location_data_id)
+        self.assertEqual(recent_alert.location_data_id, self.before[2].id)
+
+    def test_future_month_is_created_after_rows_reach_the_default_partition(self):
+        """Test creating a month whose fixes already landed in the default partition"""
+        month = add_months(timezone.now(), 6)
+        timestamp = month + timezone.timedelta(days=1)
+        LocationData.objects.create(device=self.device, latitude=Decimal('35.7'), longitude=Decimal('51.4'), timestamp=timestamp)
+        name = partition_name(month)
+        self.assertIn(name, create_partitions(ahead=7))
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {name}')
+            self.assertEqual(cursor.fetchone()[0], 1)
+        self.assertEqual(LocationData.objects.filter(timestamp=timestamp).count(), 1)
+
+
+@override_settings(GPS_POSITION_FLUSH_INTERVAL=0)
+class LocationRollupTest(DeviceFixtureMixin, TestCase):
+    """Test cases for the incrementally maintained hourly and daily rollups"""
+
+    def fix(self, day, hour, minute, lat, lng, speed=None, battery=None):
+        return LocationData.objects.create(
+            device=self.device,
+            latitude=Decimal(lat),
+            longitude=Decimal(lng),
+            speed=Decimal(speed) if speed is not None else None,
+            battery_level=battery,
+            timestamp=timezone.make_aware(datetime(2026, 1, day, hour, minute)),
+        )
+
+    def path_km(self, fixes):
+        fixes = sorted(fixes, key=lambda fix: fix.timestamp)
+        return sum(distance_km(a.latitude, a.longitude, b.latitude, b.longitude) for a, b in zip(fixes, fixes[1:]))
+
+    def setUp(self):
+        super().setUp()
+        self.fixes = [
+            self.fix(5, 10, 0, '35.700000', '51.400000', speed='40.00', battery=90),
+            self.fix(5, 10, 30, '35.710000', '51.410000', speed='60.00', battery=85),
+            self.fix(5, 11, 15, '35.720000', '51.390000', battery=84),
+            self.fix(6, 9, 0, '35.800000', '51.500000', speed='20.00'),
+        ]
+
+    def test_catch_up_builds_hour_and_day_rollups(self):
+        """Test new fixes are folded into local hour and day buckets and the checkpoint advances"""
+        builder = RollupBuilder(lag=0)
+        self.assertEqual(builder.catch_up(), 4)
+        self.assertEqual(builder.catch_up(), 0)
+        self.assertEqual(RollupCheckpoint.objects.get().last_id, self.fixes[-1].id)
+
+        hour = LocationRollup.objects.get(period='hour', bucket=timezone.make_aware(datetime(2026, 1, 5, 10)))
+        self.assertEqual(hour.point_count, 2)
+        self.assertAlmostEqual(hour.distance_km, self.path_km(self.fixes[:2]))
+        self.assertEqual(hour.max_speed, Decimal('60.00'))
+        self.assertEqual(hour.avg_speed, 50.0)
+        self.assertEqual(hour.min_battery, 85)
+        self.assertEqual((hour.min_lat, hour.max_lng), (Decimal('35.700000'), Decimal('51.410000')))
+
+        days = LocationRollup.objects.filter(period='day').order_by('bucket')
+        self.assertEqual([day.point_count for day in days], [3, 1])
+        self.assertEqual(days[0].bucket, timezone.make_aware(datetime(2026, 1, 5)))
+        self.assertEqual(days[0].last_time, self.fixes[2].timestamp)
+        self.assertEqual(LocationRollup.objects.filter(period='hour').count(), 3)
+
+    def test_only_new_fixes_are_folded(self):
+        """Test a later run adds new fixes to existing buckets without recounting old ones"""
+        builder = RollupBuilder(lag=0)
+        builder.catch_up()
+        late = self.fix(5, 11, 40, '35.730000', '51.380000', battery=70)
+        self.assertEqual(builder.catch_up(), 1)
+
+        day = LocationRollup.objects.get(period='day', bucket=timezone.make_aware(datetime(2026, 1, 5)))
+        self.assertEqual(day.point_count, 4)
+        self.assertEqual(day.min_battery, 70)
+        self.assertAlmostEqual(day.distance_km, self.path_km(self.fixes[:3] + [late]))
+
+    def test_unsettled_fixes_wait_for_the_next_run(self):
+        """Test fixes received within the lag are left for a later catch-up"""
+        self.assertEqual(RollupBuilder(lag=60).catch_up(), 0)
+        self.assertFalse(LocationRollup.objects.exists())
+
+    def test_locked_checkpoint_is_skipped(self):
+        """Test a worker finding the checkpoint held by a rebuild folds nothing instead of waiting"""
+        builder = RollupBuilder(lag=0)
+        with mock.patch.object(builder, 'lock_checkpoint', return_value=None):
+            self.assertEqual(builder.catch_up(), 0)
+        self.assertEqual(builder.catch_up(), 4)
+
+    def test_committed_horizon_waits_for_transactions_in_flight(self):
+        """Test the PostgreSQL horizon only passes ids once the transactions before them have ended"""
+        checkpoint = RollupCheckpoint.objects.create(name='test')
+        RollupBuilder.advance_horizon(checkpoint, 10, xmax=100, in_flight=[])
+        self.assertEqual(checkpoint.ready_id, 10)
+        RollupBuilder.advance_horizon(checkpoint, 20, xmax=105, in_flight=[98, 103])
+        self.assertEqual((checkpoint.ready_id, checkpoint.pending_id, checkpoint.pending_xid), (10, 20, 105))
+        RollupBuilder.advance_horizon(checkpoint, 30, xmax=110, in_flight=[103, 107])
+        self.assertEqual((checkpoint.ready_id, checkpoint.pending_id), (10, 20))
+        RollupBuilder.advance_horizon(checkpoint, 40, xmax=115, in_flight=[107])
+        self.assertEqual((checkpoint.ready_id, checkpoint.pending_id, checkpoint.pending_xid), (20, 40, 115))
+        RollupBuilder.advance_horizon(checkpoint, 50, xmax=120, in_flight=[])
+        checkpoint.refresh_from_db()
+        self.assertEqual((checkpoint.ready_id, checkpoint.pending_id), (50, None))
+
+    @skipUnless(connection.vendor == 'postgresql', 'the committed horizon needs PostgreSQL')
+    def test_postgresql_folds_committed_fixes_without_lag(self):
+        """Test committed fixes are folded straight away on PostgreSQL whatever the lag"""
+        self.assertEqual(RollupBuilder(lag=3600).catch_up(), 4)
+
+    def test_rebuild_recomputes_out_of_order_fixes(self):
+        """Test a rebuild gives exact distances after a late fix landed between counted ones"""
+        builder = RollupBuilder(lag=0)
+        builder.catch_up()
+        late = self.fix(5, 10, 15, '35.600000', '51.300000')
+        builder.catch_up()
+        self.assertEqual(builder.rebuild(timezone.make_aware(datetime(2026, 1, 5, 12))), 5)
+
+        hour = LocationRollup.objects.get(period='hour', bucket=timezone.make_aware(datetime(2026, 1, 5, 10)))
+        self.assertEqual(hour.point_count, 3)
+        self.assertAlmostEqual(hour.distance_km, self.path_km(self.fixes[:2] + [late]))
+        self.assertEqual(LocationRollup.objects.filter(period='day').count(), 2)
+
+    def test_summary_combines_buckets(self):
+        """Test a range summary matches the raw fixes, including steps between buckets"""
+        RollupBuilder(lag=0).catch_up()
+        since = timezone.make_aware(datetime(2026, 1, 4, 12))
+        until = timezone.make_aware(datetime(2026, 1, 7))
+        total = summarize(self.device.id, since, until)
+        self.assertEqual(total.point_count, 4)
+        self.assertAlmostEqual(total.distance_km, self.path_km(self.fixes))
+        self.assertEqual(total.first_time, self.fixes[0].timestamp)
+        self.assertEqual(total.last_time, self.fixes[-1].timestamp)
+        self.assertEqual(total.max_speed, Decimal('60.00'))
+
+        partial = summarize(self.device.id, timezone.make_aware(datetime(2026, 1, 5, 11)), until)
+        self.assertEqual(partial.point_count, 2)
+        self.assertIsNone(summarize(self.device.id, until, until + timezone.timedelta(days=1)))
+
+    def test_summary_endpoint(self):
+        """Test the summary API returns totals and a per-day series"""
+        RollupBuilder(lag=0).catch_up()
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('tracking:device_summary', args=[self.device.id])
+        response = self.client.get(url, {
+            'since': '2026-01-04T00:00:00Z', 'until': '2026-01-07T00:00:00Z', 'period': 'day',
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['summary']['points'], 4)
+        self.assertEqual([bucket['points'] for bucket in data['buckets']], [3, 1])
+        self.assertEqual(self.client.get(url, {'period': 'week'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, 400)
+
+    def test_ingest_worker_updates_rollups(self):
+        """Test the raw GPS worker folds the fixes it writes"""
+        RollupBuilder(lag=0).catch_up()
+        RawGPSData.objects.create(
+            device=self.device, protocol=self.protocol, raw_data='x,35.9,51.6,10,90,2026-01-06T10:00:00Z'
+        )
+        RawGPSProcessor(rollups=RollupBuilder(lag=0)).run(once=True)
+        day = LocationRollup.objects.get(period='day', bucket=timezone.make_aware(datetime(2026, 1, 6)))
+        self.assertEqual(day.point_count, 2)
+
+
+class LocationArchiveTest(DeviceFixtureMixin, TestCase):
+    """Test cases for the columnar archive tier"""
+
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+        self.old_day = timezone.localdate(self.now) - timezone.timedelta(days=100)
+        self.old = [
+            LocationData.objects.create(
+                device=self.device,
+                latitude=Decimal('35.700001'),
+                longitude=Decimal('-51.400000'),
+                altitude=Decimal('1200.50') if index else None,
+                speed=Decimal('42.25'),
+                heading=Decimal('359.99'),
+                accuracy=Decimal('4.50'),
+                battery_level=90 - index,
+                signal_strength=None,
+                raw_data={'raw': index},
+                timestamp=day_bounds(self.old_day)[0] + timezone.timedelta(hours=index, milliseconds=250),
+            )
+            for index in range(3)
+        ]
+        self.recent = LocationData.objects.create(
+            device=self.device, latitude=Decimal('35.8'), longitude=Decimal('51.5'),
+            timestamp=self.now - timezone.timedelta(hours=1),
+        )
+
+    def test_block_round_trip(self):
+        """Test a block restores every archived column exactly, timestamps to the millisecond"""
+        columns = decode(encode(self.old))
+        points = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        for point, fix in zip(points, self.old):
+            for field in ('latitude', 'longitude', 'altitude', 'speed', 'heading', 'accuracy',
+                          'battery_level', 'signal_strength', 'timestamp'):
+                self.assertEqual(point[field], getattr(fix, field), field)
+        self.assertLess(len(encode(self.old, compress=False)), 3 * 40)
+
+    def test_layout_is_plain_columns(self):
+        """Test an uncompressed block is the header followed by little-endian column arrays"""
+        block = encode(self.old, compress=False)
+        magic, version, flags, count, base = HEADER.unpack_from(block)
+        self.assertEqual((magic, flags, count), (b'GPSA', 0, 3))
+        latitudes = array.array('i', block[HEADER.size + 4 * count:HEADER.size + 8 * count])
+        self.assertEqual(list(latitudes), [35700001] * 3)
+        deltas = array.array('i', block[HEADER.size:HEADER.size + 4 * count])
+        self.assertEqual(list(deltas), [0, 3600000, 3600000])
+        compressed = encode(self.old)
+        self.assertEqual(zlib.decompress(compressed[HEADER.size:]), block[HEADER.size:])
+
+        self.old[2].timestamp += timezone.timedelta(days=30)
+        wide = encode(self.old, compress=False)
+        self.assertEqual(HEADER.unpack_from(wide)[2], 2)
+        self.assertEqual(decode(wide)['timestamp'][2], self.old[2].timestamp)
+
+    def test_archiver_moves_old_days(self):
+        """Test old fixes become one block per device-day and late fixes are merged in"""
+        archiver = LocationArchiver(after_days=90, now=self.now)
+        self.assertEqual(archiver.run(), 1)
+        self.assertEqual(archiver.archived, 3)
+        self.assertEqual(list(LocationData.objects.values_list('id', flat=True)), [self.recent.id])
+        archive = LocationArchive.objects.get()
+        self.assertEqual((archive.day, archive.point_count), (self.old_day, 3))
+        self.assertEqual([point.battery_level for point in read_points(archive)], [90, 89, 88])
+
+        late = LocationData.objects.create(
+            device=self.device, latitude=Decimal('35.6'), longitude=Decimal('51.3'),
+            timestamp=self.old[0].timestamp + timezone.timedelta(minutes=30),
+        )
+        archiver.run()
+        archive.refresh_from_db()
+        self.assertEqual(archive.point_count, 4)
+        self.assertEqual(read_points(archive)[1].latitude, late.latitude)
+        self.assertEqual(LocationData.objects.count(), 1)
+
+    def test_out_of_range_values_are_archived_as_missing(self):
+        """Test values too wide for their column do not stop the archiver and come back as None"""
+        LocationData.objects.filter(pk=self.old[0].pk).update(battery_level=300, signal_strength=200)
+        archiver = LocationArchiver(after_days=90, now=self.now)
+        with self.assertLogs('apps.tracking.archive', 'WARNING'):
+            self.assertEqual(archiver.run(), 1)
+        first = read_points(LocationArchive.objects.get())[0]
+        self.assertEqual((first.battery_level, first.signal_strength), (None, None))
+        self.assertEqual(first.speed, Decimal('42.25'))
+
+        self.old[1].accuracy = Decimal('400.00')
+        with self.assertLogs('apps.tracking.archive', 'WARNING'):
+            self.assertIsNone(decode(encode(self.old))['accuracy'][1])
+
+    def test_history_merges_live_and_archived_fixes(self):
+        """Test the history sequence counts and slices across live rows and blocks"""
+        LocationArchiver(after_days=90, now=self.now).run()
+        since = self.now - timezone.timedelta(days=365)
+        history = LocationHistory(LocationData.objects.filter(timestamp__gte=since), [self.device.id], since)
+        self.assertEqual(len(history), 4)
+        timestamps = [point.timestamp for point in history[0:4]]
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+        self.assertEqual(history[0].id, self.recent.id)
+        self.assertEqual([point.battery_level for point in history[2:10]], [89, 90])
+
+        since = self.old[1].timestamp
+        history = LocationHistory(LocationData.objects.filter(timestamp__gte=since), [self.device.id], since)
+        self.assertEqual(len(history), 3)
+
+    def test_device_locations_endpoint_reads_archive(self):
+        """Test the device history endpoint returns archived fixes transparently"""
+        LocationArchiver(after_days=90, now=self.now).run()
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('tracking:get_device_locations', args=[self.device.id])
+        response = self.client.get(url, {'hours': 24 * 120, 'limit': 3})
+        locations = response.json()['locations']
+        self.assertEqual(len(locations), 3)
+        self.assertEqual(locations[0]['id'], self.recent.id)
+        self.assertIsNone(locations[1]['id'])
+        self.assertEqual(locations[1]['speed'], 42.25)
+
+    def test_rollup_rebuild_reads_archived_days(self):
+        """Test rebuilding rollups over archived days uses the blocks"""
+        LocationArchiver(after_days=90, now=self.now).run()
+        RollupBuilder(lag=0).rebuild(self.now - timezone.timedelta(days=120))
+        day = LocationRollup.objects.get(period='day', bucket=day_bounds(self.old_day)[0])
+        self.assertEqual(day.point_count, 3)
+
+
+@override_settings(GPS_POSITION_FLUSH_INTERVAL=0)
+class TrackSimplificationTest(DeviceFixtureMixin, TestCase):
+    """Test cases for zoom-aware track simplification"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.start = timezone.now() - timezone.timedelta(hours=6)
+        # Out along a gently curving road and straight back, one fix every 10 seconds
+        self.fixes = LocationData.objects.bulk_create([
+            LocationData(
+                device=self.device,
+                latitude=Decimal('35.700000') + Decimal(min(index, 1000 - index)) / Decimal(10000),
+                longitude=Decimal('51.400000') + Decimal((index % 7) - 3) / Decimal(1000000),
+                speed=Decimal('36.00'),
+                timestamp=self.start + timezone.timedelta(seconds=10 * index),
+            )
+            for index in range(1001)
+        ])
+
+    def test_douglas_peucker_keeps_shape_defining_vertices(self):
+        """Test straight runs collapse while an out-and-back turning point survives"""
+        xs = [0.0, 1.0, 2.0, 3.0, 2.0, 1.0, 0.0]
+        ys = [0.0, 0.01, 0.0, 0.0, 0.0, -0.01, 0.0]
+        self.assertEqual(simplify.douglas_peucker(xs, ys, 0.1), [0, 3, 6])
+        self.assertEqual(simplify.douglas_peucker(xs, ys, 0.001), list(range(7)))
+
+    def test_zoom_sets_a_one_pixel_tolerance(self):
+        """Test lower zoom levels simplify harder"""
+        self.assertAlmostEqual(simplify.zoom_tolerance(0), 156543.03392)
+        self.assertAlmostEqual(simplify.zoom_tolerance(10, 60), 156543.03392 / 2 ** 11, places=3)
+        since = self.start - timezone.timedelta(minutes=1)
+        coarse = simplify.simplified_track(self.device.id, since, zoom=10)
+        fine = simplify.simplified_track(self.device.id, since, tolerance=0.01)
+        self.assertLess(len(coarse), 10)
+        self.assertGreater(len(fine), 200)
+        self.assertEqual(coarse[0][2], self.fixes[0].timestamp.timestamp())
+        self.assertEqual(coarse[-1][2], self.fixes[-1].timestamp.timestamp())
+
+    def test_days_are_cached_until_new_fixes_arrive(self):
+        """Test repeat requests skip the points and a new fix invalidates its day"""
+        since = self.start - timezone.timedelta(minutes=1)
+        first = simplify.simplified_track(self.device.id, since, zoom=14)
+        with self.assertNumQueries(2):
+            self.assertEqual(simplify.simplified_track(self.device.id, since, zoom=14), first)
+
+        LocationData.objects.create(
+            device=self.device, latitude=Decimal('36.0'), longitude=Decimal('52.0'),
+            timestamp=self.fixes[-1].timestamp + timezone.timedelta(seconds=10),
+        )
+        self.assertEqual(simplify.simplified_track(self.device.id, since, zoom=14)[-1][:2], (36.0, 52.0))
+
+    def test_history_endpoint_simplifies_on_request(self):
+        """Test ?zoom= returns the thinned window newest first"""
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('tracking:get_device_locations', args=[self.device.id])
+        response = self.client.get(url, {'zoom': 12})
+        data = response.json()
+        self.assertTrue(data['simplified'])
+        self.assertLess(len(data['locations']), 20)
+        self.assertEqual(data['locations'][0]['timestamp'], self.fixes[-1].timestamp.isoformat())
+        self.assertEqual(data['locations'][-1]['speed'], 36.0)
+        self.assertEqual(self.client.get(url, {'zoom': 'far'}).status_code, 400)
+
+
+class TrackFormatTest(DeviceFixtureMixin, TestCase):
+    """Test cases for the polyline and packed track formats"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='testuser', password='testpass123')
+        self.url = reverse('tracking:get_device_locations', args=[self.device.id])
+        now = timezone.now().replace(microsecond=0)
+        for index in range(3):
+            LocationData.objects.create(
+                device=self.device,
+                latitude=Decimal('35.700000') + index * Decimal('0.001'),
+                longitude=Decimal('51.400000'),
+                speed=Decimal('30.50'),
+                timestamp=now - timezone.timedelta(minutes=10 * (3 - index)),
+            )
+
+    def test_polyline_matches_reference_encoding(self):
+        """Test the encoder against Google's documented example"""
+        coordinates = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        self.assertEqual(encode_polyline(coordinates), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertEqual(decode_polyline('_p~iF~ps|U_ulLnnqC_mqNvxq`@'), coordinates)
+
+    def test_json_stays_the_default(self):
+        """Test clients that accept anything still get the JSON listing"""
+        response = self.client.get(self.url, HTTP_ACCEPT='*/*')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(len(response.json()['locations']), 3)
+        self.assertIn('Accept', response['Vary'])
+
+    def test_polyline_is_negotiated_from_accept(self):
+        """Test the Accept header selects the encoded polyline, oldest fix first"""
+        response = self.client.get(self.url, HTTP_ACCEPT=POLYLINE_MEDIA_TYPE)
+        self.assertEqual(response['Content-Type'], POLYLINE_MEDIA_TYPE)
+        data = response.json()
+        self.assertEqual(data['points'], 3)
+        self.assertEqual(decode_polyline(data['polyline'])[0], (35.7, 51.4))
+        self.assertEqual(data['times'][1:], [600, 600])
+
+    def test_packed_track_via_format_parameter(self):
+        """Test ?format=track returns a packed block readable with the archive decoder"""
+        response = self.client.get(self.url, {'format': 'track'})
+        self.assertEqual(response['Content-Type'], TRACK_MEDIA_TYPE)
+        self.assertEqual(response['X-Point-Count'], '3')
+        columns = decode(response.content)
+        self.assertEqual(columns['latitude'], [Decimal('35.700000'), Decimal('35.701000'), Decimal('35.702000')])
+        self.assertEqual(columns['speed'], [Decimal('30.50')] * 3)
+
+
+class HistoryExportTest(DeviceFixtureMixin, TestCase):
+    """Test cases for the streaming GPX/GeoJSON/CSV exports"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='testuser', password='testpass123')
+        self.url = reverse('tracking:export_device_locations', args=[self.device.id])
+        now = timezone.now().replace(microsecond=0)
+        for days in (40, 2, 1):
+            LocationData.objects.create(
+                device=self.device, latitude=Decimal('35.700000'), longitude=Decimal('51.400000'),
+                altitude=Decimal('1200.50'), speed=Decimal('30.50'), timestamp=now - timezone.timedelta(days=days),
+            )
+        LocationArchiver(after_days=30).run()
+        self.since = (now - timezone.timedelta(days=60)).isoformat()
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_rows_merge_archived_and_live_fixes(self):
+        """Test export rows come oldest first across the archive and live table"""
+        rows = list(export_rows(self.device.id, timezone.now() - timezone.timedelta(days=60), chunk_size=1))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual([row[0] for row in rows], sorted(row[0] for row in rows))
+        self.assertEqual(rows[0][1:4], (Decimal('35.700000'), Decimal('51.400000'), Decimal('1200.50')))
+
+    def test_gpx_export(self):
+        """Test GPX is the default and lists every fix as a track point"""
+        response = self.client.get(self.url, {'since': self.since})
+        self.assertEqual(response['Content-Type'], 'application/gpx+xml; charset=utf-8')
+        self.assertIn('attachment; filename="my-car-tracker-', response['Content-Disposition'])
+        content = self.content(response).decode()
+        self.assertEqual(content.count('<trkpt lat="35.700000" lon="51.400000"><ele>1200.50</ele>'), 3)
+        self.assertTrue(content.rstrip().endswith('</gpx>'))
+
+    def test_geojson_export(self):
+        """Test GeoJSON is a valid FeatureCollection of points"""
+        response = self.client.get(self.url, {'since': self.since, 'format': 'geojson'})
+        data = json.loads(self.content(response))
+        self.assertEqual(data['type'], 'FeatureCollection')
+        self.assertEqual(len(data['features']), 3)
+        self.assertEqual(data['features'][0]['geometry']['coordinates'], [51.4, 35.7, 1200.5])
+        self.assertEqual(data['features'][0]['properties']['speed'], 30.5)
+
+    def test_gzipped_csv_export(self):
+        """Test the CSV export is gzipped when the client accepts it"""
+        response = self.client.get(self.url, {'since': self.since, 'format': 'csv'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        rows = list(csv.reader(io.StringIO(gzip.decompress(self.content(response)).decode())))
+        self.assertEqual(rows[0][:3], ['timestamp', 'latitude', 'longitude'])
+        self.assertEqual(len(rows), 4)
+        self.assertTrue(rows[1][0].endswith('Z'))
+
+    def test_invalid_parameters_are_rejected(self):
+        """Test unknown formats and malformed bounds return 400"""
+        self.assertEqual(self.client.get(self.url, {'format': 'kml'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'since': 'yesterday'}).status_code, 400)
+
+
+class TripSegmentationTest(DeviceFixtureMixin, TestCase):
+    """Test cases for incremental trip and stop detection"""
+
+    def setUp(self):
+        super().setUp()
+        self.start = timezone.now().replace(microsecond=0) - timezone.timedelta(hours=3)
+
+    def add_fixes(self, first_minute, minutes, lng, step=Decimal('0'), speed=Decimal('0')):
+        """One fix a minute from ``first_minute``, moving ``step`` degrees east each minute"""
+        for minute in range(minutes):
+            LocationData.objects.create(
+                device=self.device, latitude=Decimal('35.700000'), longitude=lng + step * minute,
+                speed=speed, timestamp=self.start + timezone.timedelta(minutes=first_minute + minute),
+            )
+        return lng + step * (minutes - 1)
+
+    def add_day(self):
+        """Parked 10 minutes, a 20 minute drive at ~40 km/h, parked 10 minutes, driving again"""
+        step = Decimal('0.007370')
+        self.add_fixes(0, 10, Decimal('51.400000'))
+        end = self.add_fixes(10, 20, Decimal('51.400000') + step, step=step, speed=Decimal('40'))
+        self.add_fixes(30, 10, end)
+        self.add_fixes(40, 6, end + step, step=step, speed=Decimal('40'))
+
+    def test_trips_and_stops_are_detected(self):
+        """Test a parked-drive-parked-drive day gives one closed trip, two stops and an open trip"""
+        self.add_day()
+        self.assertEqual(TripBuilder(lag=0).catch_up(), 46)
+        closed, current = Trip.objects.filter(device=self.device).order_by('start_time')
+        self.assertFalse(closed.is_open)
+        self.assertTrue(current.is_open)
+        self.assertAlmostEqual(closed.distance_km, 13.3, delta=0.2)
+        self.assertEqual(closed.start_time, self.start + timezone.timedelta(minutes=9))
+        self.assertEqual(closed.end_time, self.start + timezone.timedelta(minutes=30))
+        self.assertEqual(closed.max_speed, Decimal('40.00'))
+        self.assertAlmostEqual(closed.avg_speed, 38.1, delta=0.5)
+        first, second = Stop.objects.filter(device=self.device).order_by('start_time')
+        self.assertEqual((first.start_time, first.end_time), (self.start, self.start + timezone.timedelta(minutes=9)))
+        self.assertEqual(second.start_time, closed.end_time)
+        self.assertFalse(second.is_open)
+        self.assertEqual(current.start_time, second.end_time)
+
+    def test_resumes_from_checkpoint(self):
+        """Test segmenting in small batches across runs matches a single pass"""
+        self.add_day()
+        builder = TripBuilder(batch_size=4, lag=0)
+        for _ in range(6):
+            builder.catch_up(max_rows=8)
+        self.assertEqual(builder.consumed, 46)
+        self.assertEqual(TripCheckpoint.objects.get(device=self.device).last_id, LocationData.objects.latest('id').id)
+        batched = list(Trip.objects.order_by('start_time').values_list('start_time', 'end_time', 'point_count'))
+        Trip.objects.all().delete()
+        Stop.objects.all().delete()
+        TripCheckpoint.objects.all().delete()
+        TripBuilder(lag=0).catch_up()
+        self.assertEqual(
+            list(Trip.objects.order_by('start_time').values_list('start_time', 'end_time', 'point_count')), batched
+        )
+        self.assertEqual(TripBuilder(lag=0).catch_up(), 0)
+
+    def test_late_fixes_resegment_their_window(self):
+        """Test fixes arriving after later ones were segmented give the same trips as an in-order pass"""
+        self.add_day()
+        expected_fixes = list(LocationData.objects.order_by('timestamp'))
+        late = expected_fixes[12:16]
+        LocationData.objects.filter(pk__in=[fix.pk for fix in late]).delete()
+        builder = TripBuilder(lag=0)
+        builder.catch_up()
+        for fix in late:
+            fix.pk = None
+            fix.save()
+        self.assertEqual(builder.catch_up(), 4)
+        resegmented = list(Trip.objects.order_by('start_time').values_list('start_time', 'end_time', 'point_count'))
+        stops = list(Stop.objects.order_by('start_time').values_list('start_time', 'end_time'))
+
+        Trip.objects.all().delete()
+        Stop.objects.all().delete()
+        TripCheckpoint.objects.all().delete()
+        TripBuilder(lag=0).catch_up()
+        self.assertEqual(
+            list(Trip.objects.order_by('start_time').values_list('start_time', 'end_time', 'point_count')), resegmented
+        )
+        self.assertEqual(list(Stop.objects.order_by('start_time').values_list('start_time', 'end_time')), stops)
+        self.assertEqual(TripCheckpoint.objects.get().last_id, LocationData.objects.latest('id').id)
+
+    def test_only_devices_with_new_fixes_are_visited(self):
+        """Test catch-up skips devices whose checkpoint is current or whose fixes are not settled"""
+        self.add_day()
+        idle = Device.objects.create(
+            user=self.user, product=self.product, device_type=self.device_type, protocol=self.protocol,
+            imei='999999999999999', serial_number='SN999999999', name='Idle Tracker',
+        )
+        builder = TripBuilder(lag=0)
+        self.assertEqual(list(builder.pending_devices()), [self.device.id])
+        builder.catch_up()
+        self.assertEqual(list(builder.pending_devices()), [])
+        self.assertFalse(TripCheckpoint.objects.filter(device=idle).exists())
+        self.add_fixes(50, 1, Decimal('51.500000'))
+        self.assertEqual(list(TripBuilder(lag=60).pending_devices()), [])
+
+    def test_silence_ends_the_trip(self):
+        """Test a long gap closes the trip and, back at the same spot, counts as a stop"""
+        end = self.add_fixes(0, 10, Decimal('51.400000'), step=Decimal('0.007370'), speed=Decimal('40'))
+        self.add_fixes(70, 3, end)
+        TripBuilder(lag=0).catch_up()
+        trip = Trip.objects.get(device=self.device)
+        self.assertFalse(trip.is_open)
+        self.assertEqual(trip.end_time, self.start + timezone.timedelta(minutes=9))
+        stop = Stop.objects.get(device=self.device)
+        self.assertEqual(stop.start_time, trip.end_time)
+        self.assertEqual(stop.end_time, self.start + timezone.timedelta(minutes=72))
+
+    def test_rebuild_reads_archived_days(self):
+        """Test rebuilding after archiving finds the same trips"""
+        self.start -= timezone.timedelta(days=40)
+        self.add_day()
+        TripBuilder(lag=0).catch_up()
+        expected = list(Trip.objects.order_by('start_time').values_list('start_time', 'end_time', 'point_count'))
+        LocationArchiver(after_days=30).run()
+        self.assertEqual(LocationData.objects.count(), 0)
+        self.assertEqual(TripBuilder(lag=0).rebuild(self.device.id, self.start - timezone.timedelta(days=1)), 46)
+        self.assertEqual(
+            list(Trip.objects.order_by('start_time').values_list('start_time', 'end_time', 'point_count')), expected
+        )
+
+    def test_trip_list_and_playback(self):
+        """Test the trip list reads Trip rows and playback returns the trip's fixes oldest first"""
+        self.add_day()
+        TripBuilder(lag=0).catch_up()
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('tracking:device_trips', args=[self.device.id]), {'stops': 1})
+        data = response.json()
+        self.assertEqual([trip['is_open'] for trip in data['trips']], [True, False])
+        self.assertEqual(len(data['stops']), 2)
+
+        closed = data['trips'][1]
+        response = self.client.get(reverse('tracking:trip_playback', args=[closed['id']]))
+        locations = response.json()['locations']
+        self.assertEqual(len(locations), closed['point_count'])
+        self.assertLess(locations[0]['timestamp'], locations[-1]['timestamp'])
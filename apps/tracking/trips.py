@@ -0,0 +1,355 @@
+"""
+Incremental trip and stop detection.
+
+Each device's fixes are consumed in arrival (id) order from its
+TripCheckpoint and fed to the segmenter in time order. A fix no faster
+than ``stop_speed`` km/h starts a dwell; once the following slow fixes
+have stayed within ``stop_radius`` metres of it for ``stop_seconds``, the
+dwell becomes a Stop and the open Trip ends where the dwell began.
+Leaving the radius ends the stop and starts a trip from its last fix. No
+fix for ``max_gap`` seconds ends the trip at the last fix; if the device
+reappears within the radius the silence is a stop.
+Trips shorter than ``min_distance`` km are dropped as GPS drift.
+
+The open trip, stop or dwell lives in the checkpoint's ``state`` as plain
+numbers, so a run can stop anywhere and the next one carries on. A fix
+that arrives with a timestamp before the last one segmented re-segments
+the device from the start of the trip or stop it falls in.
+"""
+import heapq
+import logging
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from itertools import takewhile
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.gps_devices.models import Device
+from .archive import archived_points
+from .models import LocationData, Stop, Trip, TripCheckpoint
+from .rollups import distance_km
+
+logger = logging.getLogger(__name__)
+
+FIX_FIELDS = ('id', 'device_id', 'timestamp', 'latitude', 'longitude', 'speed')
+
+
+def as_point(fix):
+    """``[epoch seconds, lat, lng, speed]`` for a fix, the form kept in checkpoint state"""
+    return [
+        fix.timestamp.timestamp(), float(fix.latitude), float(fix.longitude),
+        float(fix.speed) if fix.speed is not None else None,
+    ]
+
+
+def as_datetime(epoch):
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+def as_coordinate(value):
+    return Decimal(f'{value:.6f}')
+
+
+class TripSegmenter:
+    """
+    The detection state machine for one device.
+
+    ``feed`` points in time order; finished trips and stops collect in
+    ``closed`` and the open ones stay in ``state``.
+    """
+
+    def __init__(self, state, stop_speed, stop_radius, stop_seconds, max_gap, min_distance):
+        self.state = state
+        self.state.setdefault('trip', None)
+        self.state.setdefault('stop', None)
+        self.state.setdefault('dwell', [])
+        self.stop_speed = stop_speed
+        self.stop_radius = stop_radius
+        self.stop_seconds = stop_seconds
+        self.max_gap = max_gap
+        self.min_distance = min_distance
+        self.closed = []
+
+    def slow(self, point):
+        return point[3] is None or point[3] <= self.stop_speed
+
+    def keeps(self, trip):
+        """Whether a trip went far enough to be more than drift"""
+        return trip['distance'] >= self.min_distance
+
+    def near(self, anchor, point):
+        return distance_km(anchor[1], anchor[2], point[1], point[2]) * 1000 <= self.stop_radius
+
+    def feed(self, point):
+        state = self.state
+        last = state.get('last')
+        state['last'] = point
+        if last is not None and point[0] - last[0] > self.max_gap:
+            self.bridge_gap(last, point)
+
+        stop = state['stop']
+        if stop is not None:
+            if self.near(stop['start'], point):
+                stop['end'] = point[0]
+                stop['count'] += 1
+                return
+            self.close_stop()
+            self.start_trip(last)
+            self.extend_trip(point)
+            return
+
+        dwell = state['dwell']
+        if dwell:
+            if self.slow(point) and self.near(dwell[0], point):
+                dwell.append(point)
+                if point[0] - dwell[0][0] >= self.stop_seconds:
+                    self.close_trip()
+                    state['stop'] = {'start': dwell[0], 'end': point[0], 'count': len(dwell), 'id': None}
+                    state['dwell'] = []
+                return
+            # Moved on before the dwell counted as a stop: it was part of the trip
+            for held in dwell[1:]:
+                self.extend_trip(held)
+            state['dwell'] = []
+
+        if state['trip'] is None:
+            self.start_trip(point)
+        else:
+            self.extend_trip(point)
+        if self.slow(point):
+            state['dwell'] = [point]
+
+    def bridge_gap(self, last, point):
+        """End what was going on before a silence of more than ``max_gap``"""
+        state = self.state
+        if state['stop'] is not None:
+            if not self.near(state['stop']['start'], point):
+                self.close_stop()
+            return
+        anchor = state['dwell'][0] if state['dwell'] else last
+        count = len(state['dwell']) or 1
+        self.close_trip()
+        state['dwell'] = []
+        if self.near(anchor, point):
+            state['stop'] = {'start': anchor, 'end': last[0], 'count': count, 'id': None}
+
+    def start_trip(self, point):
+        self.state['trip'] = {
+            'start': point, 'end': point, 'distance': 0.0, 'count': 1, 'max_speed': point[3], 'id': None,
+        }
+
+    def extend_trip(self, point):
+        trip = self.state['trip']
+        end = trip['end']
+        trip['distance'] += distance_km(end[1], end[2], point[1], point[2])
+        trip['end'] = point
+        trip['count'] += 1
+        if point[3] is not None:
+            trip['max_speed'] = max(trip['max_speed'] or 0.0, point[3])
+
+    def close_trip(self):
+        trip, self.state['trip'] = self.state['trip'], None
+        if trip is not None:
+            self.closed.append(('trip', trip))
+
+    def close_stop(self):
+        stop, self.state['stop'] = self.state['stop'], None
+        self.closed.append(('stop', stop))
+
+
+class TripBuilder:
+    """
+    Feeds new LocationData through each device's TripSegmenter and saves the result.
+
+    Work is done per device in batches of ``batch_size`` fixes, each in one
+    transaction holding the device's checkpoint row, so concurrent runs never
+    consume a fix twice. Fixes are taken in id order once they were received
+    ``lag`` seconds ago, so a lower id still being committed is not passed
+    over; a batch reaching back before the last fix segmented is replayed
+    with ``resegment``.
+    """
+
+    def __init__(self, batch_size=None, lag=None, **thresholds):
+        self.batch_size = batch_size or getattr(settings, 'GPS_TRIP_BATCH_SIZE', 5000)
+        self.lag = lag if lag is not None else getattr(settings, 'GPS_TRIP_LAG', 5.0)
+        self.thresholds = {
+            'stop_speed': getattr(settings, 'GPS_TRIP_STOP_SPEED', 3.0),
+            'stop_radius': getattr(settings, 'GPS_TRIP_STOP_RADIUS', 100.0),
+            'stop_seconds': getattr(settings, 'GPS_TRIP_STOP_SECONDS', 300),
+            'max_gap': getattr(settings, 'GPS_TRIP_MAX_GAP', 1800),
+            'min_distance': getattr(settings, 'GPS_TRIP_MIN_DISTANCE', 0.3),
+            **thresholds,
+        }
+        self.consumed = 0
+
+    def horizon(self):
+        return timezone.now() - timezone.timedelta(seconds=self.lag)
+
+    def pending_devices(self, device_ids=None):
+        """Ids of the devices with settled fixes past their checkpoint"""
+        checkpoint = TripCheckpoint.objects.filter(device_id=OuterRef('pk')).values('last_id')
+        devices = Device.objects.annotate(checkpoint_id=Coalesce(Subquery(checkpoint), 0)).filter(
+            Exists(LocationData.objects.filter(
+                device_id=OuterRef('pk'), id__gt=OuterRef('checkpoint_id'), received_at__lt=self.horizon()
+            ))
+        )
+        if device_ids is not None:
+            devices = devices.filter(id__in=list(device_ids))
+        return devices.order_by('id').values_list('id', flat=True)
+
+    def catch_up(self, device_ids=None, max_rows=None):
+        """Segment every device's settled fixes, returning the number consumed"""
+        consumed = 0
+        for device_id in list(self.pending_devices(device_ids)):
+            while max_rows is None or consumed < max_rows:
+                limit = self.batch_size if max_rows is None else min(self.batch_size, max_rows - consumed)
+                count = self.segment_batch(device_id, limit)
+                consumed += count
+                if count < limit:
+                    break
+        return consumed
+
+    def segment_batch(self, device_id, limit=None):
+        horizon = self.horizon()
+        with transaction.atomic():
+            checkpoint = self.lock_checkpoint(device_id)
+            fixes = LocationData.objects.filter(device_id=device_id, id__gt=checkpoint.last_id)
+            fixes = list(fixes.order_by('id').only(*FIX_FIELDS, 'received_at')[:limit or self.batch_size])
+            fixes = list(takewhile(lambda fix: fix.received_at < horizon, fixes))
+            if not fixes:
+                return 0
+            last_id = fixes[-1].id
+            fixes.sort(key=attrgetter('timestamp', 'id'))
+            last = checkpoint.state.get('last')
+            if last is not None and fixes[0].timestamp.timestamp() < last[0]:
+                self.resegment(checkpoint, fixes[0].timestamp, last_id)
+            else:
+                self.feed(checkpoint, fixes)
+                checkpoint.last_id = last_id
+                checkpoint.save()
+        self.consumed += len(fixes)
+        return len(fixes)
+
+    def lock_checkpoint(self, device_id):
+        TripCheckpoint.objects.get_or_create(device_id=device_id)
+        return TripCheckpoint.objects.select_for_update().get(device_id=device_id)
+
+    def feed(self, checkpoint, fixes):
+        """Run fixes in time order through the device's segmenter, saving trips and stops and the new state"""
+        segmenter = TripSegmenter(checkpoint.state, **self.thresholds)
+        for fix in fixes:
+            segmenter.feed(as_point(fix))
+        for kind, segment in segmenter.closed:
+            if kind == 'trip' and not segmenter.keeps(segment):
+                if segment['id'] is not None:
+                    Trip.objects.filter(pk=segment['id']).delete()
+                continue
+            self.save(checkpoint.device_id, kind, segment, is_open=False)
+        state = segmenter.state
+        if state['trip'] is not None and segmenter.keeps(state['trip']):
+            self.save(checkpoint.device_id, 'trip', state['trip'], is_open=True)
+        if state['stop'] is not None:
+            self.save(checkpoint.device_id, 'stop', state['stop'], is_open=True)
+        checkpoint.last_timestamp = fixes[-1].timestamp
+        checkpoint.state = state
+
+    def save(self, device_id, kind, segment, is_open):
+        """Create or update the row for a segment, recording its id in the segment"""
+        if kind == 'trip':
+            start, end = segment['start'], segment['end']
+            hours = (end[0] - start[0]) / 3600
+            values = {
+                'start_time': as_datetime(start[0]), 'end_time': as_datetime(end[0]),
+                'start_latitude': as_coordinate(start[1]), 'start_longitude': as_coordinate(start[2]),
+                'end_latitude': as_coordinate(end[1]), 'end_longitude': as_coordinate(end[2]),
+                'distance_km': segment['distance'], 'point_count': segment['count'],
+                'max_speed': Decimal(f"{segment['max_speed']:.2f}") if segment['max_speed'] is not None else None,
+                'avg_speed': segment['distance'] / hours if hours else None,
+                'is_open': is_open,
+            }
+            model = Trip
+        else:
+            start = segment['start']
+            values = {
+                'start_time': as_datetime(start[0]), 'end_time': as_datetime(segment['end']),
+                'latitude': as_coordinate(start[1]), 'longitude': as_coordinate(start[2]),
+                'point_count': segment['count'], 'is_open': is_open,
+            }
+            model = Stop
+        if segment['id'] is None:
+            segment['id'] = model.objects.create(device_id=device_id, **values).pk
+        else:
+            model.objects.filter(pk=segment['id']).update(updated_at=timezone.now(), **values)
+
+    def rebuild(self, device_id, since):
+        """
+        Segment a device again from ``since``, archived days included, returning the fixes consumed.
+
+        Trips and stops overlapping ``since`` or later are replaced; the
+        checkpoint ends up at the last settled live fix.
+        """
+        with transaction.atomic():
+            checkpoint = self.lock_checkpoint(device_id)
+            consumed = self.resegment(checkpoint, since)
+        self.consumed += consumed
+        logger.info(f'Rebuilt trips of device {device_id} from {since:%Y-%m-%d} ({consumed} fixes)')
+        return consumed
+
+    def resegment(self, checkpoint, since, through_id=None):
+        """
+        Replace the locked device's trips and stops from ``since`` on, returning the fixes fed.
+
+        ``since`` is widened to the start of the trip, stop or dwell it falls
+        in, so the replay starts on a boundary. Live fixes up to
+        ``through_id``, or every settled one without it, are merged in time
+        order with archived days and the checkpoint advanced past them.
+        """
+        device_id = checkpoint.device_id
+        horizon = self.horizon()
+        state = checkpoint.state
+        open_starts = [
+            segment['start'][0] for segment in (state.get('trip'), state.get('stop')) if segment is not None
+        ] + [point[0] for point in state.get('dwell', [])[:1]]
+        since = min([since] + [as_datetime(start) for start in open_starts])
+        for model in (Trip, Stop):
+            first = model.objects.filter(device_id=device_id, end_time__gte=since).order_by('start_time').first()
+            if first is not None:
+                since = min(since, first.start_time)
+        Trip.objects.filter(device_id=device_id, end_time__gte=since).delete()
+        Stop.objects.filter(device_id=device_id, end_time__gte=since).delete()
+
+        live = LocationData.objects.filter(device_id=device_id)
+        if through_id is None:
+            unsettled = live.filter(received_at__gte=horizon).order_by('id').values_list('id', flat=True).first()
+            settled = live.filter(received_at__lt=horizon)
+            if unsettled is not None:
+                settled = settled.filter(id__lt=unsettled)
+            through_id = settled.aggregate(last=Max('id'))['last'] or 0
+        checkpoint.state = {}
+        checkpoint.last_timestamp = None
+        checkpoint.last_id = max(checkpoint.last_id, through_id)
+
+        fixes = heapq.merge(
+            archived_points([device_id], since=since, until=horizon),
+            live.filter(timestamp__gte=since, id__lte=through_id).order_by('timestamp', 'id').only(*FIX_FIELDS)
+            .iterator(chunk_size=self.batch_size),
+            key=attrgetter('timestamp'),
+        )
+        consumed = 0
+        batch = []
+        for fix in fixes:
+            batch.append(fix)
+            if len(batch) >= self.batch_size:
+                self.feed(checkpoint, batch)
+                consumed += len(batch)
+                batch = []
+        if batch:
+            self.feed(checkpoint, batch)
+            consumed += len(batch)
+        checkpoint.save()
+        return consumed
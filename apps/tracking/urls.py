@@ -13,7 +13,14 @@ urlpatterns = [
 
     # API endpoints for location data
     path('api/device/<int:device_id>/location/', views.update_device_location, name='update_device_location'),
+    path('api/device/<int:device_id>/location/queue/', views.enqueue_device_location, name='enqueue_device_location'),
     path('api/device/<int:device_id>/locations/', views.get_device_locations, name='get_device_locations'),
+    path('api/device/<int:device_id>/summary/', views.device_summary, name='device_summary'),
+    path('api/device/<int:device_id>/export/', views.export_device_locations, name='export_device_locations'),
+    path('api/device/<int:device_id>/trips/', views.device_trips, name='device_trips'),
+    path('api/trips/<int:trip_id>/playback/', views.trip_playback, name='trip_playback'),
+    path('api/fleet/positions/', views.fleet_positions, name='fleet_positions'),
+    path('api/locations/batch/', views.bulk_update_locations, name='bulk_update_locations'),
 
     # Geofence management
     path('geofences/', views.geofence_list, name='geofence_list'),
@@ -1,14 +1,30 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_POST
 from django.utils import timezone
 from django.core.paginator import Paginator
 from django.db.models import Q
+from django.conf import settings
 import json
+import re
+import zlib
 
+from apps.gps_devices.ingest.fleet_table import FleetPosition, get_fleet_table
+from apps.gps_devices.ingest.positions import get_position_store
 from apps.gps_devices.models import Device
-from .models import LocationData, Geofence, Alert
+from apps.gps_devices.parsers.registry import ParseError
+from .models import LocationData, LocationUpdate, Geofence, Alert, Trip
+from .alerts import check_geofence_alerts
+from .archive import LocationHistory
+from .export import EXPORT_FORMATS, export_response, export_rows
+from .formats import compact_response, requested_format, vertex_point
+from .partitions import history_range
+from .processing import BUILD_ERRORS, build_location, to_timestamp, update_device_positions
+from .rollups import bucket_start, combine, covering_rollups
+from .simplify import simplified_track, vertex_json
 
 
 @login_required
@@ -23,7 +39,7 @@ def tracking_dashboard(request):
     ).select_related('device').order_by('-created_at')[:5]
 
     context = {
-        'devices': devices,
+        'devices': with_latest_positions(devices),
         'active_alerts': active_alerts,
         'total_devices': devices.count(),
         'active_devices': devices.filter(status='active').count(),
@@ -31,12 +47,22 @@ def tracking_dashboard(request):
     return render(request, 'tracking/tracking.html', context)
 
 
+def with_latest_positions(devices):
+    """Overlay positions from the fleet table and the write-behind store, which can be ahead of the database"""
+    table = get_fleet_table()
+    if table is not None:
+        devices = table.apply(devices)
+    store = get_position_store()
+    return store.apply(devices) if store is not None else devices
+
+
 @login_required
 def device_tracking(request, device_id):
     """
     Detailed tracking view for a specific device
     """
     device = get_object_or_404(Device, id=device_id, user=request.user)
+    device, = with_latest_positions([device])
 
     # Get recent location data (last 24 hours)
     recent_locations = LocationData.objects.filter(
@@ -67,7 +93,12 @@ def device_tracking(request, device_id):
 def update_device_location(request, device_id):
     """
     API endpoint to update device location (for GPS devices)
+
+    With ``GPS_LOCATION_INGEST_MODE = 'queue'`` the update is only queued and
+    acknowledged, see ``enqueue_device_location``.
     """
+    if getattr(settings, 'GPS_LOCATION_INGEST_MODE', 'sync') == 'queue':
+        return queue_location_update(request, device_id)
     device = get_object_or_404(Device, id=device_id)
 
     try:
@@ -84,15 +115,11 @@ def update_device_location(request, device_id):
             battery_level=data.get('battery_level'),
             signal_strength=data.get('signal_strength'),
             raw_data=data.get('raw_data', {}),
-            timestamp=data.get('timestamp'),
+            timestamp=to_timestamp(data.get('timestamp'), timezone.now()),
         )
 
         # Update device last location
-        device.update_location(
-            location_data.latitude,
-            location_data.longitude,
-            location_data.timestamp
-        )
+        update_device_positions([location_data])
 
         # Check geofence alerts
         check_geofence_alerts(device, location_data.latitude, location_data.longitude)
@@ -103,21 +130,249 @@ def update_device_location(request, device_id):
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
 
+@login_required
+@require_POST
+def enqueue_device_location(request, device_id):
+    """
+    Fast-ack location update endpoint.
+
+    The fix is validated and appended to the LocationUpdate queue, and the
+    view answers 202 with the queue sequence number straight away. Storing
+    the fix, moving the device and evaluating geofences is left to
+    ``manage.py process_location_updates``.
+    """
+    return queue_location_update(request, device_id)
+
+
+def queue_location_update(request, device_id):
+    # Same ownership rule as the batch upload: staff may report for any device
+    devices = Device.objects.all() if request.user.is_staff else Device.objects.filter(user=request.user)
+    device = get_object_or_404(devices, id=device_id)
+    received_at = timezone.now()
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            raise ParseError('Location must be an object')
+        build_location(data, device.id, received_at)
+    except BUILD_ERRORS as e:
+        return JsonResponse({'status': 'error', 'message': str(e) or e.__class__.__name__}, status=400)
+
+    update = LocationUpdate.objects.create(device=device, payload=data, received_at=received_at)
+    return JsonResponse({'status': 'queued', 'sequence': update.id}, status=202)
+
+
+@login_required
+@require_POST
+def bulk_update_locations(request):
+    """
+    API endpoint to upload many location fixes in one request.
+
+    Accepts ``{"device_id": 1, "points": [...]}``, ``{"points": [...]}`` with a
+    ``device_id`` on each point, or a bare list of points. The body may be
+    gzip-compressed (``Content-Encoding: gzip``). Valid points are written
+    with one bulk insert and each device's last position is updated once;
+    invalid points are reported by index.
+    """
+    try:
+        payload = json.loads(read_request_body(request))
+    except (ValueError, OSError, zlib.error) as e:
+        return JsonResponse({'status': 'error', 'message': f'Invalid request body: {e}'}, status=400)
+
+    default_device = None
+    points = payload
+    if isinstance(payload, dict):
+        default_device = payload.get('device_id')
+        points = payload.get('points')
+    if not isinstance(points, list) or not points:
+        return JsonResponse({'status': 'error', 'message': 'No points supplied'}, status=400)
+    max_points = getattr(settings, 'GPS_LOCATION_BATCH_MAX_POINTS', 5000)
+    if len(points) > max_points:
+        return JsonResponse({'status': 'error', 'message': f'At most {max_points} points per request'}, status=400)
+
+    device_ids = set()
+    for point in points:
+        if isinstance(point, dict):
+            device_id = point.get('device_id', default_device)
+            # Anything else (strings, lists, objects) is reported against its point below
+            if isinstance(device_id, int) and not isinstance(device_id, bool):
+                device_ids.add(device_id)
+    devices = Device.objects.filter(id__in=device_ids)
+    if not request.user.is_staff:
+        devices = devices.filter(user=request.user)
+    devices = devices.in_bulk()
+
+    now = timezone.now()
+    locations = []
+    rejected = []
+    for index, point in enumerate(points):
+        try:
+            if not isinstance(point, dict):
+                raise ParseError('Point must be an object')
+            device_id = point.get('device_id', default_device)
+            if not isinstance(device_id, int) or isinstance(device_id, bool) or device_id not in devices:
+                raise ParseError(f'Unknown device: {device_id!r}')
+            location = build_location(point, device_id, now)
+            location.raw_data = point.get('raw_data', {})
+            locations.append(location)
+        except BUILD_ERRORS as e:
+            rejected.append({'index': index, 'error': str(e) or e.__class__.__name__})
+
+    if not locations:
+        return JsonResponse({'status': 'error', 'created': 0, 'rejected': rejected}, status=400)
+
+    LocationData.objects.bulk_create(locations, batch_size=500)
+    latest = update_device_positions(locations)
+    for device_id, location in latest.items():
+        check_geofence_alerts(devices[device_id], location.latitude, location.longitude)
+
+    return JsonResponse({'status': 'success', 'created': len(locations), 'rejected': rejected})
+
+
+def read_request_body(request):
+    """Return the request body, inflating gzip bodies up to GPS_LOCATION_BATCH_MAX_BYTES"""
+    body = request.body
+    if request.headers.get('Content-Encoding', '').lower() != 'gzip':
+        return body
+    max_bytes = getattr(settings, 'GPS_LOCATION_BATCH_MAX_BYTES', 10 * 1024 * 1024)
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    data = inflater.decompress(body, max_bytes)
+    if inflater.unconsumed_tail:
+        raise ValueError(f'Decompressed body exceeds {max_bytes} bytes')
+    return data
+
+
+@never_cache
+@login_required
+def fleet_positions(request):
+    """
+    API endpoint with the last position of each of the user's devices.
+
+    Positions are read from the shared fleet table when it is configured;
+    only devices missing from it are loaded from the database.
+    """
+    device_ids = list(Device.objects.filter(user=request.user).values_list('id', flat=True))
+    table = get_fleet_table()
+    positions = table.get_many(device_ids) if table is not None else {}
+    missing = [device_id for device_id in device_ids if device_id not in positions]
+    if missing:
+        for device in with_latest_positions(Device.objects.filter(id__in=missing).only(
+            'id', 'last_location_lat', 'last_location_lng', 'last_location_time', 'battery_level', 'status'
+        )):
+            positions[device.id] = FleetPosition(
+                device.last_location_lat,
+                device.last_location_lng,
+                device.last_location_time,
+                device.battery_level,
+                device.status,
+            )
+
+    devices = []
+    for device_id in device_ids:
+        position = positions[device_id]
+        devices.append({
+            'device_id': device_id,
+            'latitude': float(position.lat) if position.lat is not None else None,
+            'longitude': float(position.lng) if position.lng is not None else None,
+            'timestamp': position.time.isoformat() if position.time else None,
+            'battery_level': position.battery_level,
+            'status': position.status,
+        })
+    return JsonResponse({'devices': devices})
+
+
+def rollup_json(rollup):
+    return {
+        'start': rollup.first_time.isoformat(),
+        'end': rollup.last_time.isoformat(),
+        'points': rollup.point_count,
+        'distance_km': round(rollup.distance_km, 3),
+        'max_speed': float(rollup.max_speed) if rollup.max_speed is not None else None,
+        'avg_speed': round(rollup.avg_speed, 2) if rollup.avg_speed is not None else None,
+        'min_battery': rollup.min_battery,
+        'first': [float(rollup.first_lat), float(rollup.first_lng)],
+        'last': [float(rollup.last_lat), float(rollup.last_lng)],
+        'bounds': [float(rollup.min_lat), float(rollup.min_lng), float(rollup.max_lat), float(rollup.max_lng)],
+    }
+
+
+@never_cache
+@login_required
+def device_summary(request, device_id):
+    """
+    API endpoint summarising a device's movement over a time range.
+
+    Read from the hourly/daily rollups, so ranges of months stay cheap.
+    ``period=hour|day`` adds the per-bucket series.
+    """
+    device = get_object_or_404(Device, id=device_id, user=request.user)
+    period = request.GET.get('period')
+    if period not in (None, 'hour', 'day'):
+        return JsonResponse({'status': 'error', 'message': 'period must be hour or day'}, status=400)
+    try:
+        since, until = history_range(request.GET.get('since'), request.GET.get('until'))
+    except ParseError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    until = until or timezone.now()
+
+    rollups = covering_rollups(device.id, since, until)
+    total = combine(rollups)
+    data = {
+        'device_id': device.id,
+        'since': since.isoformat(),
+        'until': until.isoformat(),
+        'summary': rollup_json(total) if total is not None else None,
+    }
+    if period:
+        buckets = device.location_rollups.filter(
+            period=period, bucket__gte=bucket_start(since, period), bucket__lt=until
+        ).order_by('bucket')
+        data['buckets'] = [{'bucket': bucket.bucket.isoformat(), **rollup_json(bucket)} for bucket in buckets]
+    return JsonResponse(data)
+
+
+def simplification_params(request):
+    """``zoom`` (map zoom level) and ``tolerance`` (metres) from the query string, None when absent"""
+    zoom = request.GET.get('zoom')
+    tolerance = request.GET.get('tolerance')
+    return (int(zoom) if zoom else None), (float(tolerance) if tolerance else None)
+
+
 @login_required
 def get_device_locations(request, device_id):
     """
     API endpoint to get device location history
+
+    Answers in JSON, or as an encoded polyline or packed binary track when
+    asked for with ``?format=`` or the Accept header (see apps.tracking.formats).
     """
     device = get_object_or_404(Device, id=device_id, user=request.user)
 
     # Parse query parameters
     hours = int(request.GET.get('hours', 24))
     limit = int(request.GET.get('limit', 100))
+    output = requested_format(request)
+    metadata = {'device_id': device.id, 'device_name': device.name}
 
-    locations = LocationData.objects.filter(
-        device=device,
-        timestamp__gte=timezone.now() - timezone.timedelta(hours=hours)
-    ).order_by('-timestamp')[:limit]
+    since = timezone.now() - timezone.timedelta(hours=hours)
+    try:
+        zoom, tolerance = simplification_params(request)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'zoom must be an integer and tolerance a number'}, status=400)
+    if zoom is not None or tolerance is not None:
+        # The whole window, thinned to what is visible at this zoom, newest first like the raw listing
+        track = simplified_track(device.id, since, zoom=zoom, tolerance=tolerance)
+        metadata['simplified'] = True
+        if output != 'json':
+            return compact_response(output, [vertex_point(vertex) for vertex in track], metadata)
+        response = JsonResponse({**metadata, 'locations': [vertex_json(vertex) for vertex in reversed(track)]})
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+    locations = LocationHistory(
+        LocationData.objects.filter(device=device, timestamp__gte=since), [device.id], since
+    )[:limit]
+    if output != 'json':
+        return compact_response(output, locations, metadata)
 
     location_data = [{
         'id': loc.id,
@@ -129,11 +384,128 @@ def get_device_locations(request, device_id):
         'address': loc.address,
     } for loc in locations]
 
-    return JsonResponse({
+    response = JsonResponse({
         'device_id': device.id,
         'device_name': device.name,
         'locations': location_data
     })
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+@login_required
+def export_device_locations(request, device_id):
+    """
+    Download a device's history as ``?format=gpx`` (default), ``geojson`` or ``csv``
+
+    Covers ``since``/``until`` (the last GPS_LOCATION_HISTORY_DAYS by default)
+    including archived days. The file is streamed as it is read, gzipped when
+    the client accepts it, so months of fixes never sit in memory. Long
+    exports need the threaded workers of gunicorn.conf.py; a sync worker is
+    killed after its timeout mid-stream.
+    """
+    device = get_object_or_404(Device, id=device_id, user=request.user)
+    output = request.GET.get('format', 'gpx')
+    if output not in EXPORT_FORMATS:
+        return JsonResponse(
+            {'status': 'error', 'message': f"format must be one of {', '.join(EXPORT_FORMATS)}"}, status=400
+        )
+    try:
+        since, until = history_range(request.GET.get('since'), request.GET.get('until'))
+    except ParseError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    compress = bool(re.search(r'\bgzip\b', request.headers.get('Accept-Encoding', '')))
+    filename = f'{device.name}-{timezone.localtime(since):%Y%m%d}'
+    return export_response(output, device, export_rows(device.id, since, until), filename, compress)
+
+
+def trip_json(trip):
+    return {
+        'id': trip.id,
+        'start_time': trip.start_time.isoformat(),
+        'end_time': trip.end_time.isoformat(),
+        'start': [float(trip.start_latitude), float(trip.start_longitude)],
+        'end': [float(trip.end_latitude), float(trip.end_longitude)],
+        'distance_km': round(trip.distance_km, 3),
+        'duration_seconds': trip.duration.total_seconds(),
+        'point_count': trip.point_count,
+        'max_speed': float(trip.max_speed) if trip.max_speed is not None else None,
+        'avg_speed': round(trip.avg_speed, 2) if trip.avg_speed is not None else None,
+        'is_open': trip.is_open,
+    }
+
+
+@never_cache
+@login_required
+def device_trips(request, device_id):
+    """
+    API endpoint listing a device's trips, newest first, with ``stops=1`` its stops too
+
+    Reads the Trip and Stop rows kept by ``segment_trips``, never the fixes.
+    """
+    device = get_object_or_404(Device, id=device_id, user=request.user)
+    try:
+        since, until = history_range(request.GET.get('since'), request.GET.get('until'))
+    except ParseError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    limit = min(int(request.GET.get('limit', 100)), 1000)
+
+    trips = device.trips.filter(end_time__gte=since)
+    if until is not None:
+        trips = trips.filter(start_time__lte=until)
+    data = {
+        'device_id': device.id,
+        'trips': [trip_json(trip) for trip in trips.order_by('-start_time')[:limit]],
+    }
+    if request.GET.get('stops'):
+        stops = device.stops.filter(end_time__gte=since)
+        if until is not None:
+            stops = stops.filter(start_time__lte=until)
+        data['stops'] = [{
+            'id': stop.id,
+            'start_time': stop.start_time.isoformat(),
+            'end_time': stop.end_time.isoformat(),
+            'latitude': float(stop.latitude),
+            'longitude': float(stop.longitude),
+            'duration_seconds': stop.duration.total_seconds(),
+            'is_open': stop.is_open,
+        } for stop in stops.order_by('-start_time')[:limit]]
+    return JsonResponse(data)
+
+
+@never_cache
+@login_required
+def trip_playback(request, trip_id):
+    """
+    API endpoint replaying one trip's fixes, oldest first
+
+    Reads the device's fixes between the trip's start and end only, archived
+    days included; like the history endpoint it can answer as a polyline or
+    packed track.
+    """
+    trip = get_object_or_404(Trip.objects.select_related('device'), id=trip_id, device__user=request.user)
+    queryset = LocationData.objects.filter(
+        device_id=trip.device_id, timestamp__gte=trip.start_time, timestamp__lte=trip.end_time
+    )
+    points = list(LocationHistory(queryset, [trip.device_id], trip.start_time, trip.end_time))[::-1]
+    output = requested_format(request)
+    metadata = {'device_id': trip.device_id, 'trip_id': trip.id}
+    if output != 'json':
+        return compact_response(output, points, metadata)
+
+    response = JsonResponse({
+        **metadata,
+        'trip': trip_json(trip),
+        'locations': [{
+            'latitude': float(point.latitude),
+            'longitude': float(point.longitude),
+            'timestamp': point.timestamp.isoformat(),
+            'speed': float(point.speed) if point.speed is not None else None,
+        } for point in points],
+    })
+    patch_vary_headers(response, ['Accept'])
+    return response
 
 
 @login_required
@@ -220,64 +592,35 @@ def resolve_alert(request, alert_id):
     return JsonResponse({'status': 'success'})
 
 
-def check_geofence_alerts(device, lat, lng):
-    """
-    Check if device location triggers any geofence alerts
-    """
-    geofences = Geofence.objects.filter(user=device.user, is_active=True)
-
-    for geofence in geofences:
-        is_inside = geofence.contains_point(lat, lng)
-
-        # Check for enter/exit alerts
-        if geofence.alert_on_enter and is_inside:
-            # Check if device was previously outside
-            last_location = LocationData.objects.filter(
-                device=device
-            ).exclude(id=LocationData.objects.filter(device=device).order_by('-timestamp').first().id if LocationData.objects.filter(device=device).exists() else None).order_by('-timestamp').first()
-
-            if last_location and not geofence.contains_point(last_location.latitude, last_location.longitude):
-                Alert.objects.create(
-                    device=device,
-                    alert_type='geofence_enter',
-                    message=f"دستگاه وارد منطقه {geofence.name} شد",
-                    location_data=LocationData.objects.filter(device=device).order_by('-timestamp').first(),
-                )
-
-        elif geofence.alert_on_exit and not is_inside:
-            # Check if device was previously inside
-            last_location = LocationData.objects.filter(
-                device=device
-            ).exclude(id=LocationData.objects.filter(device=device).order_by('-timestamp').first().id if LocationData.objects.filter(device=device).exists() else None).order_by('-timestamp').first()
-
-            if last_location and geofence.contains_point(last_location.latitude, last_location.longitude):
-                Alert.objects.create(
-                    device=device,
-                    alert_type='geofence_exit',
-                    message=f"دستگاه از منطقه {geofence.name} خارج شد",
-                    location_data=LocationData.objects.filter(device=device).order_by('-timestamp').first(),
-                )
-
-
 @login_required
 def real_time_tracking(request, device_id):
     """
     Real-time tracking view with WebSocket support
     """
     device = get_object_or_404(Device, id=device_id, user=request.user)
-
-    recent_locations = LocationData.objects.filter(
-        device=device,
-        timestamp__gte=timezone.now() - timezone.timedelta(hours=1)
-    ).order_by('timestamp')
-
-    locations_data = [{
-        'latitude': float(loc.latitude),
-        'longitude': float(loc.longitude),
-        'speed': float(loc.speed) if loc.speed else None,
-        'timestamp': loc.timestamp.isoformat(),
-        'battery_level': loc.battery_level,
-    } for loc in recent_locations]
+    since = timezone.now() - timezone.timedelta(hours=1)
+    try:
+        zoom, tolerance = simplification_params(request)
+    except ValueError:
+        zoom = tolerance = None
+
+    if zoom is not None or tolerance is not None:
+        locations_data = [
+            vertex_json(vertex) for vertex in simplified_track(device.id, since, zoom=zoom, tolerance=tolerance)
+        ]
+    else:
+        recent_locations = LocationData.objects.filter(
+            device=device,
+            timestamp__gte=since
+        ).order_by('timestamp')
+
+        locations_data = [{
+            'latitude': float(loc.latitude),
+            'longitude': float(loc.longitude),
+            'speed': float(loc.speed) if loc.speed else None,
+            'timestamp': loc.timestamp.isoformat(),
+            'battery_level': loc.battery_level,
+        } for loc in recent_locations]
 
     context = {
         'device': device,
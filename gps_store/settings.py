@@ -176,6 +176,64 @@ IMAGE_COMPRESSION_QUALITY = 85
 IMAGE_MAX_WIDTH = 1920
 IMAGE_MAX_HEIGHT = 1080
 
+# GPS ingestion settings
+# Raw packets are batched in memory and written with bulk_create
+GPS_INGEST_BATCH_SIZE = int(os.getenv('GPS_INGEST_BATCH_SIZE', 500))
+GPS_INGEST_FLUSH_INTERVAL = float(os.getenv('GPS_INGEST_FLUSH_INTERVAL', 1.0))  # seconds
+GPS_INGEST_MAX_PENDING = int(os.getenv('GPS_INGEST_MAX_PENDING', 10000))
+GPS_INGEST_PUT_TIMEOUT = float(os.getenv('GPS_INGEST_PUT_TIMEOUT', 5.0))  # seconds producers wait when full
+# Disk spool for packets the database cannot take; set GPS_INGEST_SPOOL_DIR to '' to disable
+GPS_INGEST_SPOOL_DIR = os.getenv('GPS_INGEST_SPOOL_DIR', str(BASE_DIR / 'spool'))
+GPS_INGEST_SPOOL_SEGMENT_SIZE = int(os.getenv('GPS_INGEST_SPOOL_SEGMENT_SIZE', 16 * 1024 * 1024))  # bytes
+GPS_INGEST_SPOOL_MAX_AGE = float(os.getenv('GPS_INGEST_SPOOL_MAX_AGE', 60.0))  # seconds before a segment is closed
+GPS_INGEST_SPOOL_MAX_BYTES = int(os.getenv('GPS_INGEST_SPOOL_MAX_BYTES', 1024 * 1024 * 1024))
+# Retransmitted packets are dropped using an LRU of recent payloads; set the size to 0 to disable
+GPS_INGEST_DEDUP_SIZE = int(os.getenv('GPS_INGEST_DEDUP_SIZE', 100000))
+GPS_INGEST_DEDUP_WINDOW = float(os.getenv('GPS_INGEST_DEDUP_WINDOW', 600.0))  # seconds
+# Fleet-wide MQTT consumer (manage.py mqtt_consumer)
+GPS_MQTT_BROKER = os.getenv('GPS_MQTT_BROKER', 'localhost')
+GPS_MQTT_PORT = int(os.getenv('GPS_MQTT_PORT', 1883))
+GPS_MQTT_TOPICS = [topic.strip() for topic in os.getenv('GPS_MQTT_TOPICS', 'devices/+').split(',') if topic.strip()]
+GPS_MQTT_USERNAME = os.getenv('GPS_MQTT_USERNAME', '')
+GPS_MQTT_PASSWORD = os.getenv('GPS_MQTT_PASSWORD', '')
+# CommunicationService handler pool
+GPS_HANDLER_POOL_SIZE = int(os.getenv('GPS_HANDLER_POOL_SIZE', 1000))
+GPS_HANDLER_IDLE_TIMEOUT = float(os.getenv('GPS_HANDLER_IDLE_TIMEOUT', 300.0))  # seconds
+# Batch location upload endpoint
+GPS_LOCATION_BATCH_MAX_POINTS = int(os.getenv('GPS_LOCATION_BATCH_MAX_POINTS', 5000))
+GPS_LOCATION_BATCH_MAX_BYTES = int(os.getenv('GPS_LOCATION_BATCH_MAX_BYTES', 10 * 1024 * 1024))  # after gunzip
+# Write-behind last-position store; set the flush interval to 0 to write positions straight to the table
+GPS_POSITION_FLUSH_INTERVAL = float(os.getenv('GPS_POSITION_FLUSH_INTERVAL', 2.0))  # seconds
+GPS_POSITION_CACHE_TIMEOUT = int(os.getenv('GPS_POSITION_CACHE_TIMEOUT', 86400))  # seconds
+# Memory-mapped fleet position table shared by all processes on a host, e.g. /dev/shm/gps-fleet.bin; '' disables
+GPS_FLEET_TABLE_PATH = os.getenv('GPS_FLEET_TABLE_PATH', '')
+GPS_FLEET_TABLE_SLOTS = int(os.getenv('GPS_FLEET_TABLE_SLOTS', 65536))  # highest device id + 1
+# Default window for location history listings, keeps queries on the partitioned table to recent months
+GPS_LOCATION_HISTORY_DAYS = int(os.getenv('GPS_LOCATION_HISTORY_DAYS', 30))
+# Simplified tracks (?zoom= / ?tolerance= on the history endpoints) are cached per device-day
+GPS_TRACK_CACHE_TIMEOUT = int(os.getenv('GPS_TRACK_CACHE_TIMEOUT', 86400))  # seconds
+# Rows fetched per database round trip by the streaming GPX/GeoJSON/CSV exports
+GPS_EXPORT_CHUNK_SIZE = int(os.getenv('GPS_EXPORT_CHUNK_SIZE', 2000))
+# Days after which archive_location_history packs fixes into per device-day blocks
+GPS_ARCHIVE_AFTER_DAYS = int(os.getenv('GPS_ARCHIVE_AFTER_DAYS', 90))
+# Retention job (manage.py apply_retention) for devices and users without an active subscription
+GPS_RETENTION_DEFAULT_DAYS = int(os.getenv('GPS_RETENTION_DEFAULT_DAYS', 30))
+GPS_RETENTION_BATCH_SIZE = int(os.getenv('GPS_RETENTION_BATCH_SIZE', 1000))
+GPS_RETENTION_SLEEP = float(os.getenv('GPS_RETENTION_SLEEP', 0.1))  # seconds between delete chunks
+# Hourly/daily rollups, kept up to date by the ingest workers and manage.py update_location_rollups
+GPS_ROLLUP_BATCH_SIZE = int(os.getenv('GPS_ROLLUP_BATCH_SIZE', 5000))
+GPS_ROLLUP_LAG = float(os.getenv('GPS_ROLLUP_LAG', 5.0))  # seconds a fix must settle before it is folded, except on PostgreSQL
+# Trip and stop detection (manage.py segment_trips)
+GPS_TRIP_BATCH_SIZE = int(os.getenv('GPS_TRIP_BATCH_SIZE', 5000))
+GPS_TRIP_LAG = float(os.getenv('GPS_TRIP_LAG', 5.0))  # seconds after it is received before a fix is segmented
+GPS_TRIP_STOP_SPEED = float(os.getenv('GPS_TRIP_STOP_SPEED', 3.0))  # km/h at or below which a fix may start a stop
+GPS_TRIP_STOP_RADIUS = float(os.getenv('GPS_TRIP_STOP_RADIUS', 100.0))  # metres a stop may drift
+GPS_TRIP_STOP_SECONDS = int(os.getenv('GPS_TRIP_STOP_SECONDS', 300))  # dwell time that makes a stop
+GPS_TRIP_MAX_GAP = int(os.getenv('GPS_TRIP_MAX_GAP', 1800))  # seconds without fixes that end a trip
+GPS_TRIP_MIN_DISTANCE = float(os.getenv('GPS_TRIP_MIN_DISTANCE', 0.3))  # km, shorter trips are drift
+# 'queue' makes the single location update endpoint enqueue and answer 202 (see process_location_updates)
+GPS_LOCATION_INGEST_MODE = os.getenv('GPS_LOCATION_INGEST_MODE', 'sync')
+
 # Haystack search configuration
 HAYSTACK_CONNECTIONS = {
     'default': {
@@ -8,7 +8,11 @@ backlog = 2048
 
 # Worker processes
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+# Threaded workers: the master's timeout only watches the worker's main loop,
+# so a streamed history export (tracking/api/device/<id>/export/) can run for minutes
+# without being killed the way a sync worker is after `timeout` seconds
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
 worker_connections = 1000
 max_requests = 1000
 max_requests_jitter = 50
@@ -1,4 +1,6 @@
 from locust import HttpUser, task, between
+import os
+from datetime import datetime, timezone
 import random
 from decimal import Decimal
 
@@ -88,6 +90,52 @@ class APITester(HttpUser):
         self.client.get(f"/api/devices/{device_id}/tracking/")
 
 
+class DeviceLocationUser(HttpUser):
+    """
+    Posts location fixes for one device, as a tracker would.
+
+    Set LOCUST_DEVICE_ID, LOCUST_USERNAME and LOCUST_PASSWORD to a device and
+    its owner. Compare the p50/p99 of the two endpoints by running each class
+    on its own, e.g. ``locust -f locustfile.py DeviceLocationQueued``.
+    """
+    abstract = True
+    wait_time = between(0.1, 0.5)
+    endpoint = None
+
+    def on_start(self):
+        """Log in and keep the CSRF token for the POSTs"""
+        self.device_id = int(os.getenv('LOCUST_DEVICE_ID', 1))
+        self.client.get("/accounts/login/")
+        self.client.post("/accounts/login/", {
+            "username": os.getenv('LOCUST_USERNAME', 'admin'),
+            "password": os.getenv('LOCUST_PASSWORD', 'admin'),
+        }, headers={"X-CSRFToken": self.client.cookies.get('csrftoken', '')})
+        self.client.headers.update({"X-CSRFToken": self.client.cookies.get('csrftoken', '')})
+
+    @task
+    def post_location(self):
+        """Send one fix near Tehran"""
+        self.client.post(
+            self.endpoint.format(device_id=self.device_id),
+            json={
+                "latitude": round(35.6892 + random.uniform(-0.05, 0.05), 6),
+                "longitude": round(51.3890 + random.uniform(-0.05, 0.05), 6),
+                "speed": round(random.uniform(0, 120), 2),
+                "battery_level": random.randint(20, 100),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+            },
+            name=self.endpoint,
+        )
+
+
+class DeviceLocationSync(DeviceLocationUser):
+    endpoint = "/tracking/api/device/{device_id}/location/"
+
+
+class DeviceLocationQueued(DeviceLocationUser):
+    endpoint = "/tracking/api/device/{device_id}/location/queue/"
+
+
 # Performance test configuration
 # Run with: locust -f locustfile.py --host=http://127.0.0.1:8000
 # Or for headless: locust -f locustfile.py --host=http://127.0.0.1:8000 --no-web -c 100 -r 10 --run-time 1m
\ No newline at end of file